@@ -1,14 +1,15 @@
 import regex
 
-def generate_toc(markdown_text: str) -> str:
+def generate_toc(events: list[dict]) -> str:
   """
-  Generate a Table of Contents from the markdown output.
+  Generate a Table of Contents from the heading events scad-analysis.py
+  emitted with --md-events.
 
-  Parses H2 (file), H3 (chapter), and H4 (item) headings and builds
-  a hierarchical structure with collapsible file and chapter sections.
+  H2 (file), H3 (chapter), and H4 (item) headings are built into a
+  hierarchical structure with collapsible file and chapter sections.
   Uses blockquotes for indentation to ensure proper nesting.
   """
-  lines = markdown_text.split('\n')
+  headings = [e for e in events if e["kind"] == "heading"]
   toc_output: list[str] = []
   current_items: list[str] = []
   in_file = False
@@ -18,22 +19,6 @@ def generate_toc(markdown_text: str) -> str:
     """Create an HTML link."""
     return f'<a href="#{anchor}">{text}</a>'
 
-  def heading_to_anchor(heading: str) -> str:
-    """Convert a markdown heading to a GitHub-style anchor."""
-    # Remove markdown formatting
-    anchor = regex.sub(r"\*\*(.+?)\*\*", r"\1", heading)  # bold
-    anchor = regex.sub(r"\*(.+?)\*", r"\1", anchor)  # italic
-    anchor = regex.sub(r"`(.+?)`", r"\1", anchor)  # code
-    # Convert to lowercase
-    anchor = anchor.lower()
-    # Replace " : " with "--" (GitHub convention for colon with spaces)
-    anchor = anchor.replace(" : ", "--")
-    # Remove special chars except spaces and hyphens
-    anchor = regex.sub(r"[^\w\s-]", "", anchor)
-    # Replace spaces with hyphens
-    anchor = regex.sub(r"\s+", "-", anchor.strip())
-    return anchor
-
   def flush_items():
     """Flush accumulated items with bullet characters."""
     nonlocal current_items
@@ -62,86 +47,137 @@ def generate_toc(markdown_text: str) -> str:
       toc_output.append("")
       in_file = False
 
-  # First pass: collect chapters and their items to know which have children
-  chapter_has_items: dict[str, bool] = {}
+  # First pass: find the chapters that have items
+  chapter_has_items: set[str] = set()
   current_chapter_anchor = None
-  for line in lines:
-    if line.startswith("### "):
-      anchor_match = regex.search(r"<a id='([^']+)'></a>", line)
-      if anchor_match:
-        current_chapter_anchor = anchor_match.group(1)
-        chapter_has_items[current_chapter_anchor] = False
-    elif line.startswith("#### ") and current_chapter_anchor:
-      # Count all H4 headings as items (with or without anchors)
-      chapter_has_items[current_chapter_anchor] = True
-    elif line.startswith("## "):
+  for heading in headings:
+    if heading["level"] == 3:
+      current_chapter_anchor = heading["anchor"]
+    elif heading["level"] == 4 and current_chapter_anchor:
+      chapter_has_items.add(current_chapter_anchor)
+    elif heading["level"] == 2:
       current_chapter_anchor = None
 
   # Second pass: generate the TOC
-  for line in lines:
-    # H2: File heading (## <span...>📘filename</span><a id='file-filename'></a>)
-    if line.startswith("## "):
+  for heading in headings:
+    anchor = heading["anchor"]
+    if heading["level"] == 2:
       close_file()
-      # Extract filename from the anchor
-      anchor_match = regex.search(r"<a id='file-([^']+)'></a>", line)
-      if anchor_match:
-        current_file = anchor_match.group(1)
-        anchor = f"file-{current_file}"
-        link = make_link(f"📘 <b>{current_file}</b>", anchor)
-        toc_output.append(f"<details><summary>{link}</summary>")
-        toc_output.append("<blockquote>")
-        in_file = True
+      link = make_link(f"📘 <b>{heading['text']}</b>", anchor)
+      toc_output.append(f"<details><summary>{link}</summary>")
+      toc_output.append("<blockquote>")
+      in_file = True
 
-    # H3: Chapter heading (### <i>📑chapter</i><a id='file-ch-chapter'></a>)
-    elif line.startswith("### "):
+    elif heading["level"] == 3:
       close_chapter()
-      # Extract chapter from the anchor
-      anchor_match = regex.search(r"<a id='([^']+)'></a>", line)
-      if anchor_match:
-        anchor = anchor_match.group(1)
-        # Extract chapter text from <i>📑chapter</i>
-        text_match = regex.search(r"📑([^<]+)</i>", line)
-        if text_match:
-          chapter_text = text_match.group(1)
-          link = make_link(f"📑 <i>{chapter_text}</i>", anchor)
-          if chapter_has_items.get(anchor, False):
-            toc_output.append(f"<details><summary>{link}</summary>")
-            in_chapter = True
-          else:
-            toc_output.append(f"• {link}<br>")
-
-    # H4: Item heading (#### emoji_text<a id='prefix-id'></a>) or plain H4
-    elif line.startswith("#### "):
-      # Extract anchor if present
-      anchor_match = regex.search(r"<a id='([^']+)'></a>", line)
-      if anchor_match:
-        anchor = anchor_match.group(1)
-        # Extract display text (emoji + name) - between "#### " and "<a"
-        text_match = regex.search(r"^#### (.+?)<a id=", line)
-        if text_match:
-          display_text = text_match.group(1).strip()
-          # Unescape underscores for display
-          display_text = display_text.replace("\\_", "_")
-          current_items.append(make_link(display_text, anchor))
+      link = make_link(f"📑 <i>{heading['text']}</i>", anchor)
+      if anchor in chapter_has_items:
+        toc_output.append(f"<details><summary>{link}</summary>")
+        in_chapter = True
       else:
-        # H4 without anchor - generate GitHub-style anchor from heading text
-        text_match = regex.search(r"^#### (.+)$", line)
-        if text_match:
-          raw_text = text_match.group(1).strip()
-          # Generate anchor from heading text
-          anchor = heading_to_anchor(raw_text)
-          # Clean up display text (remove markdown bold markers)
-          display_text = regex.sub(r"\*\*(.+?)\*\*", r"\1", raw_text)
-          current_items.append(make_link(display_text, anchor))
+        toc_output.append(f"• {link}<br>")
+
+    else:
+      current_items.append(make_link(heading["text"], anchor))
 
   # Close last file section
   close_file()
 
   return "\n".join(toc_output) + "\n" if toc_output else ""
 
+RE_ANCHOR_ID = regex.compile(r"<a id='([^']++)'></a>")
+RE_HEADING = regex.compile(r"^\#++ (.++)$", regex.MULTILINE)
+RE_LOCAL_LINK = regex.compile(r"""(\]\(|href=")\#([^)"\s]++)""")
+
+def split_pages(markdown_text: str, events: list[dict]) -> tuple[dict[str, str], str]:
+  """
+  Split the markdown output into one page per library file and the types
+  chapters of all of them, where the heading events say they start.
+
+  Returns the pages by file name and the types page's content.
+  """
+  pages: dict[str, str] = {}
+  types: list[str] = []
+  starts = [ e for e in events if e["kind"] == "heading" and e["level"] == 2 ]
+  types_starts = { e["file"]: e["offset"] for e in events
+                   if e["kind"] == "heading" and e["level"] == 3 and e["text"] == f"{e['file']} types" }
+  for i, event in enumerate(starts):
+    end = starts[i + 1]["offset"] if i + 1 < len(starts) else len(markdown_text)
+    # The types chapter is always last in a file's section.
+    types_start = types_starts.get(event["file"], end)
+    types.append(markdown_text[types_start:end])
+    # A file's heading starts with the rule that separates it from the previous file.
+    pages[event["text"]] = markdown_text[event["offset"]:types_start].removeprefix("<hr/>\n\n")
+  return pages, "# Types\n\n" + "".join(types)
+
+def event_anchors(events: list[dict]) -> dict[str, set[str]]:
+  """
+  The anchors that each page of split_pages() defines, from the heading events.
+  """
+  anchors: dict[str, set[str]] = { "all-types": set() }
+  page = None
+  for event in events:
+    if event["kind"] != "heading":
+      continue
+    if event["level"] == 2:
+      page = event["text"]
+    elif event["level"] == 3 and event["text"] == f"{event['file']} types":
+      page = "all-types"
+    assert page is not None, "headings come after their file's heading"
+    anchors.setdefault(page, set()).add(event["anchor"])
+  return anchors
+
+def undefined_links(events: list[dict], defined: set[str]) -> list[tuple[str, str]]:
+  """
+  The (file, anchor) of link events to anchors that are defined nowhere.
+  """
+  undefined: list[tuple[str, str]] = []
+  for event in events:
+    if event["kind"] != "link":
+      continue
+    anchor = event["anchor"]
+    # Anchor ids have capitals replaced like GitHub does, but html links keep them.
+    if anchor in defined or regex.sub(r"[A-Z]", lambda c: "_" + c[0].lower(), anchor) in defined:
+      continue
+    if (event["file"], anchor) not in undefined:
+      undefined.append((event["file"], anchor))
+  return undefined
+
+def page_anchors(page: str) -> set[str]:
+  """Anchors that a page defines, explicitly or as GitHub heading anchors."""
+  anchors = set(RE_ANCHOR_ID.findall(page))
+  for m in RE_HEADING.finditer(page):
+    if "<a id=" not in m[1]:
+      anchors.add(github_heading_anchor(m[1]))
+  return anchors
+
+def link_pages(pages: dict[str, str], anchors: dict[str, set[str]]) -> dict[str, str]:
+  """
+  Rewrite links to anchors on other pages, such as `#t-<Type>`, to point at
+  `<page>.md#anchor`.  Links to anchors that no page defines are left alone.
+  """
+  owner: dict[str, str] = {}
+  for name, page_anchor_set in anchors.items():
+    for anchor in page_anchor_set:
+      owner.setdefault(anchor, name)
+
+  def linker(name: str):
+    def replace(m: regex.Match) -> str:
+      anchor = m[2]
+      if anchor in anchors[name]:
+        return m[0]
+      if anchor not in owner:
+        # Anchor ids have capitals replaced like GitHub does, but html links
+        # keep them.
+        anchor = regex.sub(r"[A-Z]", lambda c: "_" + c[0].lower(), anchor)
+        if anchor in anchors[name] or anchor not in owner:
+          return m[0]
+      return f"{m[1]}{owner[anchor]}.md#{anchor}"
+    return replace
+
+  return { name: RE_LOCAL_LINK.sub(linker(name), page) for name, page in pages.items() }
+
 header = "README-header.md"
-with open(header, "r", encoding="utf-8") as in_f:
-  contents = in_f.read()
 
 re_file_section = regex.compile(
   r'''
@@ -150,9 +186,6 @@ re_file_section = regex.compile(
   ((?:(?!\#).*+(?:\n|$))*+)
   ''', regex.MULTILINE | regex.VERBOSE
 )
-matched = re_file_section.search(contents)
-assert matched
-file_section = matched[1]
 
 re_file_items = regex.compile(
   r'''
@@ -160,45 +193,183 @@ re_file_items = regex.compile(
   (?:(?!\s*+\d++\.\s).*+(?:\n|$))*+
   ''', regex.VERBOSE
 )
-file_items = re_file_items.sub(r"\1 ", file_section)
 
 re_files = regex.compile(
   r'''
   (?:.|\n)*?\[([a-zA-Z_][a-zA-Z0-9_]*?)\]
   ''', regex.VERBOSE
 )
-files = re_files.sub(r"\1 ", file_items)
-files_list = files.rstrip().split(" ")
 
+def read_header() -> tuple[str, list[str]]:
+  """
+  Read README-header.md.
+
+  Returns its contents and the library files its synopses list, in order.
+  """
+  with open(header, "r", encoding="utf-8") as in_f:
+    contents = in_f.read()
+  matched = re_file_section.search(contents)
+  assert matched
+  file_items = re_file_items.sub(r"\1 ", matched[1])
+  files = re_files.sub(r"\1 ", file_items)
+  return contents, files.rstrip().split(" ")
+
+def write_docs(contents: str, markdown_text: str, events: list[dict]):
+  """
+  Write README.md, or the --split pages, from the header and the markdown and
+  events that scad-analysis.py rendered.
+  """
+  # Generate TOC from the headings scad-analysis.py rendered
+  toc = generate_toc(events)
+  defined = page_anchors(contents + toc) | { e["anchor"] for e in events if e["kind"] == "heading" }
+  for filename, anchor in undefined_links(events, defined):
+    print(f"WARNING: {filename}: link to undefined anchor #{anchor}")
+
+  if cmd_args.split:
+    pages, types_page = split_pages(markdown_text, events)
+    # Library files are named like identifiers, so all-types can't be one of them.
+    assert "index" not in pages
+    pages = { "index": contents + toc, "all-types": types_page, **pages }
+    anchors = { "index": page_anchors(pages["index"]), **event_anchors(events) }
+    pages = link_pages(pages, anchors)
+    os.makedirs(cmd_args.split, exist_ok=True)
+    written = sum(write_if_changed(os.path.join(cmd_args.split, f"{name}.md"), page)
+                  for name, page in pages.items())
+    print(f"Wrote {written} of {len(pages)} pages to {cmd_args.split}")
+  else:
+    write_if_changed("README.md", contents + toc + markdown_text)
+
+def file_stamp(path: str) -> tuple[int, int] | None:
+  try:
+    st = os.stat(path)
+  except OSError:
+    return None
+  return st.st_mtime_ns, st.st_size
+
+def watch_docs(interval: float):
+  """
+  Keep scad-analysis.py running with --watch and rewrite the docs whenever its
+  output or README-header.md changes.  scad-analysis.py is restarted when the
+  header lists other files.  Runs until interrupted.
+  """
+  with tempfile.TemporaryDirectory() as watch_dir:
+    md_file = os.path.join(watch_dir, "docs.md")
+    events_file = os.path.join(watch_dir, "md-events.json")
+    analysis = None
+    files_list: list[str] = []
+    built = None
+    try:
+      while True:
+        contents, header_files = read_header()
+        if header_files != files_list:
+          if analysis:
+            analysis.terminate()
+            analysis.wait()
+          files_list = header_files
+          for path in (md_file, events_file):
+            if os.path.exists(path):
+              os.remove(path)
+          args = [
+            sys.executable,
+            "-Xfrozen_modules=off",
+            "scad-analysis.py",
+            "--watch",
+            "--show", "md-with-private",
+            "--md-events", events_file,
+            "--write-to-file", md_file,
+            *files_list
+          ]
+          print("Executing: " + " ".join(args))
+          # Its messages go straight to our stderr.
+          analysis = subprocess.Popen(args)
+
+        # The outputs are written one after the other, so wait for both to
+        # settle.
+        stamps = (file_stamp(header), file_stamp(md_file), file_stamp(events_file))
+        time.sleep(interval)
+        if analysis.poll() is not None:
+          print(f"ERROR: scad-analysis.py exited with code {analysis.returncode}")
+          return
+        if stamps != (file_stamp(header), file_stamp(md_file), file_stamp(events_file)) \
+            or stamps == built or None in stamps:
+          continue
+        built = stamps
+        with open(md_file, "r", encoding="utf-8") as f_in:
+          markdown_text = f_in.read()
+        with open(events_file, "r", encoding="utf-8") as f_in:
+          events = json.load(f_in)
+        write_docs(contents, markdown_text, events)
+        print(f"Rebuilt {cmd_args.split or 'README.md'} at {time.strftime('%H:%M:%S')}")
+    except KeyboardInterrupt:
+      pass
+    finally:
+      if analysis:
+        analysis.terminate()
+        analysis.wait()
+
+import argparse
+import json
+import os
 import subprocess
 import sys
+import tempfile
+import time
+
+from scad_tools.files import write_if_changed
+from scad_tools.markdown import github_heading_anchor
 
-args = [
-  sys.executable,
-  "-Xfrozen_modules=off",
-  "scad-analysis.py",
-  "--show", "md-with-private",
-  # "--write-to-file", "README.md",
-  *files_list
-]
-
-print("Executing: " + " ".join(args))
-result = subprocess.run(args, check=False, capture_output=True, text=True,
-                         encoding="utf-8",
-                         errors="strict"  # or "replace" if you want it to never crash
+parser = argparse.ArgumentParser(description="Build README.md from README-header.md and the library's docs.")
+parser.add_argument(
+  "--split",
+  metavar="DIR",
+  help="Instead of README.md, write one page per library file, all-types.md and index.md to DIR.",
+)
+parser.add_argument(
+  "--watch",
+  action="store_true",
+  help="Stay running and rebuild whenever README-header.md or a library file changes.",
+)
+parser.add_argument(
+  "--watch-interval",
+  metavar="SECONDS",
+  type=float,
+  default=0.2,
+  help="How often --watch polls for changes (default: %(default)s).",
 )
+cmd_args = parser.parse_args()
+
+if cmd_args.watch:
+  watch_docs(cmd_args.watch_interval)
+  sys.exit(0)
+
+contents, files_list = read_header()
+
+with tempfile.TemporaryDirectory() as events_dir:
+  events_file = os.path.join(events_dir, "md-events.json")
+  args = [
+    sys.executable,
+    "-Xfrozen_modules=off",
+    "scad-analysis.py",
+    "--show", "md-with-private",
+    "--md-events", events_file,
+    # "--write-to-file", "README.md",
+    *files_list
+  ]
+
+  print("Executing: " + " ".join(args))
+  result = subprocess.run(args, check=False, capture_output=True, text=True,
+                           encoding="utf-8",
+                           errors="strict"  # or "replace" if you want it to never crash
+  )
+  events: list[dict] = []
+  if result.returncode == 0:
+    with open(events_file, "r", encoding="utf-8") as f_in:
+      events = json.load(f_in)
+
 if result.stderr:
   print(f"STDERR:\n" + result.stderr)
 
 if result.returncode != 0:
   print(f"ERROR: scad-analysis.py exited with code {result.returncode}")
 else:
-  # Generate TOC from the scad-analysis.py output
-  toc = generate_toc(result.stdout)
-
-  with open("README.md", "w", encoding="utf-8") as f_out:
-    f_out.write(contents)
-    if toc:
-      f_out.write(toc)
-      # f_out.write("\n")
-    f_out.write(result.stdout)
+  write_docs(contents, result.stdout, events)
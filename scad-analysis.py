@@ -4,7 +4,13 @@ import json
 import hashlib
 from datetime import datetime, timezone
 import os
-from bisect import bisect_left, bisect_right
+from bisect import bisect_right
+from itertools import accumulate
+from array import array
+from contextlib import contextmanager, nullcontext
+import time
+import tracemalloc
+import builtins
 from typing import Literal, TypeAlias, TypedDict, TypeGuard, Optional
 import typing
 
@@ -72,11 +78,14 @@ RES_LIB = r'''
   (?# Double quoted string literal)
   (?<quote>"(?:[^\\"]++|\\.)*+")
 
+  (?# Comment in code, so that brackets, quotes and [;] in it are skipped)
+  (?<code_comment>//[^\n]*+|/\*(?:[^*]|\*(?!/))*+\*/)
+
   (?# Characters till unmatched opening or closing of parenthesis, brace or bracket or end of string)
-  (?<chars_mtws>(?:[^{}()[\]"]++|\{(?&chars_mtws)\}|\((?&chars_mtws)\)|\[(?&chars_mtws)\]|(?&quote))*+)
+  (?<chars_mtws>(?:[^{}()[\]"/]++|/(?![/*])|(?&code_comment)|\{(?&chars_mtws)\}|\((?&chars_mtws)\)|\[(?&chars_mtws)\]|(?&quote))*+)
 
   (?# Characters till [;] or unmatched opening or closing of parenthesis, brace or bracket or end of string)
-  (?<cmd_chars_mtws>(?:[^;{}()[\]"]++|\{(?&chars_mtws)\}|\((?&chars_mtws)\)|\[(?&chars_mtws)\]|(?&quote))*+)
+  (?<cmd_chars_mtws>(?:[^;{}()[\]"/]++|/(?![/*])|(?&code_comment)|\{(?&chars_mtws)\}|\((?&chars_mtws)\)|\[(?&chars_mtws)\]|(?&quote))*+)
 
   (?# Characters till [:] or unmatched opening or closing of parenthesis, brace or bracket or end of string)
   (?<ret_chars_mtws>(?:[^:{}()[\]"]++|\{(?&chars_mtws)\}|\((?&chars_mtws)\)|\[(?&chars_mtws)\]|(?&quote))*+)
@@ -95,7 +104,7 @@ RES_LIB = r'''
   (?# block comment /*...*/)
   (?<block_comment> /\*       (?: \*/ | (?! \* ) (?: [^*] | \*[^/] )*+ \*/ ))
   (?# one or more line comments //...)
-  (?<line_comment> (?:\s*+//.*+\n)++ )
+  (?<line_comment> (?:\s*+//.*+(?:\n|\Z))++ )
   (?# either block or line comment)
   (?<comment>(?&block_comment)|(?&line_comment))
 
@@ -145,6 +154,19 @@ RES_LIB = r'''
   (?<module>(?&module_sig) \s*+ \{ (?<body>(?&chars_mtws)) \})
 '''
 
+def _lib_without(lib: str, old: str, new: str) -> str:
+  assert old in lib, f"RES_LIB no longer has {old!r}"
+  return lib.replace(old, new)
+
+RES_LIB_LISTING = _lib_without(_lib_without(RES_LIB,
+  r"\((?&param_mtws)*+\)", r"\((?&chars_mtws)\)"),
+  r"(?<is_lambda> function \s*+ \( (?&param_mtws)*+ \) )?+", "")
+"""
+RES_LIB for listings.  Parameter lists are skipped as balanced text rather
+than matched and captured parameter by parameter, which is what most of a
+symbol's matching costs besides its body.
+"""
+
 def mtime_to_utc(mtime: float) -> str:
   """
   Converts a modification time to a UTC datetime string.
@@ -190,7 +212,213 @@ def get_line_positions(content: str) -> list[int]:
 
   return positions
 
-def get_items(content: str) -> list[ItemInfo]:
+RE_ITEM_BOUNDARY = regex.compile(
+  r'''
+    ^(?=
+        /\*
+      | //
+      | use \s*+ <
+      | include \s*+ <
+      | function \s
+      | module \s
+      | [a-zA-Z_][a-zA-Z_\d]*+ \s*+ =(?!=)
+    )
+  ''', regex.MULTILINE | regex.VERBOSE
+)
+"""
+Start of a line that plausibly begins a top level item.  Used to resync after
+a top level item fails to parse in guarded mode.
+"""
+
+RE_WS = regex.compile(r"\s*+")
+
+RES_LITERAL_LIST = r'''
+  \s*+ \[ [0-9\ \t\n\r\f\v,\[\]+\-.eE]*+
+'''
+"""
+Characters of numbers, commas and brackets, starting with a bracket.  Neither
+the numbers nor the balance of the brackets are checked.
+"""
+
+RE_LITERAL_VALUE = regex.compile(
+  r'''
+    \G\s*+
+    (?<id> [a-zA-Z_]\w*+ ) \s*+ =
+    (?<body>''' + RES_LITERAL_LIST + r''')
+    ;
+  ''', regex.VERBOSE
+)
+"A value whose body is a literal list."
+
+RE_LITERAL_LIST = regex.compile(RES_LITERAL_LIST, regex.VERBOSE)
+RE_LITERAL_TOKEN = regex.compile(r"[\[\]]|[^\[\],\s]++")
+LITERAL_NOT_BRACKETS = str.maketrans("", "", "0123456789 \t\n\r\f\v,+-.eE")
+BRACKET_STEPS = bytes.maketrans(b"[]", b"\x01\xff")
+"[ and ] as 1 and -1 signed bytes"
+RE_WORD_GAP = regex.compile(r"(?<=\w)\s++(?=\w)")
+RE_SPACES = regex.compile(r"\s++")
+
+LITERAL_DATA_MIN_CHARS = 4096
+"""
+Literal list bodies at least this long skip the item regex and are summarized
+rather than embedded in docs and json.
+"""
+
+def literal_list_balanced(content: str, start: int, stop: int) -> bool:
+  """
+  If a RES_LITERAL_LIST match ends with the bracket closing its first one.
+  The brackets are taken out of the text and summed without a Python loop.
+  """
+  text = content[start:stop]
+  steps = array("b", text.translate(LITERAL_NOT_BRACKETS).encode("ascii").translate(BRACKET_STEPS))
+  return text.rstrip().endswith("]") and sum(steps) == 0 \
+    and (len(steps) < 3 or min(accumulate(steps[:-1])) > 0)
+
+def literal_value_match(content: str, pos: int) -> Optional[regex.Match[str]]:
+  """
+  Matches a value at pos whose body is a literal list of at least
+  LITERAL_DATA_MIN_CHARS, like a table of polyhedron points.  The item regex
+  would step through every bracket of such a body with its expression
+  patterns, while this scans its characters flat and then balances the
+  brackets.  Malformed numbers are only caught by literal_summary().
+
+  Returns
+  -------
+  Optional[regex.Match[str]]
+      The match, with `id` and `body` groups, or None to use the item regex.
+  """
+  m = RE_LITERAL_VALUE.match(content, pos)
+  if m and m.end("body") - m.start("body") >= LITERAL_DATA_MIN_CHARS \
+      and literal_list_balanced(content, m.start("body"), m.end("body")):
+    return m
+  return None
+
+class LiteralSummary(TypedDict):
+  elements: int
+  "at the top level"
+  numbers : int
+  "at any level"
+  depth   : int
+  "how deep lists nest"
+
+def literal_summary(content: str, body: CharSlice) -> Optional[LiteralSummary]:
+  """
+  What a value's body holds if it's a literal list of at least
+  LITERAL_DATA_MIN_CHARS, which docs and json summarize rather than embed.
+  """
+  if body.stop - body.start < LITERAL_DATA_MIN_CHARS \
+      or not RE_LITERAL_LIST.fullmatch(content, body.start, body.stop) \
+      or not literal_list_balanced(content, body.start, body.stop):
+    return None
+  summary: LiteralSummary = { "elements": 0, "numbers": 0, "depth": 0 }
+  depth = 0
+  for token in RE_LITERAL_TOKEN.findall(content, body.start, body.stop):
+    if token == "[":
+      if depth == 1:
+        summary["elements"] += 1
+      depth += 1
+      summary["depth"] = max(summary["depth"], depth)
+    elif token == "]":
+      depth -= 1
+    else:
+      try:
+        float(token)
+      except ValueError:
+        return None
+      summary["numbers"] += 1
+      if depth == 1:
+        summary["elements"] += 1
+  return summary
+
+def format_literal_summary(summary: LiteralSummary) -> str:
+  return f"literal list of {summary['elements']:,} elements, {summary['numbers']:,} numbers, " \
+    f"nested {summary['depth']} deep"
+
+def normalize_literal(body: str) -> str:
+  "normalize_code() of a literal list body, without stepping through its tokens."
+  return RE_SPACES.sub("", RE_WORD_GAP.sub("\0", body)).replace("\0", " ")
+
+
+def guarded_item_matches(RE: regex.Pattern[str], content: str, timeout: float,
+    filename: Optional[str]) -> typing.Iterator[regex.Match[str] | CharSlice]:
+  '''
+  Matches top level items one at a time, each with its own regex timeout.
+
+  If an item times out or doesn't match, then a cheap scan skips to the next
+  plausible item boundary and the skipped region is yielded as a slice
+  instead of a match.  Whatever parses without a guard parses the same way
+  with one.
+
+  Parameters
+  ----------
+  RE: regex.Pattern[str]
+    The item regex.  Must be anchored with \\G.
+  content: str
+    The content to process.
+  timeout: float
+    Seconds allowed to match a single top level item.
+  filename: Optional[str]
+    Used to report skipped regions to stderr.  None to not report.
+
+  Returns
+  -------
+  Iterator[regex.Match[str] | CharSlice]
+    Matched items or skipped regions in the order that they appear.
+  '''
+  pos = 0
+  end = len(content)
+  while pos < end:
+    literal = literal_value_match(content, pos)
+    if literal:
+      yield literal
+      pos = literal.end()
+      continue
+
+    reason = "didn't parse"
+    try:
+      m = RE.match(content, pos, timeout=timeout)
+    except TimeoutError:
+      m = None
+      reason = f"timed out after {timeout}s"
+
+    if m:
+      yield m
+      pos = m.end()
+      continue
+
+    # Skip leading whitespace so that the location reported is the item's.
+    start = RE_WS.match(content, pos).end() # pyright: ignore[reportOptionalMemberAccess]
+    if start == end:
+      return
+
+    boundary = RE_ITEM_BOUNDARY.search(content, start + 1)
+    stop = boundary.start() if boundary else end
+
+    if filename is not None:
+      start_line = content.count("\n", 0, start) + 1
+      stop_line  = start_line + content.count("\n", start, stop)
+      print(f"WARNING: {filename}:{start_line}: Top level item {reason}. "
+        f"Skipped to line {stop_line}.", file=sys.stderr)
+
+    yield slice(start, stop)
+    pos = stop
+
+def item_matches(RE: regex.Pattern[str], content: str) -> typing.Iterator[regex.Match[str]]:
+  """
+  Matches top level items one after another until one doesn't match, like
+  RE.finditer() with RE anchored with \\G, but values with large literal list
+  bodies are matched by literal_value_match().
+  """
+  pos = 0
+  while True:
+    m = literal_value_match(content, pos) or RE.match(content, pos)
+    if not m:
+      return
+    yield m
+    pos = m.end()
+
+def get_items(content: str, timeout: Optional[float] = None,
+    filename: Optional[str] = None, listing: bool = False) -> list[ItemInfo]:
   '''
   Gets a list of item info found in the content.
 
@@ -198,6 +426,16 @@ def get_items(content: str) -> list[ItemInfo]:
   ----------
   content: str
     The content to process.
+  timeout: Optional[float]
+    If set, parse in guarded mode where each top level item gets this many
+    seconds to match.  Regions that can't be parsed are recorded as "UNKNOWN"
+    items rather than ending the parse.
+  filename: Optional[str]
+    Name used when reporting skipped regions in guarded mode.
+  listing: bool
+    Only scan for what listings of ids, signatures and line ranges need.
+    Symbols get no parameter list and docs stay separate items rather than
+    being attached to the symbol that follows them.
 
   Returns
   -------
@@ -221,12 +459,30 @@ def get_items(content: str) -> list[ItemInfo]:
         | (?<is_cmd>      (?&cmd))
       ) \s*+
     '''
-    '|' + RES_LIB
+    '|' + (RES_LIB_LISTING if listing else RES_LIB)
     , regex.VERBOSE)
 
   items: list[ItemInfo] = []
 
-  for m in RE_ITEM.finditer(content):
+  matches: typing.Iterable[regex.Match[str] | CharSlice]
+  if timeout is None:
+    matches = item_matches(RE_ITEM, content)
+  else:
+    matches = guarded_item_matches(RE_ITEM, content, timeout, filename)
+
+  for m in matches:
+    if isinstance(m, slice):
+      items.append(("UNKNOWN", m))
+      continue
+
+    if m.re is RE_LITERAL_VALUE:
+      slc, id_slc, body_slc = slice(m.start("id"), m.end()), slice(*m.span("id")), slice(*m.span("body"))
+      if not listing and items and items[-1][DOC_TYPE] == "doc":
+        items.append(("value", slc, id_slc, id_slc, None, body_slc, items.pop()[DOC_SLC]))
+      else:
+        items.append(("value", slc, id_slc, id_slc, None, body_slc))
+      continue
+
     slc = slice(*m.span(1))
 
     found = \
@@ -245,7 +501,9 @@ def get_items(content: str) -> list[ItemInfo]:
     if found in NONTYPE_SYMBOLS:
       # m = RE_BREAKDOWN.match(content, slc.start, slc.stop)
       # assert m
-      if items and items[-1][DOC_TYPE] == "doc":
+      if listing:
+        result = (found, slc, slice(*m.spans('id')[0]), slice(*m.spans('sig')[0]), None, slice(*m.spans('body')[0]))
+      elif items and items[-1][DOC_TYPE] == "doc":
         last = items.pop()
         result = (found, slc, slice(*m.spans('id')[0]), slice(*m.spans('sig')[0]), params_as_list(m), slice(*m.spans('body')[0]), last[DOC_SLC])
       else:
@@ -256,6 +514,19 @@ def get_items(content: str) -> list[ItemInfo]:
 
   return items
 
+def unparsed_at(content: str, items: list[ItemInfo]) -> Optional[int]:
+  """
+  Where parsing stopped short of the end of content, or None if get_items()
+  parsed all of it.  Unguarded, get_items() stops at the first top level item
+  that doesn't match, so anything that runs the items has to check this
+  rather than act on a prefix of the file.
+  """
+  for item in items:
+    if item[DOC_TYPE] == "UNKNOWN":
+      return item[DOC_SLC].start
+  stop = RE_WS.match(content, max((item[DOC_SLC].stop for item in items), default=0)).end() # pyright: ignore[reportOptionalMemberAccess]
+  return stop if stop < len(content) else None
+
 def params_as_list(m: regex.Match[str]) -> list[tuple[str, str]] | None:
   """ Convert parameters matched in regex to list of names with defaults
 
@@ -300,14 +571,313 @@ def get_lines(charRange: CharSlice, lines: list[int]) -> LinePair:
   start = charRange.start
   stop  = charRange.stop
   return (
-    bisect_left(lines, start)+1, bisect_right(lines, stop-1)
+    bisect_right(lines, start), bisect_right(lines, stop-1)
   )
 
+def deep_sizeof(obj: object, seen: set[int]) -> int:
+  """
+  Bytes used by obj and the containers, strings and slices it references.
+
+  Only tuples, lists, dicts, sets and slices are followed, so referenced class
+  instances (such as a Doc) are not counted.
+
+  Parameters
+  ----------
+  obj : object
+      Object to measure.
+  seen : set[int]
+      Ids of objects already counted.  These are skipped and this is updated
+      with the objects counted.
+
+  Returns
+  -------
+  int
+      Number of bytes.
+  """
+  total = 0
+  stack = [obj]
+  while stack:
+    o = stack.pop()
+    # builtins.id as the main loop shadows id at module level
+    if builtins.id(o) in seen:
+      continue
+    seen.add(builtins.id(o))
+    total += sys.getsizeof(o)
+    if isinstance(o, dict):
+      stack.extend(o.keys())
+      stack.extend(o.values())
+    elif isinstance(o, (tuple, list, set, frozenset)):
+      stack.extend(o)
+    elif isinstance(o, slice):
+      stack += [o.start, o.stop, o.step]
+  return total
+
+class Profiler:
+  """
+  Records wall and CPU time spent in each processing phase, file and symbol
+  and optionally, memory allocated in each phase and held by each major
+  structure.
+
+  Phase times are exclusive, so time spent in a nested phase is only counted
+  against the nested phase.  File and symbol times are inclusive.  When not
+  enabled, all of the recording methods return a shared no-op context.
+
+  Memory is traced with tracemalloc.  A call's net bytes are what it left
+  allocated, exclusive of nested phases, while its peak is the highest traced
+  usage above the usage at the start of the call, including nested phases.
+  Per phase, the net bytes of all calls are summed, and the largest net and
+  peak of a single call are kept, which are the ones comparable to each other.
+  """
+  NULL = nullcontext()
+
+  def __init__(self, enabled: bool, memory: bool = False) -> None:
+    self.timing  = enabled
+    self.memory  = memory
+    self.enabled = enabled or memory
+    self.start_wall = time.perf_counter()
+    self.start_cpu  = time.process_time()
+    self.phases: dict[str, list[float]] = {}
+    "phase name -> [wall, cpu, calls]"
+    self.files: dict[str, list[float]] = {}
+    "filename -> [wall, cpu, calls]"
+    self.symbols: dict[str, list[float]] = {}
+    "filename::symbol -> [wall, cpu, calls]"
+    self._child_times: list[list[float]] = []
+    "Stack of [wall, cpu] spent in nested phases of each active phase."
+
+    self.mem_phases: dict[str, list[int]] = {}
+    "phase name -> [total net bytes, max net bytes, max peak bytes, calls]"
+    self.structures: dict[str, int] = {}
+    "structure name -> bytes"
+    self.symbol_count = 0
+    "Number of symbols processed"
+    self._mem_frames: list[list[int]] = []
+    "Stack of [bytes at start, peak of nested phases, net of nested phases]."
+    if memory:
+      tracemalloc.start()
+
+  def phase(self, name: str) -> typing.ContextManager:
+    return self._phase(name) if self.enabled else Profiler.NULL
+
+  def file(self, filename: str) -> typing.ContextManager:
+    return self._span(self.files, filename) if self.timing else Profiler.NULL
+
+  def symbol(self, filename: str, id: str) -> typing.ContextManager:
+    return self._span(self.symbols, f"{filename}::{id}") if self.timing else Profiler.NULL
+
+  def record(self, structure: str, obj: object, seen: Optional[set[int]] = None):
+    """
+    Adds the deep size of obj to the bytes attributed to structure.
+
+    Parameters
+    ----------
+    structure : str
+        Name of the structure being measured.
+    obj : object
+        The structure.
+    seen : Optional[set[int]]
+        Shared set of already counted objects, so that objects shared between
+        records are only counted once.
+    """
+    if self.memory:
+      size = deep_sizeof(obj, set() if seen is None else seen)
+      self.structures[structure] = self.structures.get(structure, 0) + size
+
+  @staticmethod
+  def _add(totals: dict[str, list[float]], key: str, wall: float, cpu: float):
+    entry = totals.setdefault(key, [0.0, 0.0, 0])
+    entry[0] += wall
+    entry[1] += cpu
+    entry[2] += 1
+
+  @contextmanager
+  def _phase(self, name: str):
+    child = [0.0, 0.0]
+    self._child_times.append(child)
+    if self.memory:
+      current, peak = tracemalloc.get_traced_memory()
+      if self._mem_frames:
+        # Resetting the peak loses the enclosing phase's peak so far.
+        self._mem_frames[-1][1] = max(self._mem_frames[-1][1], peak)
+      tracemalloc.reset_peak()
+      mem_frame = [current, 0, 0]
+      self._mem_frames.append(mem_frame)
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+      yield
+    finally:
+      wall = time.perf_counter() - wall
+      cpu  = time.process_time() - cpu
+      self._child_times.pop()
+      if self._child_times:
+        self._child_times[-1][0] += wall
+        self._child_times[-1][1] += cpu
+      Profiler._add(self.phases, name, wall - child[0], cpu - child[1])
+
+      if self.memory:
+        current, peak = tracemalloc.get_traced_memory()
+        self._mem_frames.pop()
+        peak = max(peak, mem_frame[1])
+        net = current - mem_frame[0]
+        if self._mem_frames:
+          self._mem_frames[-1][1] = max(self._mem_frames[-1][1], peak)
+          self._mem_frames[-1][2] += net
+        entry = self.mem_phases.setdefault(name, [0, 0, 0, 0])
+        entry[0] += net - mem_frame[2]
+        entry[1] = max(entry[1], net - mem_frame[2])
+        entry[2] = max(entry[2], peak - mem_frame[0])
+        entry[3] += 1
+
+  @contextmanager
+  def _span(self, totals: dict[str, list[float]], key: str):
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+      yield
+    finally:
+      Profiler._add(totals, key, time.perf_counter() - wall, time.process_time() - cpu)
+
+  def report(self, top: int, out: typing.TextIO):
+    """
+    Prints the phase table plus the slowest files and symbols.
+
+    Parameters
+    ----------
+    top : int
+        How many of the slowest files and symbols to print.
+    out : typing.TextIO
+        Where to print to.
+    """
+    total_wall = time.perf_counter() - self.start_wall
+    total_cpu  = time.process_time() - self.start_cpu
+
+    def table(title: str, totals: dict[str, list[float]], limit: Optional[int]):
+      rows = sorted(totals.items(), key=lambda kv: kv[1][0], reverse=True)[:limit]
+      if not rows:
+        return
+      width = max(len(title), *(len(key) for key, _ in rows))
+      print(f"{title:<{width}}  {'wall (s)':>10}  {'cpu (s)':>10}  {'calls':>7}", file=out)
+      for key, (wall, cpu, calls) in rows:
+        print(f"{key:<{width}}  {wall:>10.4f}  {cpu:>10.4f}  {int(calls):>7}", file=out)
+      print(file=out)
+
+    phases = dict(self.phases)
+    phases["(unattributed)"] = [
+      total_wall - sum(v[0] for v in self.phases.values()),
+      total_cpu  - sum(v[1] for v in self.phases.values()),
+      1
+    ]
+    print(f"Profile: {total_wall:.4f}s wall, {total_cpu:.4f}s cpu\n", file=out)
+    table("phase", phases, None)
+    table(f"slowest {top} files", self.files, top)
+    table(f"slowest {top} symbols", self.symbols, top)
+
+  def report_memory(self, out: typing.TextIO, budget: Optional[int]) -> bool:
+    """
+    Prints the memory used per phase, per structure and per symbol.
+
+    Parameters
+    ----------
+    out : typing.TextIO
+        Where to print to.
+    budget : Optional[int]
+        Maximum peak bytes allowed per symbol.
+
+    Returns
+    -------
+    bool
+        False if budget was exceeded.
+    """
+    _, peak = tracemalloc.get_traced_memory()
+    peak = max([peak, *(frame[1] for frame in self._mem_frames)])
+    per_symbol = peak // self.symbol_count if self.symbol_count else peak
+
+    def table(title: str, rows: list[tuple[str, list[int]]], headings: list[str]):
+      width = max(len(title), *(len(key) for key, _ in rows))
+      print(f"{title:<{width}}" + "".join(f"  {h:>12}" for h in headings), file=out)
+      for key, values in rows:
+        print(f"{key:<{width}}" + "".join(f"  {v:>12,}" for v in values), file=out)
+      print(file=out)
+
+    print(f"Memory: {peak:,} bytes peak, {self.symbol_count} symbols, "
+      f"{per_symbol:,} peak bytes per symbol\n", file=out)
+    if self.mem_phases:
+      table("phase", sorted(self.mem_phases.items(), key=lambda kv: kv[1][2], reverse=True),
+        ["total net", "max net", "max peak", "calls"])
+    if self.structures:
+      table("structure", [
+          (key, [size, size // self.symbol_count if self.symbol_count else size])
+          for key, size in sorted(self.structures.items(), key=lambda kv: kv[1], reverse=True)
+        ],
+        ["bytes", "per symbol"])
+
+    if budget is not None and budget < per_symbol:
+      print(f"ERROR: {per_symbol:,} peak bytes per symbol exceeds budget of {budget:,}.", file=out)
+      return False
+    return True
+
+def write_collapsed_stacks(stats: "pstats.Stats", out: typing.TextIO):
+  """
+  Writes cProfile data as collapsed stacks (`frame;frame;frame count` lines)
+  for flame graph tools.  Counts are in microseconds.
+
+  cProfile only records caller/callee pairs, so each function's time is split
+  across its call paths in proportion to the time that each caller spent in it.
+
+  Parameters
+  ----------
+  stats : pstats.Stats
+      The profile data.
+  out : typing.TextIO
+      Where to write the stacks.
+  """
+  raw: dict = stats.stats # pyright: ignore[reportAttributeAccessIssue]
+  callees: dict[tuple, list[tuple[tuple, float]]] = {}
+  for func, (_, _, _, _, callers) in raw.items():
+    for caller, (_, _, _, edge_ct) in callers.items():
+      callees.setdefault(caller, []).append((func, edge_ct))
+
+  def name(func: tuple) -> str:
+    filename, line, fn_name = func
+    if filename == "~":
+      return fn_name
+    return f"{os.path.basename(filename)}:{line}({fn_name})"
+
+  collapsed: dict[str, int] = {}
+  def walk(func: tuple, path: list[str], on_path: set[tuple], share: float):
+    _, _, tt, ct, _ = raw[func]
+    path.append(name(func))
+    on_path.add(func)
+    self_us = int(tt * share * 1e6)
+    if self_us:
+      key = ";".join(path)
+      collapsed[key] = collapsed.get(key, 0) + self_us
+    for callee, edge_ct in callees.get(func, []):
+      callee_ct = raw[callee][3]
+      if callee in on_path or callee_ct <= 0:
+        continue
+      callee_share = share * edge_ct / callee_ct
+      if callee_share * callee_ct >= 1e-6:
+        walk(callee, path, on_path, callee_share)
+    on_path.discard(func)
+    path.pop()
+
+  sys.setrecursionlimit(max(sys.getrecursionlimit(), 10000))
+  for func, (_, _, _, _, callers) in raw.items():
+    if not callers:
+      walk(func, [], set(), 1.0)
+
+  for key, count in collapsed.items():
+    out.write(f"{key} {count}\n")
+
 # Start of program
 
 import argparse
 import sys
 
+# The modules in scad_tools import what they share with this script from it
+# under this name.
+sys.modules.setdefault("scad_analysis", sys.modules[__name__])
+
 # Force utf-8 stdin/stdout
 sys.stdout.reconfigure(encoding="utf-8", errors="strict") # pyright: ignore[reportAttributeAccessIssue]
 sys.stderr.reconfigure(encoding="utf-8", errors="strict") # pyright: ignore[reportAttributeAccessIssue]
@@ -329,11 +899,13 @@ class OptionDict(TypedDict):
   showLineNums: bool
   show         : Showing
   id           : str | None
+  regexTimeout : float | None
 
 options: OptionDict = {
   "showLineNums": False,
   "show"        : "sig-doc",
   "id"          : None,
+  "regexTimeout": None,
 }
 
 # ---- command-line parsing ----
@@ -366,7 +938,17 @@ parser = argparse.ArgumentParser(
     '          "line_end"  : <end-line>,\n'
     '          "signature" : "<sig>",\n'
     '          "body"      : "<body>",\n'
+    '          "literal"   : null | {\n'
+    '            "elements": <top-level-element-count>,\n'
+    '            "numbers" : <number-count-at-any-level>,\n'
+    '            "depth"   : <list-nesting-depth>\n'
+    '          },\n'
     '          "doc"       : "<symbol-doc>",\n'
+    '          "fingerprints": {\n'
+    '            "signature": "<normalized-signature-hash>",\n'
+    '            "body"     : "<normalized-body-hash>",\n'
+    '            "doc"      : "<normalized-doc-hash>"\n'
+    '          }\n'
     '        },\n'
     '        ...\n'
     '      }\n'
@@ -383,6 +965,30 @@ parser = argparse.ArgumentParser(
     '      "combined_hash": "<combined-file-sha256-hash>"\n'
     '      "mtime"        : "<time-stamp-for-youngest-file>"\n'
     '    }\n'
+    '\n'
+    '"literal" is set for a value whose body is a literal list of at least\n'
+    f'{LITERAL_DATA_MIN_CHARS} characters, like a table of points.  It summarizes what the body\n'
+    'holds, so readers of large data tables needn\'t scan the body itself.\n'
+    '\n'
+    'With --shard-dir DIR, each file gets DIR/<filename>.json holding its\n'
+    '"filename", "hash", "mtime", "docs", "symbols" and "ids" and DIR/index.json\n'
+    'lists the shards:\n'
+    '    {\n'
+    '      "files": {\n'
+    '        "<filename>": {\n'
+    '          "order"  : <processed-order>,\n'
+    '          "shard"  : "<shard-file-relative-to-DIR>",\n'
+    '          "hash"   : "<file-sha256-hash>",\n'
+    '          "mtime"  : "<gmt-time-stamp-for-file>",\n'
+    '          "symbols": [ "<symbol-id>", ... ]\n'
+    '        },\n'
+    '        ...\n'
+    '      },\n'
+    '      "ids"          : { "<symbol-id>": "<shard-file>", ... },\n'
+    '      "hash_algo"    : "<hash-algorithm-used-in-struct>",\n'
+    '      "combined_hash": "<combined-file-sha256-hash>",\n'
+    '      "mtime"        : "<time-stamp-for-youngest-file>"\n'
+    '    }\n'
   ),
 )
 
@@ -443,6 +1049,391 @@ parser.add_argument(
   help="Write each file's output to OUTFILE instead of stdout.",
 )
 
+# guarded parsing
+parser.add_argument(
+  "--regex-timeout",
+  metavar="SECONDS",
+  dest="regex_timeout",
+  type=float,
+  default=options["regexTimeout"],
+  help="Parse in guarded mode, giving each top level item and JSDoc block\n"
+       "SECONDS to match.  Items that time out or fail to parse are reported\n"
+       "and skipped to the next plausible item boundary.",
+)
+
+# adversarial input testing
+parser.add_argument(
+  "--fuzz",
+  metavar="COUNT",
+  dest="fuzz",
+  type=int,
+  help="Run the adversarial input suite: a fixed set of malformed variants\n"
+       "of each file plus COUNT random mutations, parsed in guarded mode.\n"
+       "Each file is also parsed as is with and without the guard, which\n"
+       "must give the same items.  Exits with 1 if any case fails or exceeds\n"
+       "--fuzz-limit.",
+)
+
+parser.add_argument(
+  "--fuzz-limit",
+  metavar="SECONDS",
+  dest="fuzz_limit",
+  type=float,
+  default=2.0,
+  help="Time limit for parsing a single --fuzz case (default: %(default)s).",
+)
+
+parser.add_argument(
+  "--fuzz-seed",
+  metavar="SEED",
+  dest="fuzz_seed",
+  type=int,
+  default=0,
+  help="Random seed for --fuzz mutations (default: %(default)s).",
+)
+
+parser.add_argument(
+  "--fuzz-out",
+  metavar="DIR",
+  dest="fuzz_out",
+  help="Write the inputs of --fuzz cases that fail to DIR.",
+)
+
+# profiling
+parser.add_argument(
+  "--profile",
+  metavar="N",
+  dest="profile",
+  type=int,
+  nargs="?",
+  const=10,
+  help="Print wall and CPU time per phase and the N slowest files and\n"
+       "symbols to stderr (default N: %(const)s).",
+)
+
+parser.add_argument(
+  "--profile-out",
+  metavar="FILE",
+  dest="profile_out",
+  help="Run under cProfile and write the data to FILE in collapsed stack\n"
+       "format for flame graph tools.",
+)
+
+# memory accounting
+parser.add_argument(
+  "--mem-report",
+  dest="mem_report",
+  action="store_true",
+  help="Trace allocations with tracemalloc and print bytes per phase, bytes\n"
+       "held by each major structure and peak bytes per symbol to stderr.\n"
+       "Per phase, \"total net\" sums what its calls left allocated, while\n"
+       "\"max net\" and \"max peak\" are the largest of a single call.  Slows\n"
+       "processing, so don't combine with --profile.",
+)
+
+parser.add_argument(
+  "--mem-budget",
+  metavar="BYTES",
+  dest="mem_budget",
+  type=int,
+  help="With --mem-report, exit with 1 if the peak bytes per symbol exceeds\n"
+       "BYTES.",
+)
+
+# change manifest
+parser.add_argument(
+  "--manifest",
+  metavar="FILE",
+  dest="manifest",
+  help="Keep a manifest of each input's size, mtime, inode and hash and of\n"
+       "each output's hash in FILE.  Inputs whose stat data is unchanged\n"
+       "aren't reread when their previous output can be reused, and if no\n"
+       "input, option or output changed since the last run, exit immediately.",
+)
+
+# sharded json
+parser.add_argument(
+  "--shard-dir",
+  metavar="DIR",
+  dest="shard_dir",
+  help="With --show json, write one shard per file plus an index.json to\n"
+       "DIR instead of one merged document.  Only shards of files whose hash\n"
+       "changed, or whose bytes no longer match the index, are rewritten.",
+)
+
+# api diff
+parser.add_argument(
+  "--diff",
+  nargs=2,
+  metavar=("OLD", "NEW"),
+  dest="diff",
+  help="Compare two snapshots and print the added, removed and changed\n"
+       "symbols as json.  Each snapshot is a --show json file, a --shard-dir\n"
+       "directory or a directory tree of sources to analyse.",
+)
+parser.add_argument(
+  "--timeline",
+  metavar="REVS",
+  dest="timeline",
+  help="Print when each symbol was added, changed its signature and was\n"
+       "removed over the git commits REVS, like v1.0..HEAD, as json.  Merges\n"
+       "are compared with their first parent.  Files follow only those library\n"
+       "files, which is how extensionless ones are followed, else all .scad\n"
+       "files are followed.",
+)
+
+# evaluator
+parser.add_argument(
+  "--eval",
+  dest="eval",
+  action="store_true",
+  help="Run the given test_*.scad suites with the built in evaluator of the\n"
+       "functional subset of OpenSCAD instead of documenting them.  Exits\n"
+       "with 1 if an assert fails.",
+)
+
+# test runner
+parser.add_argument(
+  "--run-tests",
+  dest="run_tests",
+  action="store_true",
+  help="Find the test entry points in the given test_*.scad suites, or in\n"
+       "the test_*.scad files of the given directories, and run each in its\n"
+       "own executor process, in parallel.  Failed asserts are reported at\n"
+       "their fl() marker.  A suite that doesn't parse to the end or has no\n"
+       "entry points fails.  Exits with 1 if any fail.",
+)
+
+parser.add_argument(
+  "--allow-empty-suites",
+  dest="allow_empty_suites",
+  action="store_true",
+  help="With --run-tests or --impact, don't fail suites without entry points.",
+)
+
+parser.add_argument(
+  "--executor",
+  metavar="CMD",
+  dest="executor",
+  default="builtin",
+  help="With --run-tests, the command that runs a driver file.  {scad} is\n"
+       "replaced with the driver file and {out} with a file it can write\n"
+       "output to, e.g. \"openscad -o {out} {scad}\".  \"builtin\" uses --eval.\n"
+       "Default: builtin",
+)
+
+parser.add_argument(
+  "--jobs",
+  metavar="N",
+  dest="jobs",
+  type=int,
+  help="With --run-tests, the number of executor processes to run at once.\n"
+       "Default: the number of CPUs",
+)
+
+parser.add_argument(
+  "--test-timeout",
+  metavar="SECONDS",
+  dest="test_timeout",
+  type=float,
+  help="With --run-tests, fail an entry point that runs for longer.",
+)
+
+parser.add_argument(
+  "--test-cache",
+  metavar="FILE",
+  dest="test_cache",
+  help="With --run-tests, cache results in FILE.  An entry point isn't run\n"
+       "again while the executor and the hashes of its suite and of all the\n"
+       "files the suite uses or includes, transitively, are unchanged.",
+)
+
+parser.add_argument(
+  "--impact",
+  metavar="CHANGES",
+  dest="impact",
+  action="append",
+  help="List the test entry points, found like --run-tests finds them, that\n"
+       "can observe CHANGES: - for a unified diff on stdin, a diff file, a\n"
+       "changed file or else git revisions to diff with, like HEAD.  Can be\n"
+       "given more than once.  With --run-tests, runs only those.",
+)
+
+# bundler
+parser.add_argument(
+  "--bundle",
+  metavar="OUTFILE",
+  dest="bundle",
+  help="Write the design given as the only file to OUTFILE, or - for stdout,\n"
+       "with the library functions, modules and values it needs,\n"
+       "transitively, instead of use and include.  Library symbols whose\n"
+       "names collide are renamed.",
+)
+
+# minifier
+parser.add_argument(
+  "--minify",
+  metavar="DIR",
+  dest="minify",
+  help="Write copies of the files to DIR without comments or docs and with\n"
+       "whitespace collapsed, each with a NAME.map.json line map.  The line\n"
+       "numbers given to fl() and _fl() are renumbered to the copies' lines.",
+)
+parser.add_argument(
+  "--unminify",
+  metavar="DIR",
+  dest="unminify",
+  help="Copy stdin to stdout, translating 'in file F, line L' and 'F:L'\n"
+       "references to files minified into DIR back to their sources.",
+)
+
+# load cost
+parser.add_argument(
+  "--load-cost",
+  action="store_true",
+  dest="load_cost",
+  help="Report what loading each file makes OpenSCAD read through use and\n"
+       "include, transitively: bytes, top level items, comment bytes and\n"
+       "symbols per edge, the heaviest imports and duplicate includes.  Shown\n"
+       "as json with --show json.",
+)
+parser.add_argument(
+  "--load-cost-top",
+  metavar="N",
+  type=int,
+  default=5,
+  dest="load_cost_top",
+  help="How many of the heaviest imports --load-cost lists (default: %(default)s).",
+)
+
+# recursion analysis
+parser.add_argument(
+  "--recursion",
+  action="store_true",
+  dest="recursion",
+  help="Report the recursive functions in the files, which of their calls\n"
+       "OpenSCAD can't turn into loops and the stack depth implied for\n"
+       "--recursion-size.  Shown as json with --show json, else markdown.",
+)
+parser.add_argument(
+  "--recursion-size",
+  metavar="N",
+  type=int,
+  default=1000,
+  dest="recursion_size",
+  help="Input size for the --recursion depth estimate (default: %(default)s).",
+)
+
+# lint
+parser.add_argument(
+  "--lint",
+  action="store_true",
+  dest="lint",
+  help="Check the files for performance anti-patterns.  Findings are json\n"
+       "with --show json, else one line each.  Exits with 1 if any are found.",
+)
+parser.add_argument(
+  "--lint-rules",
+  metavar="RULES",
+  dest="lint_rules",
+  help="Comma separated --lint rules to run (default: all).  Rules are\n"
+       "concat-in-recursion, len-in-comprehension, search-in-loop,\n"
+       "let-recompute and include-not-use.",
+)
+
+# library symbol database
+parser.add_argument(
+  "--write-lib-db",
+  metavar="FILE",
+  dest="write_lib_db",
+  help="Write the documented symbols of the files to FILE, a database that\n"
+       "projects using the library can load with --lib-db instead of passing\n"
+       "the library's files.  Fails if any type used isn't defined.",
+)
+parser.add_argument(
+  "--lib-db-url",
+  metavar="URL",
+  dest="lib_db_url",
+  default="",
+  help="With --write-lib-db, where the library's markdown is, for links to\n"
+       "its symbols (default: links are to anchors on the same page).",
+)
+parser.add_argument(
+  "--lib-db",
+  metavar="FILE",
+  dest="lib_db",
+  help="Resolve types and symbols that the files don't declare from FILE,\n"
+       "written by --write-lib-db.",
+)
+
+# symbol search
+parser.add_argument(
+  "--search",
+  metavar="FRAGMENT",
+  dest="search",
+  help="List the symbol ids, type ids and parameter names best matching\n"
+       "FRAGMENT, from the files or --search-index.  Matches ignore case and\n"
+       "allow for typos.  --show json lists them as json.",
+)
+parser.add_argument(
+  "--search-limit",
+  metavar="N",
+  type=int,
+  default=20,
+  dest="search_limit",
+  help="How many matches --search lists (default: %(default)s).",
+)
+parser.add_argument(
+  "--write-search-index",
+  metavar="FILE",
+  dest="write_search_index",
+  help="Write the trigram index of the files' names, and those in --lib-db,\n"
+       "to FILE for --search-index.",
+)
+parser.add_argument(
+  "--search-index",
+  metavar="FILE",
+  dest="search_index",
+  help="Search the index written by --write-search-index instead of\n"
+       "analysing files.",
+)
+
+# watch mode
+parser.add_argument(
+  "--watch",
+  action="store_true",
+  dest="watch",
+  help="Stay running and rewrite the outputs when the files or the files they\n"
+       "use or include change.  Requires --write-to-file or --write-to-files.",
+)
+parser.add_argument(
+  "--watch-interval",
+  metavar="SECONDS",
+  type=float,
+  default=0.2,
+  dest="watch_interval",
+  help="How often --watch polls the files (default: %(default)s).",
+)
+parser.add_argument(
+  "--watch-debounce",
+  metavar="SECONDS",
+  type=float,
+  default=0.3,
+  dest="watch_debounce",
+  help="How long changes must stop for before --watch rebuilds\n"
+       "(default: %(default)s).",
+)
+
+# markdown events
+parser.add_argument(
+  "--md-events",
+  metavar="FILE",
+  dest="md_events",
+  help="With --show md or md-with-private, also write the headings and local\n"
+       "links that were rendered to FILE as json, in output order and with\n"
+       "where each starts in the output.",
+)
+
 args = parser.parse_args()
 
 if args.write_ext is not None and args.out_file is not None:
@@ -458,10 +1449,86 @@ if args.write_ext is not None and args.write_ext.strip() == "":
 if not args.filenames and args.write_ext is not None:
   parser.error("--write-to-files is invalid when reading from stdin")
 
+if args.regex_timeout is not None and args.regex_timeout <= 0:
+  parser.error("--regex-timeout SECONDS must be positive")
+
+if args.fuzz is not None and not args.filenames:
+  parser.error("--fuzz requires files to mutate")
+
+if args.eval and not args.filenames:
+  parser.error("--eval requires suites to run")
+
+if args.bundle is not None and len(args.filenames) != 1:
+  parser.error("--bundle requires exactly one design file")
+
+if args.minify is not None and not args.filenames:
+  parser.error("--minify requires files to minify")
+
+if args.recursion and not args.filenames:
+  parser.error("--recursion requires files to analyse")
+
+if args.load_cost and not args.filenames:
+  parser.error("--load-cost requires files to load")
+
+if args.lint and not args.filenames:
+  parser.error("--lint requires files to check")
+
+if args.write_lib_db is not None and not args.filenames:
+  parser.error("--write-lib-db requires the library's files")
+
+if args.search is not None or args.write_search_index is not None:
+  if not args.filenames and args.search_index is None:
+    parser.error("--search and --write-search-index require files or --search-index")
+  if args.filenames and args.search_index is not None:
+    parser.error("--search-index cannot be used with files")
+  if args.search_limit < 1:
+    parser.error("--search-limit must be at least 1")
+elif args.search_index is not None:
+  parser.error("--search-index requires --search")
+
+if args.timeline is not None and (args.manifest is not None or args.diff):
+  parser.error("--timeline cannot be used with --manifest or --diff")
+
+if args.md_events is not None:
+  if args.show not in ("md", "md-with-private"):
+    parser.error("--md-events requires --show md or md-with-private")
+  if args.manifest is not None:
+    parser.error("--md-events cannot be used with --manifest")
+
+if args.watch:
+  if not args.filenames:
+    parser.error("--watch requires files to watch")
+  if args.write_ext is None and args.out_file is None:
+    parser.error("--watch requires --write-to-file or --write-to-files")
+  if args.manifest is not None or args.shard_dir is not None:
+    parser.error("--watch cannot be used with --manifest or --shard-dir")
+  if args.watch_interval <= 0 or args.watch_debounce < 0:
+    parser.error("--watch-interval must be positive and --watch-debounce not negative")
+
+if args.jobs is not None and args.jobs < 1:
+  parser.error("--jobs N must be at least 1")
+
+if args.mem_budget is not None and not args.mem_report:
+  parser.error("--mem-budget requires --mem-report")
+
+if args.manifest is not None and not args.filenames:
+  parser.error("--manifest is invalid when reading from stdin")
+
+if args.shard_dir is not None:
+  if args.show != "json":
+    parser.error("--shard-dir requires --show json")
+  if args.write_ext is not None or args.out_file is not None:
+    parser.error("--shard-dir cannot be used with --write-to-files or --write-to-file")
+  if not args.filenames:
+    parser.error("--shard-dir is invalid when reading from stdin")
+
 # Copy to options
 options["show"]         = args.show          # type: ignore[assignment]
 options["id"]           = args.id
 options["showLineNums"] = args.showLineNums
+options["regexTimeout"] = args.regex_timeout
+
+profiler = Profiler(args.profile is not None, args.mem_report)
 
 # ---- regexes for .md conversion ----
 RE_J_DOC_BOX = regex.compile(
@@ -498,16 +1565,24 @@ RE_TYPE = regex.compile(
 
 
 # ---- per-file processing ----
+class Fingerprints(TypedDict):
+  signature : str
+  body      : str
+  doc       : str
+
 class TrackIds(TypedDict):
-  filename   : str
-  order      : int
-  name       : str
-  type       : str
-  line_start : int
-  line_end   : int
-  signature  : str
-  body       : str
-  doc        : str
+  filename    : str
+  order       : int
+  name        : str
+  type        : str
+  line_start  : int
+  line_end    : int
+  signature   : str
+  body        : str
+  literal     : Optional[LiteralSummary]
+  "what body holds if it's a large literal list, else None"
+  doc         : str
+  fingerprints: Fingerprints
 
 class TrackFileDoc(TypedDict):
   order   : int
@@ -525,6 +1600,89 @@ class TrackFull(Track):
   hash_algo    : str
   mtime        : str
 
+class TrackShard(TypedDict):
+  filename: str
+  hash    : str
+  mtime   : str
+  docs    : list[tuple[int, str]] # list of (order, doc_str)
+  symbols : list[str]
+  ids     : dict[str, TrackIds]
+
+class TrackIndexFile(TypedDict):
+  order     : int
+  shard     : str
+  shard_hash: str
+  "sha256 of the shard's bytes, checked before the shard is reused"
+  hash      : str
+  mtime     : str
+  symbols   : list[str]
+
+class TrackIndex(TypedDict):
+  files        : dict[str, TrackIndexFile]
+  ids          : dict[str, str] # symbol id -> shard
+  hash_algo    : str
+  combined_hash: str
+  mtime        : str
+
+RE_CODE_TOKEN = regex.compile(
+  r'''
+      (?<quote>   "(?:[^\\"]++|\\.)*+" )
+    | (?<comment> //[^\n]*+ | /\*(?:[^*]|\*(?!/))*+(?:\*/)?+ )
+    | (?<ws>      \s++ )
+    | (?<other>   [^"/\s]++ | / )
+  ''', regex.VERBOSE
+)
+"Splits code into string literals, comments, whitespace and everything else."
+
+def normalize_code(code: str) -> str:
+  """
+  Removes comments and whitespace outside of string literals.  A single space
+  is kept where needed to separate two words.
+
+  Parameters
+  ----------
+  code : str
+      OpenSCAD code.
+
+  Returns
+  -------
+  str
+      The normalized code.
+  """
+  parts: list[str] = []
+  separated = False
+  for m in RE_CODE_TOKEN.finditer(code):
+    if m["ws"] or m["comment"]:
+      separated = True
+      continue
+    token = m[0]
+    if separated and parts and (parts[-1][-1].isalnum() or parts[-1][-1] == "_") \
+        and (token[0].isalnum() or token[0] == "_"):
+      parts.append(" ")
+    parts.append(token)
+    separated = False
+  return "".join(parts)
+
+def normalize_doc(doc: str) -> str:
+  "Removes the doc comment box and collapses whitespace."
+  return " ".join(RE_J_DOC_BOX.sub("", doc).split())
+
+def fingerprint(text: str) -> str:
+  return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+def get_fingerprints(signature: str, body: str, doc: str) -> Fingerprints:
+  """
+  Fingerprints of a symbol's normalized signature, body and doc, so that
+  changes to only whitespace or comments don't register as changes.
+  """
+  return {
+    "signature": fingerprint(normalize_code(signature)),
+    "body"     : fingerprint(normalize_literal(body)
+                   if len(body) >= LITERAL_DATA_MIN_CHARS and RE_LITERAL_LIST.fullmatch(body)
+                   else normalize_code(body)),
+    "doc"      : fingerprint(normalize_doc(doc)),
+  }
+
 from abc import ABC, abstractmethod
 
 def camel_to_snake_case(m: regex.Match):
@@ -572,6 +1730,124 @@ def sanitize_anchor_id(id: str) -> str:
 def make_anchor(prefix: str, id: str):
   return f"<a id='{prefix}-{sanitize_anchor_id(id)}'></a>"
 
+# In scad_tools/markdown.py, shared with build-docs.py.
+from scad_tools.markdown import github_heading_anchor
+
+class MdEvent(TypedDict):
+  """
+  A heading or local link emitted by the markdown renderer.
+
+  Headings have their level (2 file, 3 chapter, 4 item), the text to list them
+  with and their anchor.  Links have level 0 and their target as the anchor.
+  The offset is where what was emitted starts in the output, so a file's
+  heading's is that of the rule above it.
+  """
+  kind: Literal["heading", "link"]
+  level: int
+  text: str
+  anchor: str
+  file: str
+  offset: int
+
+class MdLines(list[str]):
+  """
+  Markdown output lines with the heading and link events that were emitted
+  with them, in output order.  Consumers such as the TOC use the events rather
+  than parsing the markdown again.  The events' offsets are set by joined().
+  """
+  RE_HEADING = regex.compile(r"^(\#{2,4}) (.*)", regex.MULTILINE)
+  RE_LOCAL_LINK = regex.compile(r"(?<!\\)(\[[^\]]++\]\(\#)([^)]*+)")
+  RE_HREF = regex.compile(r'href="\#([^"]++)"')
+
+  def __init__(self, filename: str):
+    super().__init__()
+    self.filename = filename
+    self.events: list[MdEvent] = []
+    # The line and the offset in it of each event.
+    self.places: list[tuple[int, int]] = []
+
+  def heading(self, level: int, text: str, anchor: str, at: Optional[int] = None):
+    """
+    Records a heading.  It's the last line appended, or with at, at that offset
+    in the line appended next.
+    """
+    self.events.append({ "kind": "heading", "level": level, "text": text, "anchor": anchor, "file": self.filename, "offset": 0 })
+    self.places.append((len(self) - 1, 0) if at is None else (len(self), at))
+
+  def link(self, anchor: str, at: int):
+    "Records a link at offset at in the line appended next."
+    self.events.append({ "kind": "link", "level": 0, "text": "", "anchor": anchor, "file": self.filename, "offset": 0 })
+    self.places.append((len(self), at))
+
+  def html(self, line: str):
+    "Appends a generated line, recording the local links in it."
+    for m in MdLines.RE_HREF.finditer(line):
+      self.link(m[1], m.start())
+    self.append(line)
+
+  def extend_md(self, other: "MdLines"):
+    self.places += [ (line + len(self), at) for line, at in other.places ]
+    self.extend(other)
+    self.events += other.events
+
+  def text(self, text: str):
+    """
+    Appends documentation text.  Its headings get emojis and anchors, and the
+    targets of its local links are lowercased like GitHub lowercases anchors.
+    """
+    parts: list[str] = []
+    size = 0
+
+    def add(piece: str):
+      "Adds piece to the line with its links' targets lowercased."
+      nonlocal size
+      last = 0
+      for m in MdLines.RE_LOCAL_LINK.finditer(piece):
+        anchor = fix_for_githubs_fascist_overreach(m[2])
+        self.link(anchor, size + m.start() - last)
+        parts.append(piece[last:m.start(2)] + anchor)
+        size += m.start(2) - last + len(anchor)
+        last = m.end()
+      parts.append(piece[last:])
+      size += len(piece) - last
+
+    def heading(m: regex.Match) -> str:
+      heading_text: str = m[2]
+      # Anchors are made from the text as written, but it's listed as shown.
+      shown = MdLines.RE_LOCAL_LINK.sub(lambda l: l[1] + fix_for_githubs_fascist_overreach(l[2]), heading_text)
+      match len(m[1]):
+        case 2:
+          self.heading(2, shown, f"file-{sanitize_anchor_id(heading_text)}", size)
+          return f"<hr/>\n\n## 📘{heading_text}{make_anchor('file', heading_text)}"
+        case 3:
+          self.heading(3, shown, f"ch-{self.filename}-{sanitize_anchor_id(heading_text)}", size)
+          return f"### <i>📑{heading_text}</i>{make_anchor(f'ch-{self.filename}', heading_text)}"
+        case _:
+          shown = shown.strip()
+          self.heading(4, regex.sub(r"\*\*(.+?)\*\*", r"\1", shown), github_heading_anchor(shown), size)
+          return m[0]
+
+    last = 0
+    for m in MdLines.RE_HEADING.finditer(text):
+      add(text[last:m.start()])
+      add(heading(m))
+      last = m.end()
+    add(text[last:])
+    self.append("".join(parts))
+
+  def joined(self, start: int = 0) -> str:
+    """
+    The lines as output text.  The events get their offsets in it, counting
+    from start when the text follows other output.
+    """
+    line_starts: list[int] = []
+    for line in self:
+      line_starts.append(start)
+      start += len(line) + 1
+    for event, (line, at) in zip(self.events, self.places):
+      event["offset"] = line_starts[line] + at
+    return "\n".join(self)
+
 # `any` isn't builtin, but it's not to be linked to
 # `...` is just a placeholder
 BUILTIN_TYPES: set[str] = set(["number", "string", "list", "undef", "function", "bool", "any", "..."])
@@ -915,7 +2191,7 @@ class Doc:
     return doc_type in typing.get_args(Doc.DocHeader)
   
   def e(self, msg: str):
-    return f"{self.filename}{f':{self.id}' if self.id else ''}{get_lines(self.doc_item[DOC_SLC], line_char_index)}: {msg}"
+    return f"{self.filename}{f':{self.id}' if self.id else ''}{get_lines(self.doc_item[DOC_SLC], self.line_index)}: {msg}"
 
   ICONS = {
     "> WARNING:": "> ⚠️ WARNING:",
@@ -928,6 +2204,10 @@ class Doc:
     self.filename = filename
     self.content  = content
     self.doc_item = doc_item
+    # Docs are rendered after all files are read, so keep this file's index.
+    self.line_index = line_char_index
+    self.lib_href: Optional[str] = None
+    "Where the doc is rendered if it's from a --lib-db."
 
     # There are three things that this could be.
     # 1. A file doc (has no id)
@@ -949,7 +2229,13 @@ class Doc:
     for find, replace in Doc.ICONS.items():
       doc = doc.replace(find, replace)
 
-    m = self.RE_FN_DOC.match(doc, partial=True)
+    try:
+      m = self.RE_FN_DOC.match(doc, partial=True, timeout=options["regexTimeout"])
+    except TimeoutError:
+      # Guarded mode.  Recover by treating the whole doc as a description.
+      print("WARNING: " + self.e(f"JSDoc parse timed out after {options['regexTimeout']}s."
+        " Treating doc as a plain description."), file=sys.stderr)
+      m = self.RE_DOC_AS_DESC.match(doc)
 
     assert m, self.e(f"Failed to parse any of:\n`{doc}`.")
     assert not m.partial, self.e(f"Expected more text at end of doc:\n`{doc}`.")
@@ -1026,6 +2312,41 @@ class Doc:
           f"Logic error. Tag {tag} found where it shouldn't exist.")
       self.doc_type = "file"
 
+  @staticmethod
+  def from_lib_db(name: str, record: "LibDbRecord", url: str) -> "Doc":
+    """
+    Makes a Doc from a --lib-db record without parsing anything.  It's only
+    complete enough to be linked to and to supply signatures, descriptions and
+    callchains of types.
+    """
+    def to_lib(desc: str) -> str:
+      # Links to anchors on the library's page.
+      return MdLines.RE_LOCAL_LINK.sub(lambda m: f"{m[1][:-1]}{url}#{fix_for_githubs_fascist_overreach(m[2])}", desc)
+
+    doc = Doc.__new__(Doc)
+    doc.filename = record["file"]
+    doc.id = name
+    doc.doc_type = record["doc_type"]
+    doc.items = { tag: [ (type, id, to_lib(desc) if url else desc, default) for type, id, desc, default in infos ]
+      for tag, infos in record["items"].items() } # type: ignore[misc]
+    doc.line_index = [0]
+    doc.lib_href = f"{url}#{record['anchor']}"
+    sig = record["sig"]
+    doc.content = sig
+    if record["type"] in NONTYPE_SYMBOLS:
+      end = slice(len(sig), len(sig))
+      params = [ (param, default) for param, default in record["params"] ] if record["params"] is not None else None
+      doc.doc_item = (record["type"], slice(0, len(sig)), slice(record["id_at"], record["id_at"] + len(name)),
+        slice(0, len(sig)), params, end, end)
+    else:
+      doc.doc_item = ("doc", slice(0, 0))
+    return doc
+
+  RE_DOC_AS_DESC = regex.compile(
+    r"(?<tag>)(?<type>)(?<id>)(?<default>)(?<desc>(?s:.*+))"
+  )
+  "Cheap fallback for RE_FN_DOC, producing a single description item."
+
   RE_CALLCHAIN_RET = regex.compile(
     r"""
     (?&symbol)\s*+ (?<curry>\((?&ret_chars_mtws)\)\s*+)++ (?::\s*+ (?<ret_type>.++))?+
@@ -1140,11 +2461,16 @@ class Doc:
       return s
 
     if type_name not in BUILTIN_TYPES:
-      assert type_name in symbols.type_dict, (
-        f"ERROR: Symbol '{self.filename}::{self.id}' uses type '{type_name}' "
-        "which has not been defined yet."
-      )
+      if type_name not in symbols.type_dict:
+        # reported together once all files are rendered
+        users = symbols.type_undefined.setdefault(type_name, [])
+        if f"{self.filename}::{self.id}" not in users:
+          users.append(f"{self.filename}::{self.id}")
+        return type_name
       symbols.type_refed.add(type_name)
+      lib_href = symbols.type_dict[type_name].lib_href
+      if lib_href is not None:
+        return f'<a href="{lib_href}">{type_name}</a>'
       return f'<a href="#t-{type_name}">{type_name}</a>'
 
     return type_name
@@ -1163,26 +2489,27 @@ class Doc:
   """ split up list types """
 
   def link_types(self, type_group: str, use_full_fn_type: bool = True) -> str:
-    type_group = type_group.rstrip()
+    with profiler.phase("link_types"):
+      type_group = type_group.rstrip()
 
-    if type_group.startswith("list["):
-      ids: list[str] = []
-      for id_matched in Doc.RE_SEP_LIST_TYPES.finditer(type_group, 5):
-        ids.append(self.link_types(id_matched["type"], use_full_fn_type))
-      # Prevent markdown linter from complaining about no link definition found
-      return "list\\[" + ",".join(ids) + "]"
+      if type_group.startswith("list["):
+        ids: list[str] = []
+        for id_matched in Doc.RE_SEP_LIST_TYPES.finditer(type_group, 5):
+          ids.append(self.link_types(id_matched["type"], use_full_fn_type))
+        # Prevent markdown linter from complaining about no link definition found
+        return "list\\[" + ",".join(ids) + "]"
 
-    if type_group.startswith("("):
-      ids: list[str] = []
-      for id_matched in Doc.RE_SEP_TYPES.finditer(type_group, 1):
-        ids.append(self.link_types(id_matched["type"].strip(), use_full_fn_type))
+      if type_group.startswith("("):
+        ids: list[str] = []
+        for id_matched in Doc.RE_SEP_TYPES.finditer(type_group, 1):
+          ids.append(self.link_types(id_matched["type"].strip(), use_full_fn_type))
 
-      from itertools import groupby
-      return "|".join(str(k) for k, _ in groupby(ids))
+        from itertools import groupby
+        return "|".join(str(k) for k, _ in groupby(ids))
 
-    return self._link_type(type_group, use_full_fn_type)
+      return self._link_type(type_group, use_full_fn_type)
 
-  def output_sig(self, output_lines: list[str], id_override: Optional[str]):
+  def output_sig(self, output_lines: MdLines, id_override: Optional[str]):
     """
     Outputs the signature.
     
@@ -1250,7 +2577,7 @@ class Doc:
 
     Parameters
     ----------
-    output_lines : list[str]
+    output_lines : MdLines
         Where the documentation is appended to.
     id_override : Optional[str]
         Used with typedef to override the id for a callback.
@@ -1272,7 +2599,7 @@ class Doc:
         ret_type = self.items["returns"][0][Doc.TYPE]
         sig += f" : {self.link_types(ret_type)}"
 
-      output_lines.append(f"<code>{sig}</code>")
+      output_lines.html(f"<code>{sig}</code>")
 
     elif self.doc_type == "typedef":
       # check if aliasing a single callback
@@ -1288,7 +2615,7 @@ class Doc:
       sig = f"*type* {id}"
       if type_name:
         sig += f" = {self.link_types(type_name)}"
-      output_lines.append(f"<code>{sig}</code>")
+      output_lines.html(f"<code>{sig}</code>")
 
     elif self.doc_type == "type":
       # @type for a value
@@ -1298,7 +2625,7 @@ class Doc:
         sig += f" : {self.link_types(type_name)}"
       else:
         sig += " : ???"
-      output_lines.append(f"<code>{sig}</code>")
+      output_lines.html(f"<code>{sig}</code>")
 
     elif is_sym_with_doc(self.doc_item):
       # function/module/value with doc
@@ -1316,7 +2643,7 @@ class Doc:
           sig += f" : {self.link_types(type_name)}"
         else:
           sig += " : ???"
-        output_lines.append(f"<code>{sig}</code>")
+        output_lines.html(f"<code>{sig}</code>")
         return
 
       # build params for function/module
@@ -1335,7 +2662,7 @@ class Doc:
         ret_type = self.items["returns"][0][Doc.TYPE]
         sig += f" : {self.link_types(ret_type)}"
 
-      output_lines.append(f"<code>{sig}</code>")
+      output_lines.html(f"<code>{sig}</code>")
 
     elif is_symbol(self.doc_item):
       # symbol without doc
@@ -1349,7 +2676,7 @@ class Doc:
       else:
         # value without doc
         sig = f"*value* {id.replace('_', '\\_')} : ???"
-        output_lines.append(f"<code>{sig}</code>")
+        output_lines.html(f"<code>{sig}</code>")
         return
 
       # Extract param names from the parsed param list
@@ -1360,7 +2687,7 @@ class Doc:
           params.append(param_name.replace("_", "\\_"))
 
       sig += ", ".join(params) + ")"
-      output_lines.append(f"<code>{sig}</code>")
+      output_lines.html(f"<code>{sig}</code>")
   
   def output_callchains(self, output_lines: list[str], id_override: Optional[str]):
     """
@@ -1433,7 +2760,7 @@ class Doc:
                   "Use @callchain tags for accurate curried function documentation.",
                   file=sys.stderr)
   
-  def output_slots(self, output_lines: list[str]):
+  def output_slots(self, output_lines: MdLines):
     """
     Outputs slot documentation for typedef types.
     Slots are displayed as formatted text (not headings) within a details block.
@@ -1460,13 +2787,13 @@ class Doc:
           # documented optional (how undef is treated)
           assert slot_opt.endswith("]"), "regex error"
           line += " *(Optional)*"
-      output_lines.append(f"{line}\n")
+      output_lines.html(f"{line}\n")
 
       if slot_desc:
         # Remove leading indentation from description
         desc_lines = Doc.RE_INDENT.sub("", slot_desc)
         desc_lines = Doc.RE_TRAILING_EMPTY_LINES.sub("", desc_lines)
-        output_lines.append(desc_lines+"\n")
+        output_lines.text(desc_lines+"\n")
       else:
         # No description?  See if the type has one and use it.
         type = symbols.type_dict.get(slot_type)
@@ -1477,7 +2804,7 @@ class Doc:
     output_lines.append("</details>")
     output_lines.append("")
   
-  def output_params(self, output_lines: list[str]):
+  def output_params(self, output_lines: MdLines):
     """
     Outputs parameter documentation for functions/modules/callbacks.
     Parameters are displayed as formatted text (not headings) within a details block.
@@ -1518,13 +2845,13 @@ class Doc:
         # undocumented default
         line += f" *(Default: `{param_defaults[param_id].replace('[', '\\[')}`)*"
 
-      output_lines.append(f"{line}\n")
+      output_lines.html(f"{line}\n")
 
       if param_desc:
         # Remove leading indentation from description
         desc_lines = Doc.RE_INDENT.sub("", param_desc)
         desc_lines = Doc.RE_TRAILING_EMPTY_LINES.sub("", desc_lines)
-        output_lines.append(desc_lines+"\n")
+        output_lines.text(desc_lines+"\n")
       else:
         # No description?  See if the type has one and use it.
         type = symbols.type_dict.get(param_type)
@@ -1539,7 +2866,7 @@ class Doc:
   RE_TRAILING_EMPTY_LINES = regex.compile(
     r"(?:\r?+\n)++$"
   )
-  def output_rets(self, output_lines: list[str]):
+  def output_rets(self, output_lines: MdLines):
     """
     Outputs return type documentation for functions/callbacks.
     Returns info is displayed as formatted text (not a heading) within a details block.
@@ -1554,7 +2881,7 @@ class Doc:
     output_lines.append("")
 
     if ret_type:
-      output_lines.append(f"**Returns**: <code>{self.link_types(ret_type)}</code>\n")
+      output_lines.html(f"**Returns**: <code>{self.link_types(ret_type)}</code>\n")
     else:
       output_lines.append("**Returns**\n")
 
@@ -1562,7 +2889,7 @@ class Doc:
       # Remove leading indentation from description
       desc_lines = Doc.RE_INDENT.sub("", ret_desc)
       desc_lines = Doc.RE_TRAILING_EMPTY_LINES.sub("", desc_lines)
-      output_lines.append(desc_lines+"\n")
+      output_lines.text(desc_lines+"\n")
 
     # Show callchains for return types that are callbacks
     if ret_type:
@@ -1620,7 +2947,7 @@ class Doc:
     (?: @end (?: \r?+\n)?+ )?+
     """, regex.VERBOSE
   )
-  def output_desc(self, output_lines: list[str]):
+  def output_desc(self, output_lines: MdLines):
     RE_CODE = regex.compile(r"`([^`]++)`")
     def code(s: str|None) -> str:
       return RE_CODE.sub(r"<code>\1</code>", s) if s else ""
@@ -1633,10 +2960,10 @@ class Doc:
             f"{m['pre_ex']}<details><summary><b>Example:</b><i>{code(m['name'])}</i></summary>\n\n"
             f"{m['desc']}\n\n"
             "</details>", desc)
-          output_lines.append(desc)
+          output_lines.text(desc)
           output_lines.append("")
 
-  def output_doc(self, output_lines: list[str]):
+  def output_doc(self, output_lines: MdLines):
     """
     Outputs the complete documentation for this item.
 
@@ -1656,7 +2983,7 @@ class Doc:
         if self.items["desc"]:
           for (_, _, desc, _) in self.items["desc"]:
             if desc:
-              output_lines.append(desc.strip() + "\n")
+              output_lines.text(desc.strip() + "\n")
         return
 
       # Type definitions (typedef, callback)
@@ -1668,6 +2995,7 @@ class Doc:
           "value" if self.doc_type == "type" else "type"][0]
         # output_lines.append("")
         output_lines.append(f"#### {text_prefix}{self.id.replace("_", "\\_")}{make_anchor(link_prefix, self.id)}")
+        output_lines.heading(4, f"{text_prefix}{self.id}", f"{link_prefix}-{sanitize_anchor_id(self.id)}")
         output_lines.append("")
 
         # Signature
@@ -1714,12 +3042,20 @@ class Doc:
 
         # output_lines.append("")
         output_lines.append(f"#### {text_prefix}{self.id.replace("_", "\\_")}{make_anchor(link_prefix, self.id)}")
+        output_lines.heading(4, f"{text_prefix}{self.id}", f"{link_prefix}-{sanitize_anchor_id(self.id)}")
         output_lines.append("")
 
         # Signature
         self.output_sig(output_lines, None)
         output_lines.append("")
 
+        # Large literal data is summarized, as the signature doesn't show it.
+        if link_prefix == Doc.SYMBOL_RENDERING_INFO["value"][1]:
+          summary = literal_summary(self.content, self.doc_item[DOC_S_BODY_SLC])
+          if summary:
+            output_lines.append(f"Holds a {format_literal_summary(summary)}.")
+            output_lines.append("")
+
         # Only output description and details if doc exists
         if is_sym_with_doc(self.doc_item):
           # Callchains (explicit or auto-generated for functions that return callbacks)
@@ -1738,25 +3074,58 @@ class Doc:
           self.output_rets(output_lines)
     finally:
       if self.id:
-        output_lines += ['<p align="right">[<a href="#api-table-of-contents">TOC</a>]</p><hr/>\n']
+        output_lines.html('<p align="right">[<a href="#api-table-of-contents">TOC</a>]</p><hr/>\n')
         
+class LibDict(dict[str, Doc]):
+  """
+  A symbol -> doc dict that falls back to the --lib-db for symbols that no file
+  declared.  Docs are only made from the database when looked up.
+  """
+  def __init__(self, kind: "LibDbKind") -> None:
+    super().__init__()
+    self.kind = kind
+
+  def _load(self, name: str) -> Optional[Doc]:
+    if symbols.lib_db is None:
+      return None
+    doc = symbols.lib_db.doc(self.kind, name)
+    if doc is not None:
+      super().__setitem__(name, doc)
+    return doc
+
+  def __missing__(self, name: str) -> Doc:
+    doc = self._load(name)
+    if doc is None:
+      raise KeyError(name)
+    return doc
+
+  def __contains__(self, name: object) -> bool:
+    return super().__contains__(name) or isinstance(name, str) and self._load(name) is not None
+
+  def get(self, name: str, default: Optional[Doc] = None) -> Optional[Doc]: # type: ignore[override]
+    return self[name] if name in self else default
+
 class Symbols:
   """
   Stores the Symbol info collected from the files.
   """
   def __init__(self) -> None:
-    self.type_dict: dict[str, Doc] = {}
+    self.lib_db: Optional["LibDb"] = None
+    "symbols of libraries, from --lib-db"
+    self.type_dict: dict[str, Doc] = LibDict("type")
     "type symbol -> doc"
     self.type_list: list[Doc] = []
     "type symbol docs in order that they appear in source."
+    self.type_undefined: dict[str, list[str]] = {}
+    "undefined type -> the symbols using it"
     self.type_refed: set[str] = set()
     """If type symbol set here, then it's been referenced in the documentation
     somewhere, excludes typedefs."""
-    self.function_dict:   dict[str, Doc] = {}
+    self.function_dict:   dict[str, Doc] = LibDict("function")
     "function symbol -> doc"
-    self.module_dict:     dict[str, Doc] = {}
+    self.module_dict:     dict[str, Doc] = LibDict("module")
     "module symbol -> doc"
-    self.value_dict:      dict[str, Doc] = {}
+    self.value_dict:      dict[str, Doc] = LibDict("value")
     "value symbol -> doc"
     
   def get_callchains(self, symbol_name: str, require_curry: bool = False) -> str:
@@ -1840,81 +3209,86 @@ class Symbols:
     return "    " + " ".join(segs) + f" : {ret_type}"
 
 symbols = Symbols()
-def render_md(filename: str, content: str, output_lines: list[str], items: list[ItemInfo], show_private: bool):
+md_events: list[MdEvent] = []
+"The markdown events of all files rendered, in output order, for --md-events."
+md_pending: list[tuple["MdFile", Optional[str]]] = []
+"Files registered for rendering, with their --write-to-files EXT."
+
+class MdFile:
+  """
+  A file's docs to render.  All files are registered before any is rendered,
+  so types can be used before the file declaring them.
+  """
+  def __init__(self, filename: str) -> None:
+    self.filename = filename
+    self.docs: list[Doc] = []
+    "file docs and symbols, in source order"
+    self.types: list[Doc] = []
+    "types declared in the file"
+
+def register_md(filename: str, content: str, items: list[ItemInfo], show_private: bool) -> MdFile:
+  md_file = MdFile(filename)
   types_start = len(symbols.type_list)
-  type_refed = symbols.type_refed.copy()
 
   for item in items:
     if is_doc(item):
-      doc = Doc(filename, content, item)
+      with profiler.phase("Doc.__init__"):
+        doc = Doc(filename, content, item)
       assert doc.doc_type != "nontype", \
         "Nontypes should have occurred in `if is_sym_with_doc(item):` branch"
       if doc.doc_type == "file":
-        if doc.id and doc.id.startswith("_") and not show_private:
+        if doc.id and doc.id.startswith("_") and not show_private or options["id"]:
           continue
-        doc.output_doc(output_lines)
+        md_file.docs.append(doc)
       # else:
       # Types are printed at the end
     elif is_sym_with_doc(item):
-      doc = Doc(filename, content, item)
-      if doc.id and doc.id.startswith("_") and not show_private:
+      sym_id = content[item[DOC_S_ID_SLC]]
+      # Filter before the JSDoc is parsed.
+      if sym_id.startswith("_") and not show_private or options["id"] and sym_id != options["id"]:
         continue
+      with profiler.symbol(filename, sym_id), profiler.phase("Doc.__init__"):
+        md_file.docs.append(Doc(filename, content, item))
+
+  md_file.types = symbols.type_list[types_start : ]
+  return md_file
+
+def render_md(md_file: MdFile, output_lines: MdLines):
+  filename = md_file.filename
+  type_refed = symbols.type_refed.copy()
+
+  for doc in md_file.docs:
+    with profiler.symbol(filename, doc.id) if doc.id else nullcontext(), profiler.phase("render_md"):
       doc.output_doc(output_lines)
 
   # dry run so that types that reference callbacks will allow callbacks to show
-  for type in symbols.type_list[types_start : ]:
-    type.output_doc([])
+  with profiler.phase("render_md"):
+    for type in md_file.types:
+      type.output_doc(MdLines(filename))
   new_refed = symbols.type_refed - type_refed
 
   # actual output
-  temp_output_lines = []
+  temp_output_lines = MdLines(filename)
   types_output : set[str] = set()
-  for type in symbols.type_list[types_start : ]:
+  for type in md_file.types:
     id = type.id
     assert id
     types_output.add(id)
-    type.output_doc(temp_output_lines)
+    if options["id"] and id != options["id"]:
+      continue
+    with profiler.symbol(filename, id), profiler.phase("render_md"):
+      type.output_doc(temp_output_lines)
 
   # in case type that was declared in a previous file which wasn't referenced
   # directly, is.
-  temp_pre_output_lines = []
+  temp_pre_output_lines = MdLines(filename)
   for type_name in new_refed - types_output:
     symbols.type_dict[type_name].output_doc(temp_pre_output_lines)
 
   # no file header if no output generated
   if temp_output_lines:
-    output_lines.append(f"### {filename} types\n")
-    output_lines += temp_output_lines
-
-  # Prepend emojis to header markers.
-  RE_H2 = regex.compile(r"^(## )(.*)", regex.MULTILINE)
-  RE_H3 = regex.compile(r"^(### )(.*)", regex.MULTILINE)
-  RE_MD_LINKS = regex.compile(
-    r"""
-    (?<!\\)
-    (
-      \[[^\]]++\]
-      \( \#[a-z_-]*
-    )
-    (
-      [ A-Z][^\)]*+\)
-    )
-    """, regex.VERBOSE)
-  
-  def add_h2_emoji_anchor(m):
-    return f"<hr/>\n\n{m.group(1)}📘{m.group(2)}{make_anchor('file', m.group(2))}"
-
-  def add_h3_emoji_and_anchor(m):
-    heading_text = m.group(2)
-    assert isinstance(heading_text, str)
-    return f"{m.group(1)}<i>📑{heading_text}</i>{make_anchor(f'ch-{filename}', heading_text)}"
-
-  for i in range(len(output_lines)):
-    tmp = output_lines[i]
-    tmp = RE_H2.sub(add_h2_emoji_anchor, tmp)
-    tmp = RE_H3.sub(add_h3_emoji_and_anchor, tmp)
-    tmp = RE_MD_LINKS.sub(lambda m: m[1] + fix_for_githubs_fascist_overreach(m[2]), tmp)
-    output_lines[i] = tmp
+    output_lines.text(f"### {filename} types\n")
+    output_lines.extend_md(temp_output_lines)
 
 def render_json(filename: str, item_count: int, content: str, track_ids: dict[str, TrackIds], track_docs: list[tuple[int, str]], track_symbols: list[str], item: ItemInfo) -> int:
   # Generating json representation
@@ -1930,16 +3304,21 @@ def render_json(filename: str, item_count: int, content: str, track_ids: dict[st
 
     global line_char_index
     s_line, e_line = get_lines(item[DOC_SLC], line_char_index)
+    signature = content[item[DOC_S_SIG_SLC]]
+    body      = content[item[DOC_S_BODY_SLC]]
+    doc       = content[item[DOC_S_DOC_SLC]] if is_sym_with_doc(item) else ""
     result: TrackIds = {
-      "filename"  : filename,
-      "order"     : item_count,
-      "type"      : item[DOC_TYPE],
-      "name"      : prefix + content[item[DOC_S_ID_SLC]],
-      "line_start": s_line,
-      "line_end"  : e_line,
-      "signature" : content[item[DOC_S_SIG_SLC]],
-      "body"      : content[item[DOC_S_BODY_SLC]],
-      "doc"       : content[item[DOC_S_DOC_SLC]] if is_sym_with_doc(item) else ""
+      "filename"    : filename,
+      "order"       : item_count,
+      "type"        : item[DOC_TYPE],
+      "name"        : prefix + content[item[DOC_S_ID_SLC]],
+      "line_start"  : s_line,
+      "line_end"    : e_line,
+      "signature"   : signature,
+      "body"        : body,
+      "literal"     : literal_summary(content, item[DOC_S_BODY_SLC]) if prefix == "v-" else None,
+      "doc"         : doc,
+      "fingerprints": get_fingerprints(signature, body, doc),
     }
     # assert track_ids is not None
     assert track_ids is not None
@@ -1957,33 +3336,65 @@ def render_json(filename: str, item_count: int, content: str, track_ids: dict[st
   return item_count
 
 def process_file(filename: str, write_ext: Optional[str], from_stdin: bool = False) -> Optional[Track]:
+  out_text, track, md_file = analyse_file(filename, from_stdin)
+  if md_file is not None:
+    # Rendered and written by render_pending_md() once every file's types are
+    # registered.
+    md_pending.append((md_file, write_ext))
+    return track
+
+  # Output phase
+  # from_stdin is always combined with write_ext=None (enforced above).
+  with profiler.phase("write"):
+    write_output(filename, write_ext, out_text, track)
+
+  return track
+
+def analyse_file(filename: str, from_stdin: bool = False) -> tuple[str, Optional[Track], Optional["MdFile"]]:
+  """
+  Reads and analyses a file.
+
+  Returns
+  -------
+  tuple[str, Optional[Track], Optional[MdFile]]
+      The text to output, the json tracking in json mode and in markdown mode,
+      the file's registered docs instead of text.
+  """
   item_count = 0
 
   content: str
-  if from_stdin:
-    content = sys.stdin.read()
-  else:
-    with open(filename, "r", encoding="utf-8") as f:
-      try:
-        content = f.read()
-      except Exception as e:
-        raise ExceptionGroup(f"While reading '{filename}'", [e])
+  with profiler.phase("read"):
+    if from_stdin:
+      content = sys.stdin.read()
+    else:
+      with open(filename, "r", encoding="utf-8") as f:
+        try:
+          content = f.read()
+        except Exception as e:
+          raise ExceptionGroup(f"While reading '{filename}'", [e])
 
   out_text = ""
   track       : Optional[Track]
-  output_lines: Optional[list[str]]
+  output_lines: Optional[MdLines]
+  md_file     : Optional[MdFile] = None
 
   show = options["show"]
+  content_hash = ""
+  if show == "json" or (args.manifest and not from_stdin):
+    with profiler.phase("hash"):
+      current_hash = hashlib.sha256()
+      current_hash.update(content.encode("utf-8"))
+      content_hash = current_hash.hexdigest()
+    file_hashes[filename] = content_hash
+
   if show == "json":
-    current_hash = hashlib.sha256()
-    current_hash.update(content.encode("utf-8"))
     track = {
       "filenames": {
         filename: {
           "order"    : -1,
           "docs"     : [],
           "symbols"  : [],
-          "hash"     : current_hash.hexdigest(),
+          "hash"     : content_hash,
           "mtime"    : mtime_to_utc(os.path.getmtime(filename))
         }
       },
@@ -1998,14 +3409,19 @@ def process_file(filename: str, write_ext: Optional[str], from_stdin: bool = Fal
     track_ids = None
     track_docs = None
     track_symbols = None
-    output_lines = []
+    output_lines = MdLines(filename)
 
   if len(content):
     global line_char_index
-    line_char_index = get_line_positions(content)
-    items = get_items(content)
+    listing = show in ("id", "sig", "all", "summary")
+    # Listings only need line positions for line ranges and numbers.
+    if not listing or show == "summary" or options["showLineNums"]:
+      with profiler.phase("get_line_positions"):
+        line_char_index = get_line_positions(content)
+    with profiler.phase("get_items"):
+      items = get_items(content, options["regexTimeout"], filename, listing)
 
-    if show == "summary":
+    if show == "summary" or not options["showLineNums"]:
       last_line_digit_count = 0
     else:
       last_line_digit_count = math.floor(math.log(len(line_char_index), 10)) + 1
@@ -2048,8 +3464,7 @@ def process_file(filename: str, write_ext: Optional[str], from_stdin: bool = Fal
           )
 
     if show in ("md", "md-with-private"):
-      assert output_lines is not None
-      render_md(filename, content, output_lines, items, show == "md-with-private")
+      md_file = register_md(filename, content, items, show == "md-with-private")
     else:
 
       for item in items:
@@ -2070,7 +3485,8 @@ def process_file(filename: str, write_ext: Optional[str], from_stdin: bool = Fal
 
         elif show == "json":
           assert track_ids is not None and track_docs is not None and track_symbols is not None
-          item_count = render_json(filename, item_count, content, track_ids, track_docs, track_symbols, item)
+          with profiler.phase("render_json"):
+            item_count = render_json(filename, item_count, content, track_ids, track_docs, track_symbols, item)
           continue
 
         elif show == "sig-doc":
@@ -2100,8 +3516,18 @@ def process_file(filename: str, write_ext: Optional[str], from_stdin: bool = Fal
             case "code":
               disp(item[DOC_SLC])
 
+    if profiler.memory:
+      profiler.symbol_count += sum(1 for item in items if is_symbol(item))
+      profiler.record("item tuples", items)
+      profiler.record("file content", content)
+      if output_lines is not None:
+        profiler.record("output_lines", output_lines)
+
     if output_lines is not None:
       out_text = "\n".join(output_lines)
+      # Listings are lines without a final newline.
+      if out_text and show not in ("md", "md-with-private"):
+        out_text += "\n"
 
       # # This makes sure that the heading for the next file will be separated by
       # # an empty line.  A side effect of this is that the end of the file will
@@ -2109,65 +3535,727 @@ def process_file(filename: str, write_ext: Optional[str], from_stdin: bool = Fal
       # if out_text and not out_text.endswith("\n\n"):
       #   out_text += "\n"
 
+  if show in ("md", "md-with-private"):
+    return out_text, track, md_file or MdFile(filename)
+
   assert out_text == "" or out_text.endswith("\n")
-  # Output phase
-  # from_stdin is always combined with write_ext=None (enforced above).
+  return out_text, track, None
+
+def render_pending_md() -> bool:
+  """
+  Renders and writes the files registered by process_file() in order.
+
+  Returns
+  -------
+  bool
+      False if a type was used that no file defines.  These are reported
+      together.
+  """
+  # Where the next file's output starts in stdout or the --write-to-file file.
+  offset = 0
+  for md_file, write_ext in md_pending:
+    output_lines = MdLines(md_file.filename)
+    with profiler.file(md_file.filename):
+      render_md(md_file, output_lines)
+      if profiler.memory:
+        profiler.record("output_lines", output_lines)
+
+      out_text = output_lines.joined(offset if write_ext is None else 0)
+      md_events.extend(output_lines.events)
+      if out_text and write_ext is None:
+        offset += len(out_text) + len(output_separator())
+      assert out_text == "" or out_text.endswith("\n")
+      with profiler.phase("write"):
+        write_output(md_file.filename, write_ext, out_text, None)
+
+  return report_undefined_types()
+
+def report_undefined_types() -> bool:
+  "Reports the types that were used but not defined.  Returns True if there were none."
+  for type_name, users in symbols.type_undefined.items():
+    print(f"ERROR: Type '{type_name}' is not defined.  Used by {', '.join(users)}.", file=sys.stderr)
+  return not symbols.type_undefined
+
+# In scad_tools/files.py, shared with build-docs.py.
+from scad_tools.files import write_if_changed
+
+out_file_texts: list[str] = []
+"What goes to the --write-to-file file, written once all files are done."
+
+def output_separator() -> str:
+  "What follows a file's output when all files' outputs go together."
+  # markdown is separated from the next file's by an empty line
+  return "\n" if options["show"] in ("md", "md-with-private") else ""
+
+def write_output(filename: str, write_ext: Optional[str], out_text: str, track: Optional[Track]):
+  "Writes a file's output to stdout, the --write-to-file file or <filename>.EXT."
   if write_ext is None:
     if out_text:
       # printing json is done in the caller to merge all json object together.
       if not track:
         if args.out_file:
-          with open(args.out_file, "a", encoding="utf-8") as out_f:
-            out_f.write(out_text)
+          out_file_texts.append(out_text + output_separator())
         else:
-          print(out_text)
+          print(out_text, end=output_separator())
   else:
-    out_name = f"{filename}.{write_ext}"
-    with open(out_name, "w", encoding="utf-8") as out_f:
-      if track:
-        json.dump(track, out_f, indent=2)
-      else:
-        out_f.write(out_text)
+    write_if_changed(f"{filename}.{write_ext}", json.dumps(track, indent=2) if track else out_text)
+
+# ---- adversarial input suite ----
+#
+# In scad_tools/fuzz.py, imported only when it's used.
+
+if args.fuzz is not None:
+  from scad_tools.fuzz import run_fuzz
+  sys.exit(0 if run_fuzz(args.filenames, args.fuzz, args.fuzz_limit, args.fuzz_seed, args.fuzz_out,
+    options["regexTimeout"]) else 1)
+
+# ---- OpenSCAD evaluator ----
+#
+# In scad_tools/evaluator.py, imported only when it's used.
+
+if args.eval:
+  from scad_tools.evaluator import run_eval
+  sys.exit(0 if run_eval(args.filenames) else 1)
+
+# ---- test runner ----
+#
+# In scad_tools/runner.py, imported only when it's used.
+
+if args.run_tests and not args.impact:
+  from scad_tools.runner import run_tests
+  sys.exit(0 if run_tests(args.filenames, args.executor, args.jobs, args.test_timeout, args.test_cache,
+    args.allow_empty_suites) else 1)
+
+# ---- bundler ----
+#
+# In scad_tools/bundler.py, imported only when it's used.
+
+if args.bundle:
+  from scad_tools.bundler import run_bundle
+  sys.exit(0 if run_bundle(args.filenames[0], args.bundle) else 1)
+
+# ---- test impact ----
+#
+# In scad_tools/impact.py, imported only when it's used.
+
+if args.impact:
+  from scad_tools.runner import run_tests
+  from scad_tools.impact import run_impact
+  impacted = run_impact(args.filenames, args.impact, options["show"] == "json", args.allow_empty_suites,
+    not args.run_tests)
+  if impacted is None:
+    sys.exit(1)
+  if args.run_tests:
+    sys.exit(0 if run_tests(args.filenames, args.executor, args.jobs, args.test_timeout, args.test_cache,
+      args.allow_empty_suites, impacted) else 1)
+  sys.exit(0)
+
+# ---- minifier ----
+#
+# In scad_tools/minifier.py, imported only when it's used.
+
+if args.minify:
+  from scad_tools.minifier import run_minify
+  sys.exit(0 if run_minify(args.filenames, args.minify) else 1)
+
+if args.unminify:
+  from scad_tools.minifier import unminify_refs
+  for message_line in sys.stdin:
+    sys.stdout.write(unminify_refs(message_line, args.unminify))
+  sys.exit(0)
+
+# ---- recursion analysis ----
+#
+# In scad_tools/recursion.py, imported only when it's used.
+
+if args.recursion:
+  from scad_tools.recursion import analyse_recursion, recursion_md
+  recursion_infos = analyse_recursion(args.filenames, args.recursion_size)
+  if options["show"] == "json":
+    print(json.dumps({ "size": args.recursion_size, "functions": recursion_infos }, indent=2))
+  else:
+    sys.stdout.writelines(recursion_md(recursion_infos, args.recursion_size))
+  sys.exit(0)
+
+# ---- lint ----
+#
+# In scad_tools/lint.py, imported only when it's used.
+
+if args.lint:
+  from scad_tools.lint import LINT_RULES, run_lint
+  unknown_rules = set(args.lint_rules.split(",")) - { rule.name for rule in LINT_RULES } if args.lint_rules else set()
+  if unknown_rules:
+    parser.error(f"--lint-rules: unknown rule {', '.join(sorted(unknown_rules))}")
+  sys.exit(0 if run_lint(args.filenames, args.lint_rules, options["show"] == "json") else 1)
+
+# ---- load cost ----
+#
+# In scad_tools/load_cost.py, imported only when it's used.
+
+if args.load_cost:
+  from scad_tools.load_cost import run_load_cost
+  sys.exit(0 if run_load_cost(args.filenames, args.load_cost_top, options["show"] == "json") else 1)
+
+# ---- library symbol database ----
+
+import mmap
+import struct
+
+LibDbKind: TypeAlias = Literal["type", "function", "module", "value"]
+
+class LibDbRecord(TypedDict):
+  type    : ItemType
+  "item type of the declaration, \"doc\" for types"
+  file    : str
+  anchor  : str
+  doc_type: str
+  items   : dict[str, list[tuple[str, str, str, str]]]
+  sig     : str
+  "signature of functions, modules and values"
+  id_at   : int
+  "where the id is in sig"
+  params  : Optional[list[tuple[str, str]]]
+
+LIB_DB_ANCHOR_PREFIX: dict[LibDbKind, str] = { "type": "t", "function": "f", "module": "m", "value": "v" }
+
+class LibDb:
+  """
+  A database of a library's linked symbols, written by --write-lib-db.
 
-  return track
+  The file is the magic bytes, the length of a json index and the index,
+  followed by a json record per symbol.  The index maps each kind and name to
+  the offset and length of its record, so loading only parses the index and
+  a record is only read from the memory map when its symbol is looked up.
+  """
+  MAGIC = b"SCADLIB1"
+
+  def __init__(self, filename: str) -> None:
+    with open(filename, "rb") as f_in:
+      self.data = mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ)
+    if self.data[:len(LibDb.MAGIC)] != LibDb.MAGIC:
+      raise ValueError(f"{filename} isn't a --write-lib-db database")
+    (index_len,) = struct.unpack_from("<I", self.data, len(LibDb.MAGIC))
+    self.records_at = len(LibDb.MAGIC) + 4 + index_len
+    index = json.loads(self.data[len(LibDb.MAGIC) + 4 : self.records_at])
+    self.url: str = index["url"]
+    self.offsets: dict[LibDbKind, dict[str, tuple[int, int]]] = index["symbols"]
+
+  def record(self, kind: LibDbKind, name: str) -> Optional[LibDbRecord]:
+    entry = self.offsets[kind].get(name)
+    if entry is None:
+      return None
+    start = self.records_at + entry[0]
+    return json.loads(self.data[start : start + entry[1]])
+
+  def doc(self, kind: LibDbKind, name: str) -> Optional[Doc]:
+    record = self.record(kind, name)
+    return Doc.from_lib_db(name, record, self.url) if record else None
 
-# ---- main loop over all filenames ----
+  @staticmethod
+  def write(filename: str, url: str, records: dict[LibDbKind, dict[str, LibDbRecord]]):
+    offsets: dict[LibDbKind, dict[str, tuple[int, int]]] = {}
+    data: list[bytes] = []
+    at = 0
+    for kind, by_name in records.items():
+      offsets[kind] = {}
+      for name, record in by_name.items():
+        encoded = json.dumps(record, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        offsets[kind][name] = (at, len(encoded))
+        data.append(encoded)
+        at += len(encoded)
+    index = json.dumps({ "url": url, "symbols": offsets }, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    with open(filename, "wb") as f_out:
+      f_out.write(LibDb.MAGIC)
+      f_out.write(struct.pack("<I", len(index)))
+      f_out.write(index)
+      f_out.writelines(data)
+
+def lib_db_record(kind: LibDbKind, name: str, doc: Doc) -> LibDbRecord:
+  record: LibDbRecord = {
+    "type": doc.doc_item[DOC_TYPE],
+    "file": doc.filename,
+    "anchor": f"{LIB_DB_ANCHOR_PREFIX[kind]}-{sanitize_anchor_id(name)}",
+    "doc_type": doc.doc_type,
+    "items": doc.items, # type: ignore[typeddict-item]
+    "sig": "",
+    "id_at": 0,
+    "params": None,
+  }
+  if is_sym_with_doc(doc.doc_item):
+    sig_slc = doc.doc_item[DOC_S_SIG_SLC]
+    record["sig"] = doc.content[sig_slc]
+    record["id_at"] = doc.doc_item[DOC_S_ID_SLC].start - sig_slc.start
+    record["params"] = doc.doc_item[DOC_S_PARAM_LST]
+  return record
+
+def register_files(filenames: list[str]) -> list[MdFile]:
+  "Registers the symbols of the files, private ones included."
+  global line_char_index
+  md_files: list[MdFile] = []
+  for filename in filenames:
+    with open(filename, "r", encoding="utf-8") as f_in:
+      content = f_in.read()
+    line_char_index = get_line_positions(content)
+    md_files.append(register_md(filename, content, get_items(content, options["regexTimeout"], filename), True))
+  return md_files
 
-tracking: list[Track] = []
-hashes_combined: str = ""
+def run_write_lib_db(filenames: list[str], out_file: str, url: str) -> bool:
+  """
+  Registers the symbols of the files, checks that all the types they use are
+  defined and writes them to out_file.
+  """
+  md_files = register_files(filenames)
+
+  # Rendering is what links the types.
+  for md_file in md_files:
+    render_md(md_file, MdLines(md_file.filename))
+  if not report_undefined_types():
+    return False
+
+  records: dict[LibDbKind, dict[str, LibDbRecord]] = {}
+  for kind, docs in (("type", symbols.type_dict), ("function", symbols.function_dict),
+      ("module", symbols.module_dict), ("value", symbols.value_dict)):
+    # Symbols from another --lib-db stay in that one.
+    records[kind] = { name: lib_db_record(kind, name, doc)
+      for name, doc in dict.items(docs) if doc.lib_href is None }
+  LibDb.write(out_file, url, records)
+  print(f"Wrote {sum(len(by_name) for by_name in records.values())} symbols to {out_file}", file=sys.stderr)
+  return True
+
+if args.lib_db is not None:
+  try:
+    symbols.lib_db = LibDb(args.lib_db)
+  except (OSError, ValueError) as e:
+    parser.error(f"--lib-db: {e}")
+
+if args.write_lib_db is not None:
+  sys.exit(0 if run_write_lib_db(args.filenames, args.write_lib_db, args.lib_db_url) else 1)
+
+# ---- symbol search ----
+#
+# In scad_tools/search.py, imported only when it's used.
+
+if args.search is not None or args.write_search_index is not None:
+  from scad_tools.search import run_search
+  sys.exit(0 if run_search(args.filenames, args.search, args.search_limit, options["show"] == "json",
+    args.search_index, args.write_search_index, symbols) else 1)
+
+# ---- change manifest ----
+
+StatTuple: TypeAlias = tuple[int, int, int]
+"(size, mtime_ns, inode)"
+
+class ManifestFile(TypedDict):
+  size    : int
+  mtime_ns: int
+  inode   : int
+  hash    : str
 
-def process_file_helper(fname, i, write_ext, from_stdin=False):
-  global hashes_combined
-  result = process_file(fname, write_ext, from_stdin)
-  if result:
-    result["filenames"][fname]["order"] = i
-    hashes_combined += fname + result["filenames"][fname]["hash"]
-    tracking.append(result)
+class Manifest(TypedDict):
+  version      : int
+  options_hash : str
+  files        : dict[str, ManifestFile]
+  outputs      : dict[str, str]
+  combined_hash: str
 
-if not args.filenames:
-  # stdin mode: content from stdin, output only to stdout
-  process_file_helper("<stdin>", 0, args.write_ext)
-else:
-  hash = hashlib.sha256()
-  if args.out_file:
-    with open(args.out_file, "w", encoding="utf-8") as out_f:
-      pass
-  for i, fname in enumerate(args.filenames):
-    process_file_helper(fname, i, args.write_ext)
+MANIFEST_VERSION = 1
 
-if len(tracking) and args.write_ext is None:
-  # tracked the files in json
-  hash = hashlib.sha256()
-  hash.update(hashes_combined.encode())
+def file_stat(filename: str) -> StatTuple:
+  st = os.stat(filename)
+  return (st.st_size, st.st_mtime_ns, st.st_ino)
+
+def hash_file(filename: str, as_text: bool = False) -> Optional[str]:
+  """
+  sha256 of the file's bytes or None if it can't be read.  If as_text, hashes
+  the utf-8 text as read by process_file(), with newlines translated.
+  """
+  try:
+    if as_text:
+      with open(filename, "r", encoding="utf-8") as f:
+        return hashlib.sha256(f.read().encode("utf-8")).hexdigest()
+    with open(filename, "rb") as f:
+      return hashlib.sha256(f.read()).hexdigest()
+  except (OSError, ValueError):
+    return None
+
+def get_options_hash() -> str:
+  """
+  Hash of everything that affects the output: the options, the input list, the
+  --lib-db file and this script itself.
+  """
+  h = hashlib.sha256()
+  h.update(json.dumps([
+    options, args.write_ext, args.out_file, args.filenames,
+    args.lib_db, args.lib_db and hash_file(args.lib_db)
+  ]).encode("utf-8"))
+  with open(__file__, "rb") as f:
+    h.update(f.read())
+  return h.hexdigest()
+
+def load_manifest(path: str) -> Optional[Manifest]:
+  try:
+    with open(path, "r", encoding="utf-8") as f:
+      manifest = json.load(f)
+  except (OSError, ValueError):
+    return None
+  if not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION:
+    return None
+  return typing.cast(Manifest, manifest)
+
+def stat_unchanged(filename: str) -> bool:
+  "True if the file's stat tuple matches the previous manifest's."
+  if prev_manifest is None or filename not in prev_manifest["files"]:
+    return False
+  entry = prev_manifest["files"][filename]
+  return stats[filename] == (entry["size"], entry["mtime_ns"], entry["inode"])
+
+def output_unchanged(out_name: str) -> bool:
+  "True if the output file exists and matches the hash in the previous manifest."
+  return prev_manifest is not None and out_name in prev_manifest["outputs"] \
+    and hash_file(out_name) == prev_manifest["outputs"][out_name]
+
+def reuse_previous(fname: str, write_ext: Optional[str]) -> tuple[bool, Optional[Track]]:
+  """
+  Tries to reuse a file's output from the previous run without reading it.
+
+  Parameters
+  ----------
+  fname : str
+      File being processed.
+  write_ext : Optional[str]
+      Extension used with --write-to-files.
+
+  Returns
+  -------
+  tuple[bool, Optional[Track]]
+      (reused, track).  If reused, then the file doesn't need to be processed
+      and track is the json tracking for the file, if in json mode.
+  """
+  if not options_unchanged or not stat_unchanged(fname):
+    return False, None
+  if options["show"] in ("md", "md-with-private"):
+    # types declared in the file are needed by the files following it
+    return False, None
+  assert prev_manifest is not None
+
+  if write_ext is not None:
+    if not output_unchanged(f"{fname}.{write_ext}"):
+      return False, None
+    file_hashes[fname] = prev_manifest["files"][fname]["hash"]
+    return True, None
+
+  if prev_shard_index is not None:
+    entry = prev_shard_index["files"].get(fname)
+    if entry is None or entry["hash"] != prev_manifest["files"][fname]["hash"] \
+        or entry["shard"] != shard_name(fname) or not shard_intact(args.shard_dir, entry):
+      return False, None
+    # The shard is left as is, so only what goes into the index is needed.
+    file_hashes[fname] = entry["hash"]
+    return True, {
+      "filenames": { fname: {
+        "order": -1, "docs": [], "symbols": entry["symbols"], "hash": entry["hash"], "mtime": entry["mtime"]
+      } },
+      "ids": {}
+    }
+
+  if prev_output is None or fname not in prev_output["filenames"]:
+    return False, None
+  file_hashes[fname] = prev_manifest["files"][fname]["hash"]
+  return True, {
+    "filenames": { fname: prev_output["filenames"][fname] },
+    "ids": { id: info for id, info in prev_output["ids"].items() if info["filename"] == fname }
+  }
+
+def write_manifest(path: str, write_ext: Optional[str]):
+  outputs: dict[str, str] = {}
+  out_names = [f"{fname}.{write_ext}" for fname in args.filenames] if write_ext else \
+    [args.out_file] if args.out_file else \
+    shard_outputs(args.shard_dir, args.filenames) if args.shard_dir else []
+  for out_name in out_names:
+    out_hash = hash_file(out_name)
+    if out_hash:
+      outputs[out_name] = out_hash
+
+  combined = hashlib.sha256()
+  for fname in args.filenames:
+    combined.update((fname + file_hashes[fname]).encode("utf-8"))
+
+  manifest: Manifest = {
+    "version"      : MANIFEST_VERSION,
+    "options_hash" : options_hash,
+    "files"        : {
+      fname: {
+        "size"    : stats[fname][0],
+        "mtime_ns": stats[fname][1],
+        "inode"   : stats[fname][2],
+        "hash"    : file_hashes[fname],
+      } for fname in args.filenames
+    },
+    "outputs"      : outputs,
+    "combined_hash": combined.hexdigest(),
+  }
+  with open(path, "w", encoding="utf-8") as f_out:
+    json.dump(manifest, f_out, indent=2)
+
+def is_up_to_date() -> bool:
+  """
+  True if the inputs, options and outputs are all unchanged since the
+  previous run.  Inputs with changed stat data are hashed to check if their
+  content really changed.
+  """
+  if prev_manifest is None or not options_unchanged or not prev_manifest["outputs"]:
+    return False
+  for fname in args.filenames:
+    if stat_unchanged(fname):
+      file_hashes[fname] = prev_manifest["files"][fname]["hash"]
+    elif options["show"] == "json":
+      # json output includes each file's mtime
+      return False
+    else:
+      file_hash = hash_file(fname, True)
+      if fname not in prev_manifest["files"] or file_hash != prev_manifest["files"][fname]["hash"]:
+        return False
+      assert file_hash
+      file_hashes[fname] = file_hash
+  return all(output_unchanged(out_name) for out_name in prev_manifest["outputs"])
+
+# ---- sharded json ----
+
+SHARD_INDEX = "index.json"
+
+def shard_name(filename: str) -> str:
+  """
+  Shard file name for a source file, relative to the shard directory.  The
+  base name keeps it recognizable and a hash of the normalized relative path
+  keeps files with the same base name, or paths that only differ in
+  characters that can't go in a file name, apart.
+  """
+  path = os.path.relpath(filename).replace("\\", "/")
+  base = regex.sub(r"[^\w.-]", "_", os.path.basename(path))
+  return f"{base}-{hashlib.sha256(path.encode('utf-8')).hexdigest()[:16]}.json"
+
+def shard_intact(shard_dir: str, entry: TrackIndexFile) -> bool:
+  "True if the shard still has the bytes that the index recorded for it."
+  return "shard_hash" in entry and hash_file(os.path.join(shard_dir, entry["shard"])) == entry["shard_hash"]
+
+def shard_outputs(shard_dir: str, filenames: list[str]) -> list[str]:
+  return [os.path.join(shard_dir, SHARD_INDEX)] + \
+    [os.path.join(shard_dir, shard_name(fname)) for fname in filenames]
+
+def load_shard_index(shard_dir: str) -> Optional[TrackIndex]:
+  try:
+    with open(os.path.join(shard_dir, SHARD_INDEX), "r", encoding="utf-8") as f:
+      return json.load(f)
+  except (OSError, ValueError):
+    return None
+
+def write_shards(shard_dir: str, merged: TrackFull, prev_index: Optional[TrackIndex]):
+  """
+  Writes a shard per file and the index.  Shards of files whose hash is the
+  same as in prev_index are left as they are.
+
+  Parameters
+  ----------
+  shard_dir : str
+      Directory to write to.
+  merged : TrackFull
+      Merged tracking of all of the files.  Files that weren't reprocessed
+      have no ids in it.
+  prev_index : Optional[TrackIndex]
+      The index from the previous run.
+  """
+  os.makedirs(shard_dir, exist_ok=True)
+  index: TrackIndex = {
+    "files"        : {},
+    "ids"          : {},
+    "hash_algo"    : merged["hash_algo"],
+    "combined_hash": merged["combined_hash"],
+    "mtime"        : merged["mtime"],
+  }
+  for filename, fn_obj in merged["filenames"].items():
+    shard = shard_name(filename)
+    for id in fn_obj["symbols"]:
+      assert id not in index["ids"], \
+        f"id {id} cannot be added twice.  Found in shards {index['ids'][id]} and {shard}"
+      index["ids"][id] = shard
+
+    shard_path = os.path.join(shard_dir, shard)
+    prev_entry = prev_index["files"].get(filename) if prev_index else None
+    if prev_entry and prev_entry["hash"] == fn_obj["hash"] and prev_entry["mtime"] == fn_obj["mtime"] \
+        and prev_entry["shard"] == shard and shard_intact(shard_dir, prev_entry):
+      shard_hash = prev_entry["shard_hash"]
+    else:
+      track_shard: TrackShard = {
+        "filename": filename,
+        "hash"    : fn_obj["hash"],
+        "mtime"   : fn_obj["mtime"],
+        "docs"    : fn_obj["docs"],
+        "symbols" : fn_obj["symbols"],
+        "ids"     : { id: merged["ids"][id] for id in fn_obj["symbols"] },
+      }
+      write_if_changed(shard_path, json.dumps(track_shard, indent=2))
+      written_hash = hash_file(shard_path)
+      assert written_hash is not None
+      shard_hash = written_hash
+
+    index["files"][filename] = {
+      "order"     : fn_obj["order"],
+      "shard"     : shard,
+      "shard_hash": shard_hash,
+      "hash"      : fn_obj["hash"],
+      "mtime"     : fn_obj["mtime"],
+      "symbols"   : fn_obj["symbols"],
+    }
+
+  write_if_changed(os.path.join(shard_dir, SHARD_INDEX), json.dumps(index, indent=2))
+
+file_hashes: dict[str, str] = {}
+"filename -> content hash of files processed or reused"
+stats: dict[str, StatTuple] = {}
+"filename -> stat tuple taken before the file was read"
+prev_manifest: Optional[Manifest] = None
+prev_output: Optional[TrackFull] = None
+"Previous merged json output, if it can be reused."
+prev_shard_index: Optional[TrackIndex] = load_shard_index(args.shard_dir) if args.shard_dir else None
+"Previous shard index, if writing shards."
+options_hash = ""
+options_unchanged = False
+
+# ---- api diff ----
+
+def load_snapshot(path: str) -> dict[str, TrackIds]:
+  """
+  Loads the symbols of a snapshot, which can be a --show json file, a
+  --shard-dir directory or a directory tree of sources.
+
+  Parameters
+  ----------
+  path : str
+      Snapshot to load.
+
+  Returns
+  -------
+  dict[str, TrackIds]
+      Symbol id -> symbol info.  Filenames in a source tree are relative to
+      path.
+  """
+  if os.path.isfile(path):
+    with open(path, "r", encoding="utf-8") as f:
+      return json.load(f)["ids"]
+
+  index = load_shard_index(path)
+  if index is not None:
+    ids: dict[str, TrackIds] = {}
+    for entry in index["files"].values():
+      with open(os.path.join(path, entry["shard"]), "r", encoding="utf-8") as f:
+        ids.update(json.load(f)["ids"])
+    return ids
+
+  # A tree of sources.  Library files are extensionless or .scad.
+  ids = {}
+  duplicates: set[str] = set()
+  for dir_path, dir_names, file_names in os.walk(path):
+    dir_names[:] = sorted(d for d in dir_names if not d.startswith("."))
+    for file_name in sorted(file_names):
+      _, ext = os.path.splitext(file_name)
+      if file_name.startswith(".") or ext not in ("", ".scad"):
+        continue
+      track = process_file(os.path.join(dir_path, file_name), None)
+      assert track is not None
+      for id, info in track["ids"].items():
+        info["filename"] = os.path.relpath(info["filename"], path)
+        if id in ids:
+          duplicates.add(id)
+        ids[id] = info
+  if duplicates:
+    print(f"WARNING: {path}: defined in more than one file, using the last: "
+      f"{', '.join(sorted(duplicates))}", file=sys.stderr)
+  return ids
+
+def diff_snapshots(old: dict[str, TrackIds], new: dict[str, TrackIds]) -> dict[str, list[str]]:
+  """
+  Compares symbols by their fingerprints.  Fingerprints missing from older
+  json snapshots are computed from the symbol's text.
+
+  Parameters
+  ----------
+  old : dict[str, TrackIds]
+      Symbols before.
+  new : dict[str, TrackIds]
+      Symbols after.
+
+  Returns
+  -------
+  dict[str, list[str]]
+      Category -> sorted symbol ids.  A symbol can be in more than one of the
+      changed categories.
+  """
+  def prints(info: TrackIds) -> Fingerprints:
+    return info.get("fingerprints") or get_fingerprints(info["signature"], info["body"], info["doc"])
+
+  result: dict[str, list[str]] = {
+    "added"            : sorted(new.keys() - old.keys()),
+    "removed"          : sorted(old.keys() - new.keys()),
+    "changed-signature": [],
+    "changed-body"     : [],
+    "changed-doc"      : [],
+  }
+  for id in sorted(old.keys() & new.keys()):
+    old_prints, new_prints = prints(old[id]), prints(new[id])
+    for part in ("signature", "body", "doc"):
+      if old_prints[part] != new_prints[part]:
+        result[f"changed-{part}"].append(id)
+  return result
+
+if args.diff:
+  # Source trees are analysed as json.
+  options["show"] = "json"
+  print(json.dumps(diff_snapshots(load_snapshot(args.diff[0]), load_snapshot(args.diff[1])), indent=2))
+  sys.exit(0)
+
+if args.manifest:
+  prev_manifest = load_manifest(args.manifest)
+  options_hash = get_options_hash()
+  options_unchanged = prev_manifest is not None and prev_manifest["options_hash"] == options_hash
+  for fname in args.filenames:
+    stats[fname] = file_stat(fname)
+
+  if is_up_to_date():
+    if any(not stat_unchanged(fname) for fname in args.filenames):
+      # touched but not changed
+      write_manifest(args.manifest, args.write_ext)
+    sys.exit(0)
+
+  if options_unchanged and options["show"] == "json" and args.out_file \
+      and output_unchanged(args.out_file):
+    with open(args.out_file, "r", encoding="utf-8") as f_in:
+      prev_output = json.load(f_in)
+
+# ---- api timeline ----
+#
+# In scad_tools/timeline.py, imported only when it's used.
+
+if args.timeline is not None:
+  from scad_tools.timeline import run_timeline
+  sys.exit(0 if run_timeline(args.timeline, args.filenames, options["regexTimeout"]) else 1)
+
+# ---- merged json ----
+
+def merge_tracks(tracks: list[Track]) -> TrackFull:
+  "Merges the json tracking of the files, in order, into one."
+  combined = hashlib.sha256()
+  for tracked in tracks:
+    for filename, fn_obj in tracked["filenames"].items():
+      combined.update((filename + fn_obj["hash"]).encode())
   merged_tracking: TrackFull = {
     "filenames": {},
     "ids": {},
     "hash_algo": "sha256",
-    "combined_hash": hash.hexdigest(),
+    "combined_hash": combined.hexdigest(),
     "mtime": ""
   }
   # merge tracking together into one.
-  for tracked in tracking:
+  for tracked in tracks:
     # merge filenames together
     for filename in tracked["filenames"]:
       assert filename not in merged_tracking["filenames"], \
@@ -2184,25 +4272,258 @@ if len(tracking) and args.write_ext is None:
         f"  {merged_tracking['ids'][id]['filename']}\n" \
         f"  {tracked['ids'][id]['filename']}"
       merged_tracking["ids"][id] = tracked["ids"][id]
+  return merged_tracking
 
-  if args.out_file is None:
+def write_json_out(out_file: str, merged_tracking: TrackFull):
+  "Writes the merged json to out_file, if it changed, and logs its creation."
+  with profiler.phase("json dump"):
+    text = json.dumps(merged_tracking, indent=2)
+    if not write_if_changed(out_file, text):
+      return
+
+  data_bytes = text.encode("utf-8")
+
+  with open("track_creation.log", "a", encoding="utf-8") as f_out:
+    json.dump(
+      {
+        "mtime": mtime_to_utc(os.path.getmtime(out_file)),
+        "len": len(data_bytes),
+        "hash": hashlib.sha256(data_bytes).hexdigest()
+      }, f_out
+    )
+    f_out.write("\n")
+
+# ---- watch mode ----
+
+def watch_dependencies(filename: str) -> set[str]:
+  "The files that filename uses or includes, transitively, as absolute paths."
+  from scad_tools.evaluator import RE_LIBRARY_PATH, find_library, scad_source
+  found: set[str] = set()
+  pending = [os.path.abspath(filename)]
+  while pending:
+    path = pending.pop()
+    try:
+      src = scad_source(path)
+    except OSError:
+      continue
+    for item in src.items:
+      if item[DOC_TYPE] in ("use", "include"):
+        m = RE_LIBRARY_PATH.search(src.content, item[DOC_SLC].start, item[DOC_SLC].stop)
+        used = find_library(m[1], os.path.dirname(path)) if m else None
+        if used and used not in found:
+          found.add(used)
+          pending.append(used)
+  found.discard(os.path.abspath(filename))
+  return found
+
+def watch_stat(path: str) -> Optional[StatTuple]:
+  try:
+    return file_stat(path)
+  except OSError:
+    return None
+
+def unregister_md(md_file: MdFile):
+  "Removes the symbols that register_md() registered for md_file."
+  for doc in md_file.types:
+    if dict.get(symbols.type_dict, doc.id) is doc:
+      del symbols.type_dict[doc.id]
+    symbols.type_list.remove(doc)
+  for doc in md_file.docs:
+    for docs in (symbols.function_dict, symbols.module_dict, symbols.value_dict):
+      if dict.get(docs, doc.id) is doc:
+        del docs[doc.id]
+
+def run_watch(filenames: list[str], interval: float, debounce: float) -> bool:
+  """
+  Analyses the files and writes the outputs, then polls the files and the
+  files they use or include for changes.  Once a burst of changes has been
+  quiet for debounce seconds, only the changed files and those depending on
+  them are analysed again.  Everything else stays parsed and registered, and
+  only outputs whose text changed are rewritten.  Runs until interrupted.
+  """
+  is_md = options["show"] in ("md", "md-with-private")
+  texts: dict[str, str] = {}
+  tracks: dict[str, Track] = {}
+  md_files: dict[str, MdFile] = {}
+  dependencies: dict[str, set[str]] = {}
+  written: dict[str, str] = {}
+  "output -> text last written to it"
+
+  def analyse(filename: str) -> bool:
+    if filename in md_files:
+      unregister_md(md_files.pop(filename))
+    try:
+      out_text, track, md_file = analyse_file(filename)
+    except Exception as e:
+      print(f"ERROR: {filename}: {type(e).__name__}: {e}", file=sys.stderr)
+      return False
+    texts[filename] = out_text
+    if track:
+      track["filenames"][filename]["order"] = filenames.index(filename)
+      tracks[filename] = track
+    if md_file:
+      md_files[filename] = md_file
+    dependencies[filename] = watch_dependencies(filename)
+    return True
+
+  def write(out_name: str, text: str) -> int:
+    if written.get(out_name) == text:
+      return 0
+    written[out_name] = text
+    return int(write_if_changed(out_name, text))
+
+  def emit() -> int:
+    "Writes the outputs that changed and returns how many there were."
+    if is_md:
+      symbols.type_undefined.clear()
+      md_events.clear()
+      offset = 0
+      for filename in filenames:
+        output_lines = MdLines(filename)
+        render_md(md_files[filename], output_lines)
+        texts[filename] = output_lines.joined(offset if args.write_ext is None else 0)
+        md_events.extend(output_lines.events)
+        if texts[filename]:
+          offset += len(texts[filename]) + len(output_separator())
+      report_undefined_types()
+
+    count = 0
+    if args.write_ext is not None:
+      for filename in filenames:
+        text = json.dumps(tracks[filename], indent=2) if filename in tracks else texts[filename]
+        count += write(f"{filename}.{args.write_ext}", text)
+    elif options["show"] == "json":
+      merged_tracking = merge_tracks([ tracks[filename] for filename in filenames ])
+      text = json.dumps(merged_tracking, indent=2)
+      if written.get(args.out_file) != text:
+        write_json_out(args.out_file, merged_tracking)
+        written[args.out_file] = text
+        count += 1
+    else:
+      count += write(args.out_file, "".join(texts[filename] + output_separator()
+        for filename in filenames if texts[filename]))
+    if args.md_events:
+      write(args.md_events, json.dumps(md_events, indent=2))
+    return count
+
+  def snapshot() -> dict[str, Optional[StatTuple]]:
+    paths = { os.path.abspath(filename) for filename in filenames }
+    for used in dependencies.values():
+      paths |= used
+    return { path: watch_stat(path) for path in paths }
+
+  ok = all([ analyse(filename) for filename in filenames ])
+  last = snapshot()
+  print(f"Watching {len(last)} files.  Wrote {emit() if ok else 0} outputs.", file=sys.stderr)
+  try:
+    while True:
+      time.sleep(interval)
+      now = snapshot()
+      if now == last:
+        continue
+      # Let a burst of saves settle.
+      quiet_since = time.monotonic()
+      while time.monotonic() - quiet_since < debounce:
+        time.sleep(min(interval, debounce))
+        again = snapshot()
+        if again != now:
+          now = again
+          quiet_since = time.monotonic()
+
+      start = time.perf_counter()
+      changed = { path for path in now.keys() | last.keys() if now.get(path) != last.get(path) }
+      # An input's analysis only reads the input itself, so a changed input
+      # leaves the files using it alone.  Other changed files are only watched
+      # through the inputs using them.
+      inputs = { os.path.abspath(filename) for filename in filenames }
+      redo = [ filename for filename in filenames
+        if os.path.abspath(filename) in changed or dependencies.get(filename, set()) & (changed - inputs) ]
+      ok = all([ analyse(filename) for filename in redo ]) and len(md_files if is_md else texts) == len(filenames)
+      if not ok:
+        print("Outputs are left as they were until the errors are fixed.", file=sys.stderr)
+      else:
+        count = emit()
+        print(f"Analysed {', '.join(redo) or 'nothing'} and wrote {count} outputs "
+          f"in {(time.perf_counter() - start) * 1000:.0f} ms.", file=sys.stderr)
+      # Keep what was seen, so changes made during the rebuild aren't missed.
+      last = { path: now[path] if path in now else watch_stat(path) for path in snapshot() }
+  except KeyboardInterrupt:
+    return True
+
+if args.watch:
+  sys.exit(0 if run_watch(args.filenames, args.watch_interval, args.watch_debounce) else 1)
+
+# ---- main loop over all filenames ----
+
+tracking: list[Track] = []
+
+def process_file_helper(fname, i, write_ext, from_stdin=False):
+  with profiler.file(fname):
+    reused, result = reuse_previous(fname, write_ext) if args.manifest else (False, None)
+    if not reused:
+      result = process_file(fname, write_ext, from_stdin)
+  if result:
+    result["filenames"][fname]["order"] = i
+    tracking.append(result)
+
+cprofile = None
+if args.profile_out:
+  import cProfile
+  cprofile = cProfile.Profile()
+  cprofile.enable()
+
+if not args.filenames:
+  # stdin mode: content from stdin, output only to stdout
+  process_file_helper("<stdin>", 0, args.write_ext)
+else:
+  for i, fname in enumerate(args.filenames):
+    process_file_helper(fname, i, args.write_ext)
+
+md_rendered = render_pending_md()
+
+if len(tracking) and args.write_ext is None:
+  # tracked the files in json
+  merged_tracking = merge_tracks(tracking)
+
+  if args.shard_dir:
+    with profiler.phase("json dump"):
+      write_shards(args.shard_dir, merged_tracking, prev_shard_index)
+  elif args.out_file is None:
     # output json to stdout
-    print(json.dumps(merged_tracking, indent=2))
+    with profiler.phase("json dump"):
+      print(json.dumps(merged_tracking, indent=2))
   else:
     # output json to a single file
-    with open(args.out_file, "w", encoding="utf-8") as f_out:
-      json.dump(merged_tracking, f_out, indent=2)
-
-    with open(args.out_file, "rb") as f_in:
-      data_bytes = f_in.read()
-
-    with open("track_creation.log", "a", encoding="utf-8") as f_out:
-      json.dump(
-        {
-          "mtime": mtime_to_utc(os.path.getmtime(args.out_file)),
-          "len": len(data_bytes),
-          "hash": hashlib.sha256(data_bytes).hexdigest()
-        }, f_out
-      )
-      f_out.write("\n")
-
+    write_json_out(args.out_file, merged_tracking)
+elif args.out_file and args.write_ext is None:
+  write_if_changed(args.out_file, "".join(out_file_texts))
+
+if args.md_events:
+  write_if_changed(args.md_events, json.dumps(md_events, indent=2))
+
+if args.manifest:
+  write_manifest(args.manifest, args.write_ext)
+
+if cprofile:
+  cprofile.disable()
+  import pstats
+  with open(args.profile_out, "w", encoding="utf-8") as f_out:
+    write_collapsed_stacks(pstats.Stats(cprofile), f_out)
+
+if args.profile is not None:
+  profiler.report(args.profile, sys.stderr)
+
+if args.mem_report:
+  seen: set[int] = set()
+  registered = [ *symbols.type_list, *symbols.function_dict.values(),
+    *symbols.module_dict.values(), *symbols.value_dict.values() ]
+  for doc in {builtins.id(doc): doc for doc in registered}.values():
+    profiler.record("Doc.items", doc.items, seen)
+  profiler.record("symbols dicts", [ symbols.type_dict, symbols.type_list, symbols.type_refed,
+    symbols.function_dict, symbols.module_dict, symbols.value_dict ])
+  profiler.record("tracking", tracking)
+  if not profiler.report_memory(sys.stderr, args.mem_budget):
+    sys.exit(1)
+
+if not md_rendered:
+  sys.exit(1)
@@ -0,0 +1,7 @@
+"""
+The parts of scad-analysis.py that only some of its options use.  A module is
+imported when one of its options is given, so that listings and docs don't pay
+for compiling it.  What they share with the script, they import from it as
+the scad_analysis module.  files and markdown hold what build-docs.py shares
+with the script and import nothing from it.
+"""
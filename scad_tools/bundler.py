@@ -0,0 +1,318 @@
+"""
+Tree-shaking single-file bundler for --bundle.
+"""
+import builtins
+import os
+import regex
+import sys
+import typing
+from typing import Optional
+
+from scad_analysis import CharSlice, DOC_SLC, DOC_S_ID_SLC, DOC_TYPE, ItemInfo, ItemType, is_symbol
+from scad_tools.evaluator import (
+  RE_LIBRARY_PATH, ScadError, ScadParser, ScadSource, find_library, library_candidates, scad_source,
+)
+from scad_tools.files import write_if_changed
+
+BUNDLE_KEYWORDS = frozenset((
+  "function", "module", "let", "for", "intersection_for", "each", "if", "else",
+  "assert", "echo", "true", "false", "undef",
+))
+
+class BundleSymbol:
+  "A top level function, module or value that may go into a bundle."
+  def __init__(self, kind: ItemType, name: str, src: ScadSource, item: ItemInfo, unit: "BundleUnit"):
+    self.kind = kind
+    self.name = name
+    self.src = src
+    self.item = item
+    self.slc: CharSlice = item[DOC_SLC]
+    self.id_slc: CharSlice = item[DOC_S_ID_SLC] # type: ignore[misc]
+    self.unit = unit
+    "Where names in the symbol are looked up.  For an included file, the first unit that reached it."
+    self.emit_name = name
+
+class BundleUnit:
+  "A file and what it includes, with the symbols it can see."
+  def __init__(self, filename: str):
+    self.filename = filename
+    self.symbols: dict[ItemType, dict[str, BundleSymbol]] = { "function": {}, "module": {}, "value": {} }
+    self.uses: list["BundleUnit"] = []
+    self.sources: list[tuple[ScadSource, list[ItemInfo]]] = []
+    self.missing: set[str] = set()
+    "Absolute paths where libraries that can't be opened were looked for"
+
+  def callable(self, kind: ItemType, name: str) -> Optional[BundleSymbol]:
+    "Own functions or modules hide used ones.  An earlier use hides a later one."
+    if name in self.symbols[kind]:
+      return self.symbols[kind][name]
+    for used in self.uses:
+      if name in used.symbols[kind]:
+        return used.symbols[kind][name]
+    return None
+
+def load_bundle_unit(filename: str, units: dict[str, BundleUnit],
+    known: dict[tuple[str, int], BundleSymbol]) -> BundleUnit:
+  """
+  Loads a file, the files it includes in place and the files it uses.
+
+  Parameters
+  ----------
+  filename : str
+      File to load.
+  units : dict[str, BundleUnit]
+      Units already loaded, by absolute path.
+  known : dict[tuple[str, int], BundleSymbol]
+      Symbols by where they are defined, so that a file included by several
+      units gives the same symbols.
+
+  Returns
+  -------
+  BundleUnit
+      The loaded file.
+  """
+  key = os.path.abspath(filename)
+  if key in units:
+    return units[key]
+  unit = units[key] = BundleUnit(key)
+  use_paths: list[str] = []
+
+  def add_file(path: str, depth: int) -> None:
+    src = scad_source(path)
+    content = src.content
+    unit.sources.append((src, src.items))
+    for item in src.items:
+      kind, slc = item[DOC_TYPE], item[DOC_SLC]
+      if kind == "use" or kind == "include":
+        m = RE_LIBRARY_PATH.search(content, slc.start, slc.stop)
+        assert m
+        found = find_library(m[1], os.path.dirname(path))
+        if found is None:
+          print(f"WARNING: {src.filename}:{src.line(slc.start)}: Can't open library '{m[1]}'.", file=sys.stderr)
+          unit.missing.update(library_candidates(m[1], os.path.dirname(path)))
+        elif kind == "use":
+          use_paths.append(found)
+        elif depth < 100:
+          add_file(found, depth + 1)
+      elif is_symbol(item):
+        name = content[item[DOC_S_ID_SLC]]
+        sym = known.setdefault((path, slc.start), BundleSymbol(kind, name, src, item, unit))
+        unit.symbols[kind][name] = sym
+
+  add_file(key, 0)
+  for path in use_paths:
+    unit.uses.append(load_bundle_unit(path, units, known))
+  return unit
+
+def item_tokens(src: ScadSource, item: ItemInfo) -> list[tuple[str, typing.Any, int]]:
+  "Tokens of an item, from its cached AST if it's a symbol that parses."
+  if is_symbol(item):
+    try:
+      return src.ast(item).tokens
+    except ScadError:
+      pass
+  return ScadParser(src, item[DOC_SLC]).tokens
+
+def bundle_references(src: ScadSource, item: ItemInfo, after: int = 0) -> typing.Iterator[tuple[int, str, bool]]:
+  """
+  (position, name, is called) of the names in an item from after that refer
+  to something outside of it, in source order.
+
+  Names bound in the item by parameters, let, for and function literals, or
+  assigned in a module's block, refer to those binders where they're in scope.
+  Names of named arguments and members don't refer to anything.  An item that
+  doesn't parse gives all of its names instead.
+  """
+  try:
+    if is_symbol(item):
+      ast = src.ast(item)
+      params, root = ast.params, ast.root
+    else:
+      params, root = [], ScadParser(src, item[DOC_SLC]).statements_to_end()
+  except ScadError:
+    tokens = item_tokens(src, item)
+    for (kind, text, pos), (next_kind, next_text, _) in zip(tokens, tokens[1:]):
+      if kind == "name" and pos >= after and text not in BUNDLE_KEYWORDS:
+        yield pos, text, next_kind == "op" and next_text == "("
+    return
+  found: list[tuple[int, str, bool]] = []
+
+  def walk_assigns(assigns: list, bound: frozenset[str]) -> frozenset[str]:
+    for name, value in assigns:
+      if value is not None:
+        walk(value, bound)
+      bound = bound | { name }
+    return bound
+
+  def walk(node: typing.Any, bound: frozenset[str]) -> None:
+    kind = node[0]
+    if kind == "var":
+      if node[1] not in bound:
+        found.append((node[2], node[1], False))
+    elif kind == "call":
+      if node[1][0] != "var":
+        walk(node[1], bound)
+      elif node[1][1] not in bound:
+        found.append((node[1][2], node[1][1], True))
+      for _, arg in node[2]:
+        walk(arg, bound)
+    elif kind == "assert" or kind == "echo" or kind == "assert_stmt" or kind == "echo_stmt":
+      for _, arg in node[1]:
+        walk(arg, bound)
+      if node[2] is not None:
+        walk(node[2], bound)
+    elif kind == "inst":
+      found.append((node[4], node[1], True))
+      for _, arg in node[2]:
+        walk(arg, bound)
+      if node[3] is not None:
+        walk(node[3], bound)
+    elif kind == "let" or kind == "let_elem" or kind == "for" or kind == "lambda" \
+        or kind == "for_stmt" or kind == "let_stmt":
+      walk(node[2], walk_assigns(node[1], bound))
+    elif kind == "cfor":
+      loop = walk_assigns(node[1], bound)
+      walk(node[2], loop)
+      walk_assigns(node[3], loop)
+      walk(node[4], loop)
+    elif kind == "block":
+      # Assignments in a block hold for all of it.
+      inner = bound | { stmt[1] for stmt in node[1] if stmt[0] == "assign" }
+      for stmt in node[1]:
+        walk(stmt, inner)
+    elif kind == "assign":
+      walk(node[2], bound)
+    else:
+      for member in node[1:]:
+        if isinstance(member, tuple):
+          walk(member, bound)
+        elif isinstance(member, list):
+          for el in member:
+            walk(el, bound)
+
+  walk(root, walk_assigns(params, frozenset()))
+  yield from sorted(ref for ref in found if ref[0] >= after)
+
+def bundle_resolve(unit: BundleUnit, name: str, is_call: bool) -> list[BundleSymbol]:
+  """
+  Symbols that a name can refer to.  Values aren't visible through use, but
+  a value holding a function literal can be called.
+  """
+  found = [unit.symbols["value"][name]] if name in unit.symbols["value"] else []
+  if is_call:
+    for kind in ("function", "module"):
+      sym = unit.callable(kind, name) # type: ignore[arg-type]
+      if sym is not None:
+        found.append(sym)
+  return found
+
+def run_bundle(design: str, out_file: str) -> bool:
+  """
+  Writes a single file with the design and only the library symbols that it
+  needs, transitively.  Library symbols whose names collide with the design's
+  or with each other's are renamed, along with the references to them.
+
+  Parameters
+  ----------
+  design : str
+      The design file.
+  out_file : str
+      File to write, or - for stdout.
+
+  Returns
+  -------
+  bool
+      True on success.
+  """
+  units: dict[str, BundleUnit] = {}
+  known: dict[tuple[str, int], BundleSymbol] = {}
+  try:
+    root = load_bundle_unit(design, units, known)
+  except OSError as e:
+    print(f"ERROR: {e}", file=sys.stderr)
+    return False
+  root_src, root_items = root.sources[0]
+
+  # Everything in the design is kept.  What it refers to is found breadth
+  # first so that nearer symbols keep their names.
+  needed: dict[BundleSymbol, None] = {}
+  pending: list[tuple[BundleUnit, ScadSource, ItemInfo]] = [
+    (root, root_src, item) for item in root_items
+    if item[DOC_TYPE] in ("function", "module", "value", "cmd")]
+  design_symbols = { builtins.id(sym) for sym in known.values() if sym.src is root_src }
+  i = 0
+  while i < len(pending):
+    unit, src, item = pending[i]
+    i += 1
+    for _, name, is_call in bundle_references(src, item):
+      for sym in bundle_resolve(unit, name, is_call):
+        if sym not in needed and builtins.id(sym) not in design_symbols:
+          needed[sym] = None
+          pending.append((sym.unit, sym.src, sym.item))
+
+  taken: dict[str, set[str]] = { kind: set(names) for kind, names in root.symbols.items() }
+  for kind in taken:
+    taken[kind] -= { name for name, sym in root.symbols[kind].items() if sym.src is not root_src }
+  for sym in needed:
+    if sym.name in taken[sym.kind]:
+      stem = regex.sub(r"\W", "_", os.path.splitext(os.path.basename(sym.src.filename))[0])
+      sym.emit_name = f"{sym.name}_{stem}"
+      n = 2
+      while sym.emit_name in taken[sym.kind]:
+        sym.emit_name = f"{sym.name}_{stem}{n}"
+        n += 1
+    taken[sym.kind].add(sym.emit_name)
+
+  def rewrite(sym: BundleSymbol) -> str:
+    content = sym.src.content
+    edits = [(sym.id_slc.start, sym.id_slc.stop, sym.emit_name)]
+    for pos, name, is_call in bundle_references(sym.src, sym.item, sym.id_slc.stop):
+      targets = bundle_resolve(sym.unit, name, is_call)
+      if targets and targets[0].emit_name != name:
+        edits.append((pos, pos + len(name), targets[0].emit_name))
+    text, last = [], sym.slc.start
+    for start, stop, replacement in sorted(edits):
+      text += [content[last:start], replacement]
+      last = stop
+    text.append(content[last:sym.slc.stop])
+    return "".join(text)
+
+  # Library symbols grouped by file in the order the files were reached, so
+  # that values stay after the values that they use.
+  order = { sym.src.filename: None for sym in needed }
+  by_file = sorted(needed, key=lambda sym: (list(order).index(sym.src.filename), sym.slc.start))
+  out: list[str] = [
+    f"// Bundle of {os.path.basename(design)} and the library symbols it uses.\n",
+    "// Generated by scad-analysis.py --bundle.  Edit the sources instead.\n",
+  ]
+  last_file = None
+  for sym in by_file:
+    if sym.src.filename != last_file:
+      out.append(f"\n// ---- from {os.path.relpath(sym.src.filename)} ----\n\n")
+      last_file = sym.src.filename
+    out.append(rewrite(sym) + "\n")
+    if sym.emit_name != sym.name:
+      print(f"NOTE: {sym.kind} {sym.name} from {os.path.relpath(sym.src.filename)} renamed to {sym.emit_name}.",
+        file=sys.stderr)
+
+  out.append(f"\n// ---- {os.path.basename(design)} ----\n\n")
+  content, last = root_src.content, 0
+  for item in root_items:
+    if item[DOC_TYPE] in ("use", "include"):
+      out.append(content[last:item[DOC_SLC].start])
+      last = item[DOC_SLC].stop
+      if content.startswith("\n", last):
+        last += 1
+  out.append(content[last:])
+  text = "".join(out)
+
+  total = sum(len(unit_symbols) for unit in units.values() for unit_symbols in unit.symbols.values())
+  source_size = sum(len(src.content) for unit in units.values() for src, _ in unit.sources)
+  print(f"Bundled {len(needed)} library symbols of {total} from {len(order)} files: "
+    f"{len(text)} characters instead of {source_size}.", file=sys.stderr)
+
+  if out_file == "-":
+    sys.stdout.write(text)
+  else:
+    write_if_changed(out_file, text)
+  return True
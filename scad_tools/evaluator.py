@@ -0,0 +1,1806 @@
+"""
+Interprets the functional subset of OpenSCAD that the library uses so that
+the test_*.scad suites can run without launching OpenSCAD, with --eval.  Files
+are split into items with get_items(), and function and module bodies are
+only parsed and compiled into closures the first time they are called.  The
+sources, parser and library lookup are also used by the test runner, bundler,
+lint and load cost report.
+
+Values map to python as:
+  undef -> None, bool -> bool, number -> float, string -> str,
+  list -> list, range -> ScadRange, function -> ScadFunction.
+"""
+import builtins
+import math
+import os
+import random
+import regex
+import sys
+import time
+import typing
+from bisect import bisect_right
+from typing import Optional, TypeAlias, TypedDict
+
+from scad_analysis import (
+  CharSlice, DOC_SLC, DOC_S_ID_SLC, DOC_TYPE, ItemInfo, ItemType, NONTYPE_SYMBOLS,
+  RES_LIB, get_items, get_line_positions, unparsed_at,
+)
+
+class ScadError(Exception):
+  "An error that stops evaluation of a top level statement."
+  def __init__(self, message: str, src: Optional["ScadSource"] = None, pos: int = 0):
+    super().__init__(message)
+    self.message = message
+    self.filename = src.filename if src else ""
+    self.line = src.line(pos) if src else 0
+
+class ScadAssertFailure(ScadError):
+  "A failed assert()."
+
+class ScadSource:
+  """
+  Content of a file and where its lines start, for reporting locations.  Its
+  items and the ASTs of its symbols are built when first asked for and kept,
+  so that everything that looks at the file shares one parse.
+  """
+  def __init__(self, filename: str, content: str):
+    self.filename = filename
+    self.content = content
+    self.lines = get_line_positions(content)
+    self._items: Optional[list[ItemInfo]] = None
+    self.asts: dict[int, "ScadAst"] = {}
+
+  def line(self, pos: int) -> int:
+    return bisect_right(self.lines, pos)
+
+  @property
+  def items(self) -> list[ItemInfo]:
+    if self._items is None:
+      self._items = get_items(self.content)
+    return self._items
+
+  def ast(self, item: ItemInfo) -> "ScadAst":
+    "AST of a function, module or value item.  Raises ScadError if it can't be parsed."
+    start = item[DOC_SLC].start
+    ast = self.asts.get(start)
+    if ast is None:
+      ast = self.asts[start] = ScadParser(self, item[DOC_SLC]).item(item[DOC_TYPE])
+    return ast
+
+SCAD_SOURCES: dict[str, tuple[tuple[int, int], ScadSource]] = {}
+
+def scad_source(filename: str) -> ScadSource:
+  """
+  The ScadSource of a file, shared until the file's size or mtime changes.
+  Its name is relative to the current directory unless the file is outside
+  of it.  Raises OSError if the file can't be read.
+  """
+  path = os.path.abspath(filename)
+  st = os.stat(path)
+  stamp = (st.st_mtime_ns, st.st_size)
+  cached = SCAD_SOURCES.get(path)
+  if cached is not None and cached[0] == stamp:
+    return cached[1]
+  with open(path, "r", encoding="utf-8") as f:
+    content = f.read()
+  relpath = os.path.relpath(path)
+  src = ScadSource(path if relpath.startswith("..") else relpath, content)
+  SCAD_SOURCES[path] = (stamp, src)
+  return src
+
+class ScadRange:
+  """
+  A range `[begin : step : end]`.  Like in OpenSCAD, indexing gives the begin,
+  step and end values.
+  """
+  __slots__ = ("begin", "step", "end")
+
+  def __init__(self, begin: float, step: float, end: float):
+    self.begin = begin
+    self.step  = step
+    self.end   = end
+
+  def __getitem__(self, i: int) -> float:
+    return (self.begin, self.step, self.end)[i]
+
+  def count(self) -> int:
+    begin, step, end = self.begin, self.step, self.end
+    if math.isnan(begin) or math.isnan(step) or math.isnan(end):
+      return 0
+    if (begin < end) if step < 0 else (end < begin):
+      return 0
+    if begin == end or math.isinf(step):
+      return 1
+    if math.isinf(begin) or math.isinf(end) or step == 0:
+      raise ScadError("Range is unbounded")
+    # Compensates for results just below a whole number, as OpenSCAD does.
+    return int(math.nextafter((end - begin) / step, math.inf)) + 1
+
+  def values(self) -> typing.Iterator[float]:
+    begin, step = self.begin, self.step
+    for i in range(self.count()):
+      yield begin + i * step
+
+class ScadScope:
+  "Variables of a scope, chained to the enclosing scope."
+  __slots__ = ("vars", "parent")
+
+  def __init__(self, vars: dict[str, typing.Any], parent: Optional["ScadScope"]):
+    self.vars   = vars
+    self.parent = parent
+
+class ScadFunction:
+  """
+  A function or function literal.  Top level functions are compiled the first
+  time that they are called.
+  """
+  __slots__ = ("name", "names", "defaults", "body", "env", "text", "lazy")
+
+  def __init__(self, name: str, env: ScadScope, text: str = "",
+      lazy: Optional[tuple["ScadCompiler", ItemInfo]] = None):
+    self.name = name
+    self.names: list[str] = []
+    self.defaults: list[typing.Any] = []
+    self.body: typing.Any = None
+    self.env = env
+    self.text = text
+    self.lazy = lazy
+
+  def compile(self) -> None:
+    assert self.lazy is not None
+    compiler, item = self.lazy
+    ast = compiler.src.ast(item)
+    self.names, self.defaults = compiler.params(ast.params)
+    self.body = compiler.expr(ast.root, True)
+    self.lazy = None
+
+  def bind(self, args: list, named: Optional[dict[str, typing.Any]]) -> ScadScope:
+    names = self.names
+    if named is None and len(args) == len(names):
+      return ScadScope(dict(zip(names, args)), self.env)
+    d: dict[str, typing.Any] = {}
+    scope = ScadScope(d, self.env)
+    count = len(args)
+    for i, name in enumerate(names):
+      if i < count:
+        d[name] = args[i]
+      elif named is not None and name in named:
+        d[name] = named[name]
+      elif self.defaults[i] is not None:
+        d[name] = self.defaults[i](scope)
+      else:
+        d[name] = None
+    return scope
+
+class ScadModule(ScadFunction):
+  "A module.  Its body is a statement instead of an expression."
+  __slots__ = ()
+
+  def compile(self) -> None:
+    assert self.lazy is not None
+    compiler, item = self.lazy
+    ast = compiler.src.ast(item)
+    self.names, self.defaults = compiler.params(ast.params)
+    self.body = compiler.block(ast.root)
+    self.lazy = None
+
+class TailCall:
+  "Returned by a call in tail position so the caller can loop instead of recursing."
+  __slots__ = ("fn", "args", "named")
+
+  def __init__(self, fn: ScadFunction, args: list, named: Optional[dict[str, typing.Any]]):
+    self.fn    = fn
+    self.args  = args
+    self.named = named
+
+def scad_truthy(v: typing.Any) -> bool:
+  t = type(v)
+  if t is bool:
+    return v
+  if t is float:
+    return v != 0
+  if v is None:
+    return False
+  if t is str or t is list:
+    return len(v) != 0
+  return True
+
+def scad_eq(a: typing.Any, b: typing.Any) -> bool:
+  t = type(a)
+  if t is not type(b):
+    return False
+  if t is list:
+    return len(a) == len(b) and all(scad_eq(x, y) for x, y in zip(a, b))
+  if t is ScadRange:
+    return a.begin == b.begin and a.step == b.step and a.end == b.end
+  if t is ScadFunction:
+    return a is b
+  return a == b
+
+def scad_ne(a: typing.Any, b: typing.Any) -> bool:
+  return not scad_eq(a, b)
+
+def scad_compare(op: typing.Callable[[typing.Any, typing.Any], bool]) -> typing.Callable[[typing.Any, typing.Any], Optional[bool]]:
+  "Numbers compare with numbers and strings with strings.  Others are undef."
+  def compare(a: typing.Any, b: typing.Any) -> Optional[bool]:
+    t = type(a)
+    if t is type(b) and (t is float or t is str or t is bool):
+      return op(a, b)
+    return None
+  return compare
+
+def scad_elementwise(op: typing.Callable[[float, float], float]) -> typing.Callable[[typing.Any, typing.Any], typing.Any]:
+  "Numbers, or vectors of the same length element by element."
+  def fn(a: typing.Any, b: typing.Any) -> typing.Any:
+    ta, tb = type(a), type(b)
+    if ta is float and tb is float:
+      return op(a, b)
+    if ta is list and tb is list and len(a) == len(b):
+      return [fn(x, y) for x, y in zip(a, b)]
+    return None
+  return fn
+
+def scad_dot(a: list, b: list) -> Optional[float]:
+  if len(a) != len(b) or any(type(x) is not float for x in a) or any(type(x) is not float for x in b):
+    return None
+  return sum(x * y for x, y in zip(a, b))
+
+def scad_mul(a: typing.Any, b: typing.Any) -> typing.Any:
+  ta, tb = type(a), type(b)
+  if ta is float:
+    if tb is float:
+      return a * b
+    if tb is list:
+      return [scad_mul(a, y) for y in b]
+    return None
+  if ta is not list:
+    return None
+  if tb is float:
+    return [scad_mul(x, b) for x in a]
+  if tb is not list:
+    return None
+  a_matrix = bool(a) and type(a[0]) is list
+  b_matrix = bool(b) and type(b[0]) is list
+  if a_matrix and b_matrix:
+    cols = [list(col) for col in zip(*b)]
+    return [[scad_dot(row, col) for col in cols] for row in a]
+  if a_matrix:
+    return [scad_dot(row, b) for row in a]
+  if b_matrix:
+    return [scad_dot(a, list(col)) for col in zip(*b)]
+  return scad_dot(a, b)
+
+def scad_div(a: typing.Any, b: typing.Any) -> typing.Any:
+  ta, tb = type(a), type(b)
+  if ta is float and tb is float:
+    if b == 0:
+      return math.nan if a == 0 or math.isnan(a) else math.copysign(math.inf, a) * math.copysign(1, b)
+    return a / b
+  if ta is list and tb is float:
+    return [scad_div(x, b) for x in a]
+  if ta is float and tb is list:
+    return [scad_div(a, y) for y in b]
+  return None
+
+def scad_mod(a: typing.Any, b: typing.Any) -> typing.Any:
+  if type(a) is float and type(b) is float:
+    return math.fmod(a, b) if b != 0 and not math.isinf(a) else math.nan
+  return None
+
+def scad_pow(a: typing.Any, b: typing.Any) -> typing.Any:
+  if type(a) is float and type(b) is float:
+    try:
+      return math.pow(a, b)
+    except ValueError:
+      return math.nan
+    except OverflowError:
+      return math.inf
+  return None
+
+def scad_neg(a: typing.Any) -> typing.Any:
+  if type(a) is float:
+    return -a
+  if type(a) is list:
+    return [scad_neg(x) for x in a]
+  return None
+
+def scad_index(v: typing.Any, i: typing.Any) -> typing.Any:
+  if type(i) is not float:
+    return None
+  t = type(v)
+  if t is list or t is str:
+    if 0 <= i < len(v):
+      return v[int(i)]
+    return None
+  if t is ScadRange and 0 <= i < 3:
+    return v[int(i)]
+  return None
+
+def scad_iter(v: typing.Any) -> typing.Iterable:
+  "What a for loop iterates over."
+  t = type(v)
+  if t is list or t is str:
+    return v
+  if t is ScadRange:
+    return v.values()
+  if v is None:
+    return ()
+  return (v,)
+
+SCAD_BINARY_OPS: dict[str, typing.Callable[[typing.Any, typing.Any], typing.Any]] = {
+  "+" : scad_elementwise(lambda x, y: x + y),
+  "-" : scad_elementwise(lambda x, y: x - y),
+  "*" : scad_mul,
+  "/" : scad_div,
+  "%" : scad_mod,
+  "^" : scad_pow,
+  "==": scad_eq,
+  "!=": scad_ne,
+  "<" : scad_compare(lambda x, y: x <  y),
+  "<=": scad_compare(lambda x, y: x <= y),
+  ">" : scad_compare(lambda x, y: x >  y),
+  ">=": scad_compare(lambda x, y: x >= y),
+}
+
+def scad_num_str(x: float) -> str:
+  if math.isnan(x):
+    return "nan"
+  if math.isinf(x):
+    return "inf" if 0 < x else "-inf"
+  return f"{x:g}"
+
+def scad_str(v: typing.Any, quote: bool = False) -> str:
+  """
+  Converts a value to a string like str() does.  Strings nested in lists, or
+  all strings if quote is set, are quoted.
+  """
+  t = type(v)
+  if t is str:
+    if not quote:
+      return v
+    return '"' + v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") \
+      .replace("\t", "\\t").replace("\r", "\\r") + '"'
+  if t is float:
+    return scad_num_str(v)
+  if t is bool:
+    return "true" if v else "false"
+  if v is None:
+    return "undef"
+  if t is list:
+    return "[" + ", ".join(scad_str(e, True) for e in v) + "]"
+  if t is ScadRange:
+    return f"[{scad_num_str(v.begin)} : {scad_num_str(v.step)} : {scad_num_str(v.end)}]"
+  if t is ScadFunction:
+    return v.text
+  return str(v)
+
+# ---- OpenSCAD evaluator: built in functions ----
+
+def scad_sin_degrees(x: float) -> float:
+  "sin() of degrees which is exact for multiples of 30, as OpenSCAD's is."
+  if not math.isfinite(x):
+    return math.nan
+  x = math.fmod(x, 360)
+  if x < 0:
+    x += 360
+  negate = 180 <= x
+  if negate:
+    x -= 180
+  if 90 < x:
+    x = 180 - x
+  result = 0.0 if x == 0 else 0.5 if x == 30 else 1.0 if x == 90 else math.sin(math.radians(x))
+  return -result if negate else result
+
+def scad_num_args(fn: typing.Callable[..., float]) -> typing.Callable[..., typing.Any]:
+  "Wraps a math function that returns undef unless all arguments are numbers."
+  def builtin(ev: "ScadEvaluator", args: list, named: Optional[dict]) -> typing.Any:
+    if not args or any(type(a) is not float for a in args):
+      return None
+    try:
+      return float(fn(*args))
+    except (ValueError, ZeroDivisionError):
+      return math.nan
+    except OverflowError:
+      return math.inf
+  return builtin
+
+def scad_log(*args: float) -> float:
+  x = args[-1]
+  if x == 0:
+    return -math.inf
+  return math.log(x, args[0]) if len(args) == 2 else math.log10(x)
+
+def scad_round(x: float) -> float:
+  return math.floor(x + 0.5) if 0 <= x else -math.floor(-x + 0.5)
+
+def scad_min_max(fn: typing.Callable) -> typing.Callable[..., typing.Any]:
+  def builtin(ev: "ScadEvaluator", args: list, named: Optional[dict]) -> typing.Any:
+    values = args[0] if len(args) == 1 and type(args[0]) is list else args
+    if not values or any(type(v) is not float for v in values):
+      return None
+    return fn(values)
+  return builtin
+
+def scad_type_test(test: typing.Callable[[typing.Any], bool]) -> typing.Callable[..., typing.Any]:
+  def builtin(ev: "ScadEvaluator", args: list, named: Optional[dict]) -> typing.Any:
+    return test(args[0] if args else None)
+  return builtin
+
+def scad_len(ev: "ScadEvaluator", args: list, named: Optional[dict]) -> typing.Any:
+  v = args[0] if args else None
+  return float(len(v)) if type(v) is list or type(v) is str else None
+
+def scad_concat(ev: "ScadEvaluator", args: list, named: Optional[dict]) -> typing.Any:
+  result: list = []
+  for a in args:
+    if type(a) is list:
+      result.extend(a)
+    else:
+      result.append(a)
+  return result
+
+def scad_str_builtin(ev: "ScadEvaluator", args: list, named: Optional[dict]) -> typing.Any:
+  return "".join(scad_str(a) for a in args)
+
+def scad_chr(ev: "ScadEvaluator", args: list, named: Optional[dict]) -> typing.Any:
+  def chars(v: typing.Any) -> str:
+    if type(v) is float:
+      return chr(int(v)) if 0 < v < 0x110000 else ""
+    if type(v) is list or type(v) is ScadRange:
+      return "".join(chars(e) for e in scad_iter(v))
+    return ""
+  return "".join(chars(a) for a in args)
+
+def scad_ord(ev: "ScadEvaluator", args: list, named: Optional[dict]) -> typing.Any:
+  s = args[0] if args else None
+  return float(ord(s)) if type(s) is str and len(s) == 1 else None
+
+def scad_norm(ev: "ScadEvaluator", args: list, named: Optional[dict]) -> typing.Any:
+  v = args[0] if args else None
+  if type(v) is not list or any(type(e) is not float for e in v):
+    return None
+  return math.sqrt(sum(e * e for e in v))
+
+def scad_cross(ev: "ScadEvaluator", args: list, named: Optional[dict]) -> typing.Any:
+  if len(args) != 2 or type(args[0]) is not list or type(args[1]) is not list:
+    return None
+  a, b = args
+  if len(a) != len(b) or any(type(e) is not float for e in a + b):
+    return None
+  if len(a) == 2:
+    return a[0] * b[1] - a[1] * b[0]
+  if len(a) == 3:
+    return [a[1] * b[2] - a[2] * b[1], a[2] * b[0] - a[0] * b[2], a[0] * b[1] - a[1] * b[0]]
+  return None
+
+def scad_lookup(ev: "ScadEvaluator", args: list, named: Optional[dict]) -> typing.Any:
+  if len(args) != 2 or type(args[0]) is not float or type(args[1]) is not list:
+    return None
+  key, table = args
+  points = [p for p in table if type(p) is list and len(p) >= 2
+    and type(p[0]) is float and type(p[1]) is float]
+  if not points:
+    return None
+  low = min(points, key=lambda p: p[0])
+  high = max(points, key=lambda p: p[0])
+  if key <= low[0]:
+    return low[1]
+  if high[0] <= key:
+    return high[1]
+  below = max((p for p in points if p[0] <= key), key=lambda p: p[0])
+  above = min((p for p in points if key < p[0]), key=lambda p: p[0])
+  return below[1] + (key - below[0]) / (above[0] - below[0]) * (above[1] - below[1])
+
+def scad_search(ev: "ScadEvaluator", args: list, named: Optional[dict]) -> typing.Any:
+  """
+  search(match_value, string_or_vector, num_returns_per_match=1,
+  index_col_num=0)
+  """
+  if len(args) < 2:
+    return None
+  match, table = args[0], args[1]
+  num = int(args[2]) if 2 < len(args) and type(args[2]) is float else 1
+  col = int(args[3]) if 3 < len(args) and type(args[3]) is float else 0
+
+  def key(e: typing.Any) -> typing.Any:
+    return (e[col] if col < len(e) else None) if type(e) is list else e
+
+  def find(value: typing.Any) -> list[float]:
+    found: list[float] = []
+    for i, e in enumerate(table):
+      if scad_eq(key(e), value):
+        found.append(float(i))
+        if 0 < num <= len(found):
+          break
+    return found
+
+  if type(table) is not list and type(table) is not str:
+    return None
+  if type(match) is float or type(match) is bool or match is None:
+    return find(match)
+
+  result: list = []
+  for value in match:
+    found = find(value)
+    if num == 1:
+      if found:
+        result.append(found[0])
+      elif type(match) is list:
+        result.append([])
+    else:
+      result.append(found)
+  return result
+
+def scad_rands(ev: "ScadEvaluator", args: list, named: Optional[dict]) -> typing.Any:
+  if len(args) < 3 or any(type(a) is not float for a in args[:3]):
+    return None
+  low, high, count = args[:3]
+  rng = random.Random(args[3]) if 3 < len(args) and type(args[3]) is float else random
+  return [rng.uniform(low, high) for _ in range(int(count))]
+
+SCAD_BUILTIN_FUNCTIONS: dict[str, typing.Callable[..., typing.Any]] = {
+  "abs"        : scad_num_args(abs),
+  "sign"       : scad_num_args(lambda x: (0 < x) - (x < 0)),
+  "sin"        : scad_num_args(scad_sin_degrees),
+  "cos"        : scad_num_args(lambda x: scad_sin_degrees(x + 90)),
+  "tan"        : scad_num_args(lambda x: scad_sin_degrees(x) / scad_sin_degrees(x + 90)),
+  "asin"       : scad_num_args(lambda x: math.degrees(math.asin(x))),
+  "acos"       : scad_num_args(lambda x: math.degrees(math.acos(x))),
+  "atan"       : scad_num_args(lambda x: math.degrees(math.atan(x))),
+  "atan2"      : scad_num_args(lambda y, x: math.degrees(math.atan2(y, x))),
+  "floor"      : scad_num_args(math.floor),
+  "ceil"       : scad_num_args(math.ceil),
+  "round"      : scad_num_args(scad_round),
+  "sqrt"       : scad_num_args(math.sqrt),
+  "exp"        : scad_num_args(math.exp),
+  "ln"         : scad_num_args(math.log),
+  "log"        : scad_num_args(scad_log),
+  "pow"        : scad_num_args(math.pow),
+  "min"        : scad_min_max(min),
+  "max"        : scad_min_max(max),
+  "norm"       : scad_norm,
+  "cross"      : scad_cross,
+  "len"        : scad_len,
+  "concat"     : scad_concat,
+  "str"        : scad_str_builtin,
+  "chr"        : scad_chr,
+  "ord"        : scad_ord,
+  "search"     : scad_search,
+  "lookup"     : scad_lookup,
+  "rands"      : scad_rands,
+  "is_undef"   : scad_type_test(lambda v: v is None),
+  "is_num"     : scad_type_test(lambda v: type(v) is float and not math.isnan(v)),
+  "is_bool"    : scad_type_test(lambda v: type(v) is bool),
+  "is_string"  : scad_type_test(lambda v: type(v) is str),
+  "is_list"    : scad_type_test(lambda v: type(v) is list),
+  "is_function": scad_type_test(lambda v: type(v) is ScadFunction),
+  "version"    : lambda ev, args, named: [2021.0, 1.0, 0.0],
+  "version_num": lambda ev, args, named: 20210100.0,
+}
+
+SCAD_BUILTIN_VARIABLES: dict[str, typing.Any] = {
+  "PI"      : math.pi,
+  "$fn"     : 0.0,
+  "$fa"     : 12.0,
+  "$fs"     : 2.0,
+  "$t"      : 0.0,
+  "$preview": False,
+}
+
+SCAD_GEOMETRY_MODULES = frozenset((
+  "cube", "sphere", "cylinder", "polyhedron", "square", "circle", "polygon",
+  "text", "import", "surface", "translate", "rotate", "scale", "resize",
+  "mirror", "multmatrix", "color", "offset", "hull", "minkowski", "union",
+  "difference", "intersection", "render", "linear_extrude", "rotate_extrude",
+  "projection", "group",
+))
+"Modules that only make geometry.  Only their children are evaluated."
+
+# ---- OpenSCAD evaluator: parser ----
+
+RE_SCAD_TOKEN = regex.compile(
+  r'''
+      (?<ws>     (?: \s++ | //[^\n]*+ | /\*(?:[^*]|\*(?!/))*+\*/ )++ )
+    | (?<number> (?: \d++ (?: \.\d*+ )?+ | \.\d++ ) (?: [eE][+-]?+\d++ )?+ )
+    | (?<string> "(?:[^\\"]++|\\.)*+" )
+    | (?<name>   \$?+[a-zA-Z_][a-zA-Z_\d]*+ )
+    | (?<op>     <= | >= | == | != | && | \|\| | [-+*/%^!<>=?:,;.()\[\]{}#] )
+  ''', regex.VERBOSE
+)
+
+RE_SCAD_ESCAPE = regex.compile(r'\\(?:x[0-7][\da-fA-F]|u[\da-fA-F]{4}|U[\da-fA-F]{6}|.)', regex.DOTALL)
+SCAD_ESCAPES = { "n": "\n", "t": "\t", "r": "\r", '"': '"', "\\": "\\" }
+
+def scad_unescape(s: str) -> str:
+  def replace(m: regex.Match[str]) -> str:
+    e = m[0]
+    if 2 < len(e):
+      return chr(int(e[2:], 16))
+    return SCAD_ESCAPES.get(e[1], e)
+  return RE_SCAD_ESCAPE.sub(replace, s)
+
+ScadNode: TypeAlias = tuple
+"""
+An expression or statement node.  The first element is the kind, and the
+rest depends on the kind.  Nodes that can report errors hold their position.
+"""
+
+class ScadAst:
+  """
+  A parsed function, module or value item.  The root is the body's expression,
+  or a block for a module.  Spans are kept beside the nodes, by identity, so
+  that nodes stay compact tuples.
+  """
+  __slots__ = ("kind", "name", "params", "root", "tokens", "spans")
+
+  def __init__(self, kind: ItemType, name: str, params: list[tuple[str, Optional[ScadNode]]],
+      root: ScadNode, tokens: list[tuple[str, typing.Any, int]], spans: dict[int, CharSlice]):
+    self.kind = kind
+    self.name = name
+    self.params = params
+    self.root = root
+    self.tokens = tokens
+    self.spans = spans
+
+  def span(self, node: ScadNode) -> CharSlice:
+    "Source of a node of this AST."
+    return self.spans[builtins.id(node)]
+
+SCAD_CONSTANTS = { "true": True, "false": False, "undef": None }
+
+def scad_spanned(method: typing.Callable[..., typing.Any]) -> typing.Callable[..., typing.Any]:
+  "Records the source span of the node that a ScadParser method returns."
+  def spanned(self: "ScadParser", *args: typing.Any) -> typing.Any:
+    start = self.tokens[self.i][2]
+    node = method(self, *args)
+    if node is not None:
+      self.spans[builtins.id(node)] = slice(start, self.ends[self.i - 1])
+    return node
+  return spanned
+
+class ScadParser:
+  """
+  Recursive descent parser for a slice of a file.  Produces ScadNode tuples.
+  """
+  BINARY_LEVELS = (("||",), ("&&",), ("==", "!="), ("<", "<=", ">", ">="), ("+", "-"), ("*", "/", "%"))
+  ENDS_EXPR = frozenset((")", "]", "}", ",", ";", ":", "?", "||", "&&", "==", "!=",
+    "<", "<=", ">", ">=", "*", "/", "%", "^", "=", ""))
+  "Tokens after assert(...) or echo(...) that mean they have no expression."
+
+  def __init__(self, src: ScadSource, slc: CharSlice):
+    self.src = src
+    content = src.content
+    self.tokens: list[tuple[str, typing.Any, int]] = []
+    self.ends: list[int] = []
+    "Where each token ends."
+    self.spans: dict[int, CharSlice] = {}
+    tokens, ends = self.tokens, self.ends
+    pos, end = slc.start, slc.stop
+    while pos < end:
+      m = RE_SCAD_TOKEN.match(content, pos, end)
+      if not m:
+        raise ScadError(f"Unexpected character {content[pos]!r}", src, pos)
+      kind = m.lastgroup
+      stop = m.end()
+      if kind != "ws":
+        if kind == "number":
+          tokens.append(("num", float(m[0]), pos))
+        elif kind == "string":
+          tokens.append(("str", scad_unescape(m[0][1:-1]), pos))
+        else:
+          tokens.append((kind, m[0], pos))
+        ends.append(stop)
+      pos = stop
+    self.tokens.append(("end", "", end))
+    self.ends.append(end)
+    self.i = 0
+
+  # -- token helpers --
+
+  def peek(self, ahead: int = 0) -> tuple[str, typing.Any, int]:
+    return self.tokens[min(self.i + ahead, len(self.tokens) - 1)]
+
+  def is_op(self, value: str, ahead: int = 0) -> bool:
+    kind, text, _ = self.peek(ahead)
+    return kind == "op" and text == value
+
+  def is_keyword(self, value: str) -> bool:
+    kind, text, _ = self.peek()
+    return kind == "name" and text == value and self.is_op("(", 1)
+
+  def accept(self, value: str) -> bool:
+    if self.is_op(value):
+      self.i += 1
+      return True
+    return False
+
+  def expect(self, value: str) -> int:
+    kind, text, pos = self.peek()
+    if kind != "op" or text != value:
+      self.error(f"Expected '{value}' but found '{text or 'end of input'}'")
+    self.i += 1
+    return pos
+
+  def error(self, message: str) -> typing.NoReturn:
+    raise ScadError(message, self.src, self.peek()[2])
+
+  def name(self) -> str:
+    kind, text, _ = self.peek()
+    if kind != "name":
+      self.error(f"Expected a name but found '{text or 'end of input'}'")
+    self.i += 1
+    return text
+
+  def text(self, start: int) -> str:
+    "Source from start to the end of the last token consumed."
+    kind, value, pos = self.tokens[self.i - 1]
+    m = RE_SCAD_TOKEN.match(self.src.content, pos)
+    return self.src.content[start:m.end() if m else pos]
+
+  # -- entry points --
+
+  def expr_to_end(self) -> ScadNode:
+    node = self.expr()
+    self.accept(";")
+    if self.peek()[0] != "end":
+      self.error("Unexpected tokens after expression")
+    return node
+
+  @scad_spanned
+  def statements_to_end(self) -> ScadNode:
+    stmts = []
+    while self.peek()[0] != "end":
+      stmt = self.statement()
+      if stmt is not None:
+        stmts.append(stmt)
+    return ("block", stmts)
+
+  def signature(self) -> list[tuple[str, Optional[ScadNode]]]:
+    "`function name(params)` or `module name(params)`."
+    self.name()
+    self.name()
+    return self.params()
+
+  def item(self, kind: ItemType) -> ScadAst:
+    "A whole function, module or value item."
+    if kind == "value":
+      name, params = self.name(), []
+      self.expect("=")
+      root = self.expr_to_end()
+    else:
+      name = self.tokens[1][1]
+      params = self.signature()
+      if kind == "function":
+        self.expect("=")
+        root = self.expr_to_end()
+      else:
+        root = self.statements_to_end()
+    return ScadAst(kind, name, params, root, self.tokens, self.spans)
+
+  # -- expressions --
+
+  def params(self) -> list[tuple[str, Optional[ScadNode]]]:
+    params: list[tuple[str, Optional[ScadNode]]] = []
+    self.expect("(")
+    while not self.accept(")"):
+      name = self.name()
+      params.append((name, self.expr() if self.accept("=") else None))
+      if not self.accept(","):
+        self.expect(")")
+        break
+    return params
+
+  def assignments(self) -> list[tuple[str, ScadNode]]:
+    "`(name = expr, ...)`"
+    assigns: list[tuple[str, ScadNode]] = []
+    self.expect("(")
+    while not self.accept(")"):
+      name = self.name()
+      self.expect("=")
+      assigns.append((name, self.expr()))
+      if not self.accept(","):
+        self.expect(")")
+        break
+    return assigns
+
+  def args(self) -> list[tuple[Optional[str], ScadNode]]:
+    "`(expr, name = expr, ...)`"
+    args: list[tuple[Optional[str], ScadNode]] = []
+    self.expect("(")
+    while not self.accept(")"):
+      if self.peek()[0] == "name" and self.is_op("=", 1):
+        name = self.name()
+        self.expect("=")
+        args.append((name, self.expr()))
+      else:
+        args.append((None, self.expr()))
+      if not self.accept(","):
+        self.expect(")")
+        break
+    return args
+
+  def optional_expr(self) -> Optional[ScadNode]:
+    kind, text, _ = self.peek()
+    if kind == "end" or kind == "op" and text in self.ENDS_EXPR:
+      return None
+    return self.expr()
+
+  @scad_spanned
+  def expr(self) -> ScadNode:
+    kind, text, pos = self.peek()
+    if kind == "name" and self.is_op("(", 1):
+      if text == "function":
+        self.i += 1
+        params = self.params()
+        body = self.expr()
+        return ("lambda", params, body, self.text(pos))
+      if text == "let":
+        self.i += 1
+        assigns = self.assignments()
+        return ("let", assigns, self.expr())
+      if text == "assert":
+        self.i += 1
+        args = self.args()
+        cond_text = self.first_arg_text(pos)
+        return ("assert", args, self.optional_expr(), pos, cond_text)
+      if text == "echo":
+        self.i += 1
+        return ("echo", self.args(), self.optional_expr(), pos)
+
+    cond = self.binary(0)
+    if self.accept("?"):
+      then = self.expr()
+      self.expect(":")
+      return ("cond", cond, then, self.expr())
+    return cond
+
+  def first_arg_text(self, start: int) -> str:
+    "Source of the first argument of the call that starts at start."
+    text = self.text(start)
+    m = RE_FIRST_ARG.match(text)
+    return m["first"].strip() if m else text
+
+  def binary(self, level: int) -> ScadNode:
+    if level == len(self.BINARY_LEVELS):
+      return self.unary()
+    ops = self.BINARY_LEVELS[level]
+    left = self.binary(level + 1)
+    while True:
+      kind, text, _ = self.peek()
+      if kind != "op" or text not in ops:
+        return left
+      self.i += 1
+      right = self.binary(level + 1)
+      left = ("and", left, right) if text == "&&" else \
+             ("or", left, right) if text == "||" else \
+             ("binary", text, left, right)
+      self.spans[builtins.id(left)] = slice(self.spans[builtins.id(left[-2])].start, self.ends[self.i - 1])
+
+  def unary(self) -> ScadNode:
+    "Nodes made here and by binary() and postfix() get their spans as they're made."
+    kind, text, pos = self.peek()
+    if kind == "op" and text in ("!", "-", "+"):
+      self.i += 1
+      node = ("unary", text, self.unary())
+    elif kind == "name" and text in ("function", "let", "assert", "echo") and self.is_op("(", 1):
+      return self.expr()
+    else:
+      node = self.postfix()
+      if not self.accept("^"):
+        return node
+      node = ("binary", "^", node, self.unary())
+    self.spans[builtins.id(node)] = slice(pos, self.ends[self.i - 1])
+    return node
+
+  @scad_spanned
+  def postfix(self) -> ScadNode:
+    start = self.peek()[2]
+    node = self.primary()
+    while True:
+      self.spans[builtins.id(node)] = slice(start, self.ends[self.i - 1])
+      kind, text, pos = self.peek()
+      if kind != "op":
+        return node
+      if text == "(":
+        node = ("call", node, self.args(), pos)
+      elif text == "[":
+        self.i += 1
+        node = ("index", node, self.expr())
+        self.expect("]")
+      elif text == ".":
+        self.i += 1
+        node = ("member", node, self.name())
+      else:
+        return node
+
+  def primary(self) -> ScadNode:
+    kind, value, pos = self.peek()
+    self.i += 1
+    if kind == "num" or kind == "str":
+      return ("const", value)
+    if kind == "name":
+      # Not a literal tuple, which would be one object and so share a span.
+      if value in SCAD_CONSTANTS:
+        return ("const", SCAD_CONSTANTS[value])
+      return ("var", value, pos)
+    if kind == "op":
+      if value == "(":
+        node = self.expr()
+        self.expect(")")
+        return node
+      if value == "[":
+        return self.list_literal()
+    self.i -= 1
+    self.error(f"Unexpected '{value or 'end of input'}'")
+
+  def list_literal(self) -> ScadNode:
+    pos = self.tokens[self.i - 1][2]
+    if self.accept("]"):
+      return ("list", [])
+    if self.is_generator():
+      elems = [self.element()]
+    else:
+      first = self.expr()
+      if self.accept(":"):
+        second = self.expr()
+        if self.accept(":"):
+          third = self.expr()
+          self.expect("]")
+          return ("range", first, second, third, pos)
+        self.expect("]")
+        return ("range", first, None, second, pos)
+      elems = [("expr", first)]
+      self.spans[builtins.id(elems[0])] = self.spans[builtins.id(first)]
+    while self.accept(","):
+      if self.is_op("]"):
+        break
+      elems.append(self.element())
+    self.expect("]")
+    return ("list", elems)
+
+  def is_generator(self) -> bool:
+    kind, text, _ = self.peek()
+    return kind == "name" and (text == "each" or text in ("for", "if", "let") and self.is_op("(", 1))
+
+  @scad_spanned
+  def element(self) -> ScadNode:
+    "A list element, which can be a generator."
+    kind, text, _ = self.peek()
+    if kind == "name":
+      if text == "each":
+        self.i += 1
+        return ("each", self.element())
+      if text == "for" and self.is_op("(", 1):
+        self.i += 1
+        assigns = self.for_assignments()
+        if self.accept(";"):
+          cond = self.expr()
+          self.expect(";")
+          updates = self.for_assignments(opened=True)
+          return ("cfor", assigns, cond, updates, self.element())
+        self.expect(")")
+        return ("for", assigns, self.element())
+      if text == "if" and self.is_op("(", 1):
+        self.i += 1
+        self.expect("(")
+        cond = self.expr()
+        self.expect(")")
+        then = self.element()
+        if self.peek()[0:2] == ("name", "else"):
+          self.i += 1
+          return ("if", cond, then, self.element())
+        return ("if", cond, then, None)
+      if text == "let" and self.is_op("(", 1):
+        self.i += 1
+        assigns = self.assignments()
+        return ("let_elem", assigns, self.element())
+    if self.is_op("(") and self.peek(1)[0] == "name" and self.peek(1)[1] in ("for", "each", "if", "let"):
+      self.i += 1
+      elem = self.element()
+      self.expect(")")
+      return elem
+    return ("expr", self.expr())
+
+  def for_assignments(self, opened: bool = False) -> list[tuple[str, ScadNode]]:
+    "Assignments of a for up to, but not including, the closing ) or ;."
+    if not opened:
+      self.expect("(")
+    assigns: list[tuple[str, ScadNode]] = []
+    while not (self.is_op(")") or self.is_op(";")):
+      name = self.name()
+      self.expect("=")
+      assigns.append((name, self.expr()))
+      if not self.accept(","):
+        break
+    if opened:
+      self.expect(")")
+    return assigns
+
+  # -- statements --
+
+  @scad_spanned
+  def statement(self) -> Optional[ScadNode]:
+    kind, text, pos = self.peek()
+    if kind == "op":
+      if text == ";":
+        self.i += 1
+        return None
+      if text == "{":
+        self.i += 1
+        stmts = []
+        while not self.accept("}"):
+          if self.peek()[0] == "end":
+            self.error("Expected '}'")
+          stmt = self.statement()
+          if stmt is not None:
+            stmts.append(stmt)
+        return ("block", stmts)
+      if text in ("!", "#", "%", "*"):
+        self.i += 1
+        stmt = self.statement()
+        return None if text == "*" else stmt
+      self.error(f"Unexpected '{text}'")
+    if kind != "name":
+      self.error(f"Unexpected '{text or 'end of input'}'")
+
+    if text in ("function", "module") and self.peek(1)[0] == "name":
+      self.error(f"Nested {text} definitions aren't supported")
+    if text == "if" and self.is_op("(", 1):
+      self.i += 1
+      self.expect("(")
+      cond = self.expr()
+      self.expect(")")
+      then = self.statement()
+      if self.peek()[0:2] == ("name", "else"):
+        self.i += 1
+        return ("if_stmt", cond, then, self.statement())
+      return ("if_stmt", cond, then, None)
+    if text in ("for", "intersection_for") and self.is_op("(", 1):
+      self.i += 1
+      assigns = self.for_assignments()
+      self.expect(")")
+      return ("for_stmt", assigns, self.statement())
+    if text == "let" and self.is_op("(", 1):
+      self.i += 1
+      assigns = self.assignments()
+      return ("let_stmt", assigns, self.statement())
+    if text in ("assert", "echo") and self.is_op("(", 1):
+      self.i += 1
+      args = self.args()
+      cond_text = self.first_arg_text(pos)
+      return (text + "_stmt", args, self.statement(), pos, cond_text)
+    if self.is_op("=", 1):
+      self.i += 2
+      node = self.expr()
+      self.expect(";")
+      return ("assign", text, node)
+    if self.is_op("(", 1):
+      self.i += 1
+      args = self.args()
+      return ("inst", text, args, self.statement(), pos)
+    self.error(f"Unexpected '{text}'")
+
+RE_FIRST_ARG = regex.compile(r"^\w+\s*+\(\s*+(?<first>(?&param_chars_mtws))|" + RES_LIB, regex.VERBOSE)
+"Used to get the source of the first argument of a call."
+
+# ---- OpenSCAD evaluator: compiler ----
+
+SCAD_FLOAT_OPS: dict[str, typing.Callable[[float, float], typing.Any]] = {
+  "+" : lambda x, y: x + y,
+  "-" : lambda x, y: x - y,
+  "*" : lambda x, y: x * y,
+  "==": lambda x, y: x == y,
+  "!=": lambda x, y: x != y,
+  "<" : lambda x, y: x <  y,
+  "<=": lambda x, y: x <= y,
+  ">" : lambda x, y: x >  y,
+  ">=": lambda x, y: x >= y,
+}
+"Operators that don't need special cases when both operands are numbers."
+
+SCAD_MEMBERS = { "x": 0.0, "y": 1.0, "z": 2.0 }
+
+ScadExec: TypeAlias = typing.Callable[[ScadScope], typing.Any]
+ScadGen: TypeAlias = typing.Callable[[ScadScope, list], None]
+
+class ScadCompiler:
+  """
+  Compiles ScadNodes of a source into closures taking a ScadScope.  Names of
+  functions and modules are looked up in unit.
+  """
+  def __init__(self, ev: "ScadEvaluator", unit: "ScadUnit", src: ScadSource):
+    self.ev   = ev
+    self.unit = unit
+    self.src  = src
+
+  def parse(self, slc: CharSlice, rule: typing.Callable[[ScadParser], typing.Any]) -> typing.Any:
+    return rule(ScadParser(self.src, slc))
+
+  def params(self, params: list[tuple[str, Optional[ScadNode]]]) -> tuple[list[str], list[typing.Any]]:
+    return [name for name, _ in params], \
+      [None if default is None else self.expr(default) for _, default in params]
+
+  def assignments(self, assigns: list[tuple[str, ScadNode]]) -> list[tuple[str, ScadExec]]:
+    return [(name, self.expr(node)) for name, node in assigns]
+
+  def args(self, args: list[tuple[Optional[str], ScadNode]]) \
+      -> tuple[list[ScadExec], list[tuple[str, ScadExec]]]:
+    return [self.expr(node) for name, node in args if name is None], \
+      [(name, self.expr(node)) for name, node in args if name is not None]
+
+  # -- expressions --
+
+  def expr(self, node: ScadNode, tail: bool = False) -> ScadExec:
+    """
+    Parameters
+    ----------
+    node : ScadNode
+        Expression to compile.
+    tail : bool
+        The expression is the result of a function, so calls can return a
+        TailCall instead of recursing.
+    """
+    return getattr(self, "x_" + node[0])(node, tail)
+
+  def x_const(self, node: ScadNode, tail: bool) -> ScadExec:
+    value = node[1]
+    return lambda scope: value
+
+  def x_var(self, node: ScadNode, tail: bool) -> ScadExec:
+    _, name, pos = node
+    ev, src = self.ev, self.src
+    def var(scope: ScadScope) -> typing.Any:
+      s: Optional[ScadScope] = scope
+      while s is not None:
+        d = s.vars
+        if name in d:
+          return d[name]
+        s = s.parent
+      ev.warn(f"Ignoring unknown variable '{name}'", src, pos)
+      return None
+    return var
+
+  def x_range(self, node: ScadNode, tail: bool) -> ScadExec:
+    _, begin, step, end, pos = node
+    f_begin, f_end = self.expr(begin), self.expr(end)
+    f_step = None if step is None else self.expr(step)
+    ev, src = self.ev, self.src
+    def rng(scope: ScadScope) -> Optional[ScadRange]:
+      b, e = f_begin(scope), f_end(scope)
+      s = 1.0 if f_step is None else f_step(scope)
+      if type(b) is not float or type(s) is not float or type(e) is not float:
+        return None
+      if f_step is None and e < b:
+        ev.warn("DEPRECATED: Using ranges of the form [begin:end] with begin value "
+          "greater than the end value is deprecated", src, pos)
+        b, e = e, b
+      return ScadRange(b, s, e)
+    return rng
+
+  def x_list(self, node: ScadNode, tail: bool) -> ScadExec:
+    elems = node[1]
+    if all(elem[0] == "expr" for elem in elems):
+      fs = [self.expr(elem[1]) for elem in elems]
+      return lambda scope: [f(scope) for f in fs]
+    gens = [self.gen(elem) for elem in elems]
+    def lst(scope: ScadScope) -> list:
+      out: list = []
+      for g in gens:
+        g(scope, out)
+      return out
+    return lst
+
+  def x_call(self, node: ScadNode, tail: bool) -> ScadExec:
+    _, callee, args, pos = node
+    f_args, f_named = self.args(args)
+    ev, src, unit = self.ev, self.src, self.unit
+
+    resolve: ScadExec
+    if callee[0] == "var":
+      name = callee[1]
+      def resolve(scope: ScadScope) -> typing.Any:
+        # A variable holding a function literal hides a function of that name.
+        s: Optional[ScadScope] = scope
+        while s is not None:
+          d = s.vars
+          if name in d:
+            if type(d[name]) is ScadFunction:
+              return d[name]
+            break
+          s = s.parent
+        fn = unit.function(name)
+        if fn is None:
+          ev.warn(f"Ignoring unknown function '{name}'", src, pos)
+        return fn
+    else:
+      resolve = self.expr(callee)
+
+    if tail:
+      def tail_call(scope: ScadScope) -> typing.Any:
+        fn = resolve(scope)
+        args = [f(scope) for f in f_args]
+        named = {name: f(scope) for name, f in f_named} if f_named else None
+        if type(fn) is ScadFunction:
+          return TailCall(fn, args, named)
+        return ev.invoke(fn, args, named, src, pos)
+      return tail_call
+
+    def call(scope: ScadScope) -> typing.Any:
+      fn = resolve(scope)
+      args = [f(scope) for f in f_args]
+      named = {name: f(scope) for name, f in f_named} if f_named else None
+      return ev.invoke(fn, args, named, src, pos)
+    return call
+
+  def x_index(self, node: ScadNode, tail: bool) -> ScadExec:
+    f_obj, f_idx = self.expr(node[1]), self.expr(node[2])
+    return lambda scope: scad_index(f_obj(scope), f_idx(scope))
+
+  def x_member(self, node: ScadNode, tail: bool) -> ScadExec:
+    f_obj, idx = self.expr(node[1]), SCAD_MEMBERS.get(node[2])
+    return lambda scope: scad_index(f_obj(scope), idx)
+
+  def x_unary(self, node: ScadNode, tail: bool) -> ScadExec:
+    op, f = node[1], self.expr(node[2])
+    if op == "!":
+      return lambda scope: not scad_truthy(f(scope))
+    if op == "-":
+      return lambda scope: scad_neg(f(scope))
+    def plus(scope: ScadScope) -> typing.Any:
+      v = f(scope)
+      return v if type(v) is float or type(v) is list else None
+    return plus
+
+  def x_binary(self, node: ScadNode, tail: bool) -> ScadExec:
+    op, fa, fb = node[1], self.expr(node[2]), self.expr(node[3])
+    op_fn = SCAD_BINARY_OPS[op]
+    fast = SCAD_FLOAT_OPS.get(op)
+    if fast is None:
+      return lambda scope: op_fn(fa(scope), fb(scope))
+    def binary(scope: ScadScope) -> typing.Any:
+      a, b = fa(scope), fb(scope)
+      if type(a) is float and type(b) is float:
+        return fast(a, b)
+      return op_fn(a, b)
+    return binary
+
+  def x_and(self, node: ScadNode, tail: bool) -> ScadExec:
+    fa, fb = self.expr(node[1]), self.expr(node[2])
+    return lambda scope: scad_truthy(fa(scope)) and scad_truthy(fb(scope))
+
+  def x_or(self, node: ScadNode, tail: bool) -> ScadExec:
+    fa, fb = self.expr(node[1]), self.expr(node[2])
+    return lambda scope: scad_truthy(fa(scope)) or scad_truthy(fb(scope))
+
+  def x_cond(self, node: ScadNode, tail: bool) -> ScadExec:
+    fc, fa, fb = self.expr(node[1]), self.expr(node[2], tail), self.expr(node[3], tail)
+    return lambda scope: fa(scope) if scad_truthy(fc(scope)) else fb(scope)
+
+  def x_let(self, node: ScadNode, tail: bool) -> ScadExec:
+    fs, body = self.assignments(node[1]), self.expr(node[2], tail)
+    def let(scope: ScadScope) -> typing.Any:
+      d: dict[str, typing.Any] = {}
+      s = ScadScope(d, scope)
+      for name, f in fs:
+        d[name] = f(s)
+      return body(s)
+    return let
+
+  def x_assert(self, node: ScadNode, tail: bool) -> ScadExec:
+    _, args, body, pos, text = node
+    check = self.assertion(args, pos, text)
+    f_body = None if body is None else self.expr(body, tail)
+    def asrt(scope: ScadScope) -> typing.Any:
+      check(scope)
+      return None if f_body is None else f_body(scope)
+    return asrt
+
+  def x_echo(self, node: ScadNode, tail: bool) -> ScadExec:
+    _, args, body, pos = node
+    echo = self.echo(args)
+    f_body = None if body is None else self.expr(body, tail)
+    def ech(scope: ScadScope) -> typing.Any:
+      echo(scope)
+      return None if f_body is None else f_body(scope)
+    return ech
+
+  def x_lambda(self, node: ScadNode, tail: bool) -> ScadExec:
+    _, params, body, text = node
+    names, defaults = self.params(params)
+    f_body = self.expr(body, True)
+    def lam(scope: ScadScope) -> ScadFunction:
+      fn = ScadFunction("", scope, text)
+      fn.names, fn.defaults, fn.body = names, defaults, f_body
+      return fn
+    return lam
+
+  def assertion(self, args: list[tuple[Optional[str], ScadNode]], pos: int, text: str) -> ScadExec:
+    "Checks the condition of assert(condition, message)."
+    f_args, f_named = self.args(args)
+    named = dict(f_named)
+    f_cond = f_args[0] if f_args else named.get("condition")
+    f_msg = f_args[1] if 1 < len(f_args) else named.get("message")
+    ev, src = self.ev, self.src
+    def check(scope: ScadScope) -> None:
+      ev.asserts += 1
+      if f_cond is None or not scad_truthy(f_cond(scope)):
+        msg = None if f_msg is None else f_msg(scope)
+        raise ScadAssertFailure(f"Assertion '{text}' failed"
+          + ("" if msg is None else ": " + scad_str(msg)), src, pos)
+    return check
+
+  def echo(self, args: list[tuple[Optional[str], ScadNode]]) -> ScadExec:
+    fs = [(name, self.expr(node)) for name, node in args]
+    ev = self.ev
+    def echo(scope: ScadScope) -> None:
+      ev.echoes.append(", ".join(
+        scad_str(f(scope), True) if name is None else f"{name} = {scad_str(f(scope), True)}"
+        for name, f in fs))
+    return echo
+
+  # -- list elements --
+
+  def gen(self, node: ScadNode) -> ScadGen:
+    "Compiles a list element into a closure that appends its values to a list."
+    kind = node[0]
+    if kind == "expr":
+      f = self.expr(node[1])
+      return lambda scope, out: out.append(f(scope))
+
+    if kind == "each":
+      if node[1][0] != "expr":
+        return self.gen(node[1])
+      f = self.expr(node[1][1])
+      def each(scope: ScadScope, out: list) -> None:
+        v = f(scope)
+        if type(v) is list or type(v) is str:
+          out.extend(v)
+        elif type(v) is ScadRange:
+          out.extend(v.values())
+        else:
+          out.append(v)
+      return each
+
+    if kind == "for":
+      return self.loops(self.assignments(node[1]), self.gen(node[2]))
+
+    if kind == "cfor":
+      inits, f_cond, updates = self.assignments(node[1]), self.expr(node[2]), self.assignments(node[3])
+      body = self.gen(node[4])
+      def cfor(scope: ScadScope, out: list) -> None:
+        d: dict[str, typing.Any] = {}
+        s = ScadScope(d, scope)
+        for name, f in inits:
+          d[name] = f(s)
+        while scad_truthy(f_cond(s)):
+          body(s, out)
+          # Updates all see the values from the previous iteration.
+          d = dict(d)
+          d.update([(name, f(s)) for name, f in updates])
+          s = ScadScope(d, scope)
+      return cfor
+
+    if kind == "if":
+      f_cond, then = self.expr(node[1]), self.gen(node[2])
+      otherwise = None if node[3] is None else self.gen(node[3])
+      def cond(scope: ScadScope, out: list) -> None:
+        if scad_truthy(f_cond(scope)):
+          then(scope, out)
+        elif otherwise is not None:
+          otherwise(scope, out)
+      return cond
+
+    assert kind == "let_elem", kind
+    fs, body = self.assignments(node[1]), self.gen(node[2])
+    def let(scope: ScadScope, out: list) -> None:
+      d: dict[str, typing.Any] = {}
+      s = ScadScope(d, scope)
+      for name, f in fs:
+        d[name] = f(s)
+      body(s, out)
+    return let
+
+  def loops(self, fs: list[tuple[str, ScadExec]], body: typing.Callable) -> typing.Callable:
+    "Nested for loops over each assignment, innermost last, that call body."
+    if not fs:
+      return body
+    (name, f), inner = fs[0], self.loops(fs[1:], body)
+    def loop(scope: ScadScope, *out: list) -> None:
+      for v in scad_iter(f(scope)):
+        inner(ScadScope({name: v}, scope), *out)
+    return loop
+
+  # -- statements --
+
+  def stmt(self, node: Optional[ScadNode]) -> Optional[ScadExec]:
+    if node is None:
+      return None
+    if node[0] == "assign":
+      return self.block(("block", [node]))
+    return getattr(self, "s_" + node[0])(node)
+
+  def block(self, node: ScadNode) -> ScadExec:
+    """
+    Like OpenSCAD, the assignments in a block are done before anything else.
+    A name assigned more than once gets the last value but is assigned in the
+    first one's place.
+    """
+    assigns: dict[str, ScadExec] = {}
+    others: list[ScadExec] = []
+    for stmt in node[1]:
+      if stmt[0] == "assign":
+        assigns[stmt[1]] = self.expr(stmt[2])
+      else:
+        x = self.stmt(stmt)
+        if x is not None:
+          others.append(x)
+
+    if not assigns:
+      def run(scope: ScadScope) -> None:
+        for x in others:
+          x(scope)
+      return run
+
+    fs = list(assigns.items())
+    def run_with_vars(scope: ScadScope) -> None:
+      d: dict[str, typing.Any] = {}
+      s = ScadScope(d, scope)
+      for name, f in fs:
+        d[name] = f(s)
+      for x in others:
+        x(s)
+    return run_with_vars
+
+  def s_block(self, node: ScadNode) -> ScadExec:
+    return self.block(node)
+
+  def s_inst(self, node: ScadNode) -> ScadExec:
+    _, name, args, child, pos = node
+    f_args, f_named = self.args(args)
+    child_x = self.stmt(child)
+    ev, src, unit = self.ev, self.src, self.unit
+
+    if name == "children":
+      def children(scope: ScadScope) -> None:
+        s: Optional[ScadScope] = scope
+        while s is not None and SCAD_CHILDREN not in s.vars:
+          s = s.parent
+        if s is not None:
+          x, caller = s.vars[SCAD_CHILDREN]
+          if x is not None:
+            x(caller)
+      return children
+
+    def inst(scope: ScadScope) -> None:
+      mod = unit.module(name)
+      if mod is None:
+        if name in SCAD_GEOMETRY_MODULES:
+          for f in f_args:
+            f(scope)
+          if child_x is not None:
+            child_x(scope)
+        else:
+          ev.warn(f"Ignoring unknown module '{name}'", src, pos)
+        return
+      if mod.lazy is not None:
+        mod.compile()
+      args = [f(scope) for f in f_args]
+      named = {name: f(scope) for name, f in f_named} if f_named else None
+      s = mod.bind(args, named)
+      s.vars[SCAD_CHILDREN] = (child_x, scope)
+      mod.body(s)
+    return inst
+
+  def s_if_stmt(self, node: ScadNode) -> ScadExec:
+    f_cond, then, otherwise = self.expr(node[1]), self.stmt(node[2]), self.stmt(node[3])
+    def cond(scope: ScadScope) -> None:
+      x = then if scad_truthy(f_cond(scope)) else otherwise
+      if x is not None:
+        x(scope)
+    return cond
+
+  def s_for_stmt(self, node: ScadNode) -> ScadExec:
+    body = self.stmt(node[2]) or (lambda scope: None)
+    return self.loops(self.assignments(node[1]), body)
+
+  def s_let_stmt(self, node: ScadNode) -> ScadExec:
+    fs, body = self.assignments(node[1]), self.stmt(node[2])
+    def let(scope: ScadScope) -> None:
+      d: dict[str, typing.Any] = {}
+      s = ScadScope(d, scope)
+      for name, f in fs:
+        d[name] = f(s)
+      if body is not None:
+        body(s)
+    return let
+
+  def s_assert_stmt(self, node: ScadNode) -> ScadExec:
+    _, args, child, pos, text = node
+    check, child_x = self.assertion(args, pos, text), self.stmt(child)
+    def asrt(scope: ScadScope) -> None:
+      check(scope)
+      if child_x is not None:
+        child_x(scope)
+    return asrt
+
+  def s_echo_stmt(self, node: ScadNode) -> ScadExec:
+    _, args, child, pos, text = node
+    echo, child_x = self.echo(args), self.stmt(child)
+    def ech(scope: ScadScope) -> None:
+      echo(scope)
+      if child_x is not None:
+        child_x(scope)
+    return ech
+
+SCAD_CHILDREN = " children"
+"Key in a module's scope for its children and the scope they are in."
+
+# ---- OpenSCAD evaluator: files and suites ----
+
+RE_LIBRARY_PATH = regex.compile(r"<([^>]*+)>")
+
+def library_candidates(name: str, from_dir: str) -> list[str]:
+  "Where a library is looked for: next to the file that uses it, then in OPENSCADPATH."
+  return [ os.path.abspath(os.path.join(d, name))
+    for d in [from_dir, *os.environ.get("OPENSCADPATH", "").split(os.pathsep)] if d ]
+
+def find_library(name: str, from_dir: str) -> Optional[str]:
+  "The first of library_candidates() that's a file."
+  for path in library_candidates(name, from_dir):
+    if os.path.isfile(path):
+      return path
+  return None
+
+class ScadUnit:
+  """
+  A file that was run or used, with the files that it includes.  A unit has
+  its own top level variables.
+  """
+  def __init__(self, filename: str):
+    self.filename = filename
+    self.scope = ScadScope({}, ScadScope(SCAD_BUILTIN_VARIABLES, None))
+    self.functions: dict[str, ScadFunction] = {}
+    self.modules: dict[str, ScadModule] = {}
+    self.uses: list["ScadUnit"] = []
+    self.commands: list[tuple[ScadCompiler, CharSlice]] = []
+    self.visible: Optional[tuple[dict[str, typing.Any], dict[str, ScadModule]]] = None
+
+  def lookup(self) -> tuple[dict[str, typing.Any], dict[str, ScadModule]]:
+    "Functions and modules callable from the unit.  Its own hide used ones."
+    if self.visible is None:
+      functions: dict[str, typing.Any] = dict(SCAD_BUILTIN_FUNCTIONS)
+      modules: dict[str, ScadModule] = {}
+      for used in reversed(self.uses):
+        functions.update(used.functions)
+        modules.update(used.modules)
+      functions.update(self.functions)
+      modules.update(self.modules)
+      self.visible = (functions, modules)
+    return self.visible
+
+  def function(self, name: str) -> typing.Any:
+    return self.lookup()[0].get(name)
+
+  def module(self, name: str) -> Optional[ScadModule]:
+    return self.lookup()[1].get(name)
+
+class EvalFailure(TypedDict):
+  statement: str
+  message  : str
+  filename : str
+  line     : int
+
+class EvalSuiteResult(TypedDict):
+  filename  : str
+  passed    : bool
+  statements: int
+  asserts   : int
+  failures  : list[EvalFailure]
+  warnings  : list[str]
+  echoes    : list[str]
+  seconds   : float
+
+SCAD_RECURSION_LIMIT = 200000
+"Python recursion limit while evaluating.  Tail calls don't count towards it."
+
+class ScadEvaluator:
+  """
+  Runs test suites.  Used files are loaded once and shared by all suites run
+  by the same evaluator.
+  """
+  def __init__(self) -> None:
+    self.units: dict[str, ScadUnit] = {}
+    self.asserts = 0
+    self.warnings: dict[str, int] = {}
+    self.echoes: list[str] = []
+
+  def warn(self, message: str, src: ScadSource, pos: int) -> None:
+    key = f"{src.filename}:{src.line(pos)}: {message}"
+    self.warnings[key] = self.warnings.get(key, 0) + 1
+
+  def invoke(self, fn: typing.Any, args: list, named: Optional[dict[str, typing.Any]],
+      src: ScadSource, pos: int) -> typing.Any:
+    "Calls fn, looping on the tail calls that it returns."
+    while True:
+      if type(fn) is ScadFunction:
+        if fn.lazy is not None:
+          fn.compile()
+        result = fn.body(fn.bind(args, named))
+        if type(result) is TailCall:
+          fn, args, named = result.fn, result.args, result.named
+          continue
+        return result
+      if fn is None:
+        return None
+      if callable(fn):
+        return fn(self, args, named)
+      self.warn(f"Can't call {scad_str(fn, True)}", src, pos)
+      return None
+
+  def load(self, filename: str) -> ScadUnit:
+    """
+    Loads a file and the files it uses, then evaluates its top level
+    variables.
+
+    Parameters
+    ----------
+    filename : str
+        File to load.
+
+    Returns
+    -------
+    ScadUnit
+        The loaded file.
+    """
+    key = os.path.abspath(filename)
+    unit = self.units.get(key)
+    if unit is not None:
+      return unit
+    unit = ScadUnit(key)
+    self.units[key] = unit
+    try:
+      values: dict[str, tuple[ScadCompiler, ScadNode]] = {}
+      use_paths: list[str] = []
+      self.add_file(unit, key, values, use_paths, 0)
+      for path in use_paths:
+        unit.uses.append(self.load(path))
+      d = unit.scope.vars
+      for name, (compiler, node) in values.items():
+        d[name] = compiler.expr(node)(unit.scope)
+    except BaseException:
+      del self.units[key]
+      raise
+    return unit
+
+  def add_file(self, unit: ScadUnit, filename: str, values: dict[str, tuple[ScadCompiler, ScadNode]],
+      use_paths: list[str], depth: int) -> None:
+    "Adds the items of a file to unit.  Included files are added in place."
+    src = scad_source(filename)
+    content = src.content
+    compiler = ScadCompiler(self, unit, src)
+    from_dir = os.path.dirname(filename)
+    stop = unparsed_at(content, src.items)
+    if stop is not None:
+      raise ScadError("Parse error", src, stop)
+
+    for item in src.items:
+      kind, slc = item[DOC_TYPE], item[DOC_SLC]
+      if kind == "use" or kind == "include":
+        m = RE_LIBRARY_PATH.search(content, slc.start, slc.stop)
+        assert m
+        path = find_library(m[1], from_dir)
+        if path is None:
+          self.warn(f"Can't open library '{m[1]}'", src, slc.start)
+        elif kind == "use":
+          use_paths.append(path)
+        elif depth < 100:
+          self.add_file(unit, path, values, use_paths, depth + 1)
+        else:
+          raise ScadError(f"Includes nested too deeply at '{m[1]}'", src, slc.start)
+      elif kind in NONTYPE_SYMBOLS:
+        name = content[item[DOC_S_ID_SLC]]
+        if kind == "function":
+          unit.functions[name] = ScadFunction(name, unit.scope, lazy=(compiler, item))
+        elif kind == "module":
+          unit.modules[name] = ScadModule(name, unit.scope, lazy=(compiler, item))
+        else:
+          # Keeps the place of the first assignment.
+          values[name] = (compiler, src.ast(item).root)
+      elif kind == "cmd" or kind == "UNKNOWN":
+        unit.commands.append((compiler, slc))
+
+  def failure(self, e: BaseException, statement: str) -> EvalFailure:
+    if isinstance(e, ScadError):
+      return { "statement": statement, "message": e.message, "filename": e.filename, "line": e.line }
+    message = "Recursion too deep" if isinstance(e, RecursionError) else f"{type(e).__name__}: {e}"
+    return { "statement": statement, "message": message, "filename": "", "line": 0 }
+
+  def run_suite(self, filename: str) -> EvalSuiteResult:
+    """
+    Runs each top level statement of a suite.  Unlike OpenSCAD, a failed
+    assert only stops the statement that it's in so later failures aren't
+    hidden.
+
+    Parameters
+    ----------
+    filename : str
+        Suite to run.
+
+    Returns
+    -------
+    EvalSuiteResult
+        What passed and failed.
+    """
+    start = time.perf_counter()
+    self.asserts = 0
+    self.warnings = {}
+    self.echoes = []
+    failures: list[EvalFailure] = []
+    statements = 0
+
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, SCAD_RECURSION_LIMIT))
+    try:
+      # The suite itself is reloaded each time it's run.
+      self.units.pop(os.path.abspath(filename), None)
+      try:
+        unit = self.load(filename)
+      except (ScadError, RecursionError, OSError) as e:
+        failures.append(self.failure(e, "<load>"))
+      else:
+        for compiler, slc in unit.commands:
+          statement = " ".join(compiler.src.content[slc].split())
+          statements += 1
+          try:
+            compiler.block(compiler.parse(slc, ScadParser.statements_to_end))(unit.scope)
+          except (ScadError, RecursionError) as e:
+            failures.append(self.failure(e, statement))
+    finally:
+      sys.setrecursionlimit(limit)
+
+    return {
+      "filename"  : filename,
+      "passed"    : not failures,
+      "statements": statements,
+      "asserts"   : self.asserts,
+      "failures"  : failures,
+      "warnings"  : [f"{key} (x{count})" if 1 < count else key for key, count in self.warnings.items()],
+      "echoes"    : self.echoes,
+      "seconds"   : time.perf_counter() - start,
+    }
+
+def run_eval(filenames: list[str]) -> bool:
+  """
+  Runs the suites with the evaluator and prints a line per suite, and one per
+  failure.  Echoes and warnings go to stderr.
+
+  Parameters
+  ----------
+  filenames : list[str]
+      Suites to run.
+
+  Returns
+  -------
+  bool
+      True if all suites passed.
+  """
+  ev = ScadEvaluator()
+  failed = 0
+  for filename in filenames:
+    result = ev.run_suite(filename)
+    for echo in result["echoes"]:
+      print(f"ECHO: {echo}", file=sys.stderr)
+    for warning in result["warnings"]:
+      print(f"WARNING: {warning}", file=sys.stderr)
+    if not result["passed"]:
+      failed += 1
+    print(f"{'ok  ' if result['passed'] else 'FAIL'} {filename}: {result['statements']} statements, "
+      f"{result['asserts']} asserts, {len(result['failures'])} failed, {result['seconds']:.3f}s")
+    # Failures are reported like OpenSCAD does so that the test runner can
+    # parse them the same way.
+    for failure in result["failures"]:
+      print(f"  {failure['statement']}\n"
+        f"    ERROR: {failure['message']} in file {failure['filename']}, line {failure['line']}")
+
+  print(f"{len(filenames)} suites, {failed} failed")
+  return failed == 0
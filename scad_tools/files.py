@@ -0,0 +1,42 @@
+"""
+Writing output files.  Shared with build-docs.py, so it doesn't import from
+scad_analysis.
+"""
+import hashlib
+import os
+import shutil
+
+def write_if_changed(out_name: str, text: str) -> bool:
+  """
+  Writes text to out_name unless the file already holds exactly that, so its
+  mtime only changes when its content does.  The text goes to a temporary
+  file next to out_name that then replaces it, so a partial file is never
+  visible.  The replaced file's mode is kept.
+
+  Returns
+  -------
+  bool
+      True if the file was written.
+  """
+  # Newlines are translated as when writing in text mode.
+  data = text.replace("\n", os.linesep).encode("utf-8")
+  exists = False
+  try:
+    with open(out_name, "rb") as f_in:
+      exists = True
+      if hashlib.sha256(f_in.read()).digest() == hashlib.sha256(data).digest():
+        return False
+  except OSError:
+    pass
+  tmp_name = f"{out_name}.{os.getpid()}.tmp"
+  try:
+    with open(tmp_name, "wb") as f_out:
+      f_out.write(data)
+    if exists:
+      shutil.copymode(out_name, tmp_name)
+    os.replace(tmp_name, out_name)
+  except BaseException:
+    if os.path.exists(tmp_name):
+      os.remove(tmp_name)
+    raise
+  return True
@@ -0,0 +1,155 @@
+"""
+Adversarial input suite for guarded parsing, run by --fuzz.
+"""
+import os
+import random
+import time
+import typing
+from typing import Optional
+
+from scad_analysis import (
+  DOC_SLC, DOC_S_DOC_SLC, DOC_TYPE, Doc, RE_J_DOC_BOX, get_items, is_doc,
+  is_sym_with_doc,
+)
+
+def _insert_at(text: str) -> typing.Callable[[str, int], str]:
+  return lambda content, pos: content[:pos] + text + content[pos:]
+
+def _remove_next(text: str) -> typing.Callable[[str, int], str]:
+  def remove(content: str, pos: int) -> str:
+    found = content.find(text, pos)
+    if found == -1:
+      found = content.rfind(text, 0, pos)
+    if found == -1:
+      return content
+    return content[:found] + content[found + len(text):]
+  return remove
+
+FUZZ_MUTATIONS: dict[str, typing.Callable[[str, int], str]] = {
+  "unbalanced-paren"   : _insert_at("("),
+  "unbalanced-bracket" : _insert_at("["),
+  "unbalanced-brace"   : _insert_at("{"),
+  "unbalanced-quote"   : _insert_at('"'),
+  "stray-close"        : _insert_at(")"),
+  "unterminated-block" : _insert_at("/*"),
+  "deep-nesting"       : _insert_at("[" * 5000 + "(" * 5000),
+  "doc-missing-end"    : _remove_next("*/"),
+  "missing-semicolon"  : _remove_next(";"),
+  "truncated"          : lambda content, pos: content[:pos],
+}
+"Malformed input generators.  Each takes (content, position) and returns the mutated content."
+
+def fuzz_parse(content: str, timeout: float) -> tuple[int, int]:
+  """
+  Parses content in guarded mode, including the JSDoc grammar for each doc.
+
+  Parameters
+  ----------
+  content : str
+      Content to parse.
+  timeout : float
+      Per item regex timeout in seconds.
+
+  Returns
+  -------
+  tuple[int, int]
+      (item count, count of skipped items and timed out docs)
+  """
+  items = get_items(content, timeout)
+  skipped = sum(1 for item in items if item[DOC_TYPE] == "UNKNOWN")
+  for item in items:
+    if is_sym_with_doc(item):
+      doc = content[item[DOC_S_DOC_SLC]]
+    elif is_doc(item):
+      doc = content[item[DOC_SLC]]
+    else:
+      continue
+    try:
+      Doc.RE_FN_DOC.match(RE_J_DOC_BOX.sub("", doc), partial=True, timeout=timeout)
+    except TimeoutError:
+      skipped += 1
+  return len(items), skipped
+
+def run_fuzz(filenames: list[str], count: int, limit: float, seed: int, out_dir: Optional[str],
+    regex_timeout: Optional[float]) -> bool:
+  """
+  Runs the adversarial input suite over the files.
+
+  Each file must first give the same items parsed with and without the guard.
+  Then every mutation in FUZZ_MUTATIONS is applied to the middle of each file,
+  and count more are applied at random positions.  Each case must be parsed
+  within limit seconds.
+
+  Parameters
+  ----------
+  filenames : list[str]
+      Files to use as the seed corpus.
+  count : int
+      Number of random cases to generate.
+  limit : float
+      Time limit in seconds for parsing a case.
+  seed : int
+      Random seed.
+  out_dir : Optional[str]
+      If set, the inputs of failed cases are written here.
+  regex_timeout : Optional[float]
+      Per item regex timeout of the guarded parse.  Default: a quarter of limit.
+
+  Returns
+  -------
+  bool
+      True if all cases passed.
+  """
+  rng = random.Random(seed)
+  timeout = regex_timeout or limit / 4
+
+  corpus: dict[str, str] = {}
+  for filename in filenames:
+    with open(filename, "r", encoding="utf-8") as f:
+      corpus[filename] = f.read()
+
+  cases: list[tuple[str, str, int]] = [
+    (filename, mutation, len(content) // 2)
+    for filename, content in corpus.items()
+    for mutation in FUZZ_MUTATIONS
+  ]
+  for _ in range(count):
+    filename = rng.choice(filenames)
+    cases.append((filename, rng.choice(list(FUZZ_MUTATIONS)), rng.randrange(len(corpus[filename]) + 1)))
+
+  failed = 0
+  for filename, content in corpus.items():
+    # Guarded mode only differs where the unguarded parse fails or is slow.
+    if get_items(content, timeout) != get_items(content):
+      failed += 1
+      print(f"FAIL {filename}:guarded: items differ from the unguarded parse")
+
+  slowest = (0.0, "")
+  for filename, mutation, pos in cases:
+    content = FUZZ_MUTATIONS[mutation](corpus[filename], pos)
+    line = corpus[filename].count("\n", 0, pos) + 1
+    name = f"{filename}:{line}:{mutation}"
+    start = time.perf_counter()
+    try:
+      item_count, skipped = fuzz_parse(content, timeout)
+      error = None
+    except Exception as e:
+      item_count, skipped = 0, 0
+      error = f"{type(e).__name__}: {e}"
+    elapsed = time.perf_counter() - start
+    slowest = max(slowest, (elapsed, name))
+
+    if error or limit < elapsed:
+      failed += 1
+      print(f"FAIL {name}: {elapsed:.3f}s {error or 'exceeded time limit'}")
+      if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+        out_name = os.path.join(out_dir,
+          f"{os.path.basename(filename)}.{line}.{mutation}.scad")
+        with open(out_name, "w", encoding="utf-8") as out_f:
+          out_f.write(content)
+    elif skipped:
+      print(f"ok   {name}: {elapsed:.3f}s {item_count} items, {skipped} skipped")
+
+  print(f"{len(corpus) + len(cases)} cases, {failed} failed, slowest {slowest[0]:.3f}s ({slowest[1]})")
+  return failed == 0
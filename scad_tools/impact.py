@@ -0,0 +1,250 @@
+"""
+Test impact analysis for --impact: the test entry points that a change can
+affect.
+"""
+import builtins
+import json
+import os
+import regex
+import sys
+import typing
+from typing import Optional
+
+from scad_analysis import DOC_SLC, DOC_S_DOC_SLC, DOC_TYPE, is_sym_with_doc, is_symbol
+from scad_tools.evaluator import scad_source
+from scad_tools.runner import RE_CALLED_NAME, TestEntry, discover_tests, report_suite_problems
+from scad_tools.bundler import (
+  BundleSymbol, BundleUnit, bundle_references, bundle_resolve, load_bundle_unit,
+)
+
+RE_DIFF_FILE = regex.compile(r"^\+\+\+ (?:b/)?(.*?)\t?$")
+RE_DIFF_HUNK = regex.compile(r"^@@ -\d++(?:,\d++)? \+(\d++)(?:,(\d++))? @@")
+RE_DIFF_DECLARATION = regex.compile(r"^([-+])(?:\s*+(?:function|module)\s++(\w++)|(\w++)\s*+=)")
+
+def parse_unified_diff(text: str, base_dir: str) -> dict[str, Optional[list[tuple[int, int]]]]:
+  """
+  The lines that a unified diff changes in each file.
+
+  Parameters
+  ----------
+  text : str
+      The diff.  Git's a/ and b/ prefixes are optional.
+  base_dir : str
+      What the paths in the diff are relative to.
+
+  Returns
+  -------
+  dict[str, Optional[list[tuple[int, int]]]]
+      Absolute path -> first and last changed line of each hunk, counted in
+      the new file.  None if the file was deleted or a declaration was removed
+      from it, since what referred to it can't be told.  A hunk that only removes
+      lines has the last line before them first and the first line after them
+      last, so its last line is before its first.
+  """
+  changes: dict[str, Optional[list[tuple[int, int]]]] = {}
+  declarations: dict[str, dict[str, set[str]]] = {}
+  "path -> - or + -> names declared on removed or added lines"
+  path: Optional[str] = None
+  for line in text.splitlines():
+    m = RE_DIFF_DECLARATION.match(line)
+    if m and path is not None and not line.startswith(("--- ", "+++ ")):
+      declarations.setdefault(path, { "-": set(), "+": set() })[m[1]].add(m[2] or m[3])
+      continue
+    m = RE_DIFF_FILE.match(line)
+    if m:
+      path = None if m[1] == "/dev/null" else os.path.abspath(os.path.join(base_dir, m[1]))
+      if path is not None and changes.get(path) is None:
+        changes[path] = []
+      continue
+    if line.startswith("--- ") and not line.startswith("--- /dev/null"):
+      # Known as deleted until its +++ line says otherwise.
+      old = regex.sub(r"^--- (?:a/)?(.*?)\t?$", r"\1", line)
+      changes.setdefault(os.path.abspath(os.path.join(base_dir, old)), None)
+      continue
+    m = RE_DIFF_HUNK.match(line)
+    if m and path is not None:
+      start, count = int(m[1]), int(m[2]) if m[2] is not None else 1
+      ranges = changes[path]
+      assert ranges is not None
+      # A hunk that adds nothing starts at the line before the removed lines.
+      ranges.append((start, start + count - 1) if count else (start + 1, start))
+  for path, names in declarations.items():
+    if names["-"] - names["+"]:
+      changes[path] = None
+  return changes
+
+def impact_changes(sources: list[str]) -> Optional[dict[str, Optional[list[tuple[int, int]]]]]:
+  """
+  The changed lines of each file, from diffs or whole files.
+
+  Parameters
+  ----------
+  sources : list[str]
+      Each is - for a unified diff on stdin, a unified diff file, a changed
+      file, all of whose lines are taken as changed, or else git revisions to
+      diff the working tree with, like HEAD or main...
+
+  Returns
+  -------
+  Optional[dict[str, Optional[list[tuple[int, int]]]]]
+      See parse_unified_diff().  A changed file is given as [(1, its line
+      count)].  None if git failed.
+  """
+  import subprocess
+  changes: dict[str, Optional[list[tuple[int, int]]]] = {}
+  for source in sources:
+    if source == "-":
+      found = parse_unified_diff(sys.stdin.read(), ".")
+    elif os.path.isfile(source):
+      with open(source, "r", encoding="utf-8") as f_in:
+        content = f_in.read()
+      if content.startswith(("diff ", "--- ", "Index: ")):
+        found = parse_unified_diff(content, ".")
+      else:
+        found = { os.path.abspath(source): [(1, content.count("\n") + 1)] }
+    else:
+      try:
+        top = subprocess.run(["git", "rev-parse", "--show-toplevel"],
+          capture_output=True, text=True, check=True).stdout.strip()
+        diff = subprocess.run(["git", "diff", "-U0", "--no-color", "--no-ext-diff", source, "--"],
+          capture_output=True, text=True, check=True).stdout
+      except subprocess.CalledProcessError as e:
+        print(f"ERROR: {' '.join(e.cmd)}: {e.stderr.strip()}", file=sys.stderr)
+        return None
+      found = parse_unified_diff(diff, top)
+    for path, ranges in found.items():
+      if ranges is None or changes.get(path, []) is None:
+        changes[path] = None
+      else:
+        changes[path] = changes.get(path, []) + ranges # type: ignore[operator]
+  return changes
+
+def impacted_tests(entries: list[TestEntry], changes: dict[str, Optional[list[tuple[int, int]]]]) -> list[TestEntry]:
+  """
+  The test entry points that can observe the changes.
+
+  Changed lines are mapped to the functions, modules and values around them.
+  Whatever refers to a changed symbol, transitively, is changed too, with
+  names resolved like --bundle resolves them.  An entry is affected when its
+  test module is.  Comments and docs don't affect anything.  Any other change
+  outside of a symbol, like to a use, an include or a top level command, or a
+  deleted file, affects every entry of the suites loading that file.
+
+  Parameters
+  ----------
+  entries : list[TestEntry]
+      Entry points to choose from.
+  changes : dict[str, Optional[list[tuple[int, int]]]]
+      From impact_changes().
+
+  Returns
+  -------
+  list[TestEntry]
+      The affected entries, in the order given.
+  """
+  units: dict[str, BundleUnit] = {}
+  known: dict[tuple[str, int], BundleSymbol] = {}
+  suite_units: dict[str, BundleUnit] = {}
+  for suite in dict.fromkeys(entry["suite"] for entry in entries):
+    suite_units[suite] = load_bundle_unit(suite, units, known)
+  by_place = { (os.path.abspath(sym.src.filename), sym.slc.start): sym for sym in known.values() }
+
+  # What each suite loads or tries to.
+  suite_paths: dict[str, set[str]] = {}
+  for suite, unit in suite_units.items():
+    paths: set[str] = set()
+    pending = [unit]
+    seen = { builtins.id(unit) }
+    while pending:
+      current = pending.pop()
+      paths.update(os.path.abspath(src.filename) for src, _ in current.sources)
+      # A deleted library is only known by where it was looked for.
+      paths.update(current.missing)
+      for used in current.uses:
+        if builtins.id(used) not in seen:
+          seen.add(builtins.id(used))
+          pending.append(used)
+    suite_paths[suite] = paths
+
+  changed: set[BundleSymbol] = set()
+  changed_files: set[str] = set()
+  for path, ranges in changes.items():
+    if ranges is None or not os.path.isfile(path):
+      changed_files.add(path)
+      continue
+    src = scad_source(path)
+    # (first line, last line, symbol or None for a doc or a comment, or the
+    # item type of anything else)
+    spans: list[tuple[int, int, typing.Union[BundleSymbol, None, str]]] = []
+    for item in src.items:
+      slcs = [item[DOC_SLC], item[DOC_S_DOC_SLC]] if is_sym_with_doc(item) else [item[DOC_SLC]]
+      for i, slc in enumerate(slcs):
+        what: typing.Union[BundleSymbol, None, str] = None
+        if i == 0 and is_symbol(item):
+          what = by_place.get((path, slc.start))
+        elif i == 0 and item[DOC_TYPE] not in ("comment", "doc"):
+          what = item[DOC_TYPE]
+        spans.append((src.line(slc.start), src.line(max(slc.start, slc.stop - 1)), what))
+
+    for start, end in ranges:
+      if end < start:
+        # Lines went between end and start.  Unless that's inside one span,
+        # something like a whole symbol went.
+        around = [ what for first, last, what in spans if first <= end and start <= last ]
+        if not around:
+          changed_files.add(path)
+      else:
+        around = [ what for first, last, what in spans if start <= last and first <= end ]
+      for what in around:
+        if isinstance(what, BundleSymbol):
+          changed.add(what)
+        elif isinstance(what, str):
+          changed_files.add(path)
+
+  referrers: dict[BundleSymbol, list[BundleSymbol]] = {}
+  for sym in known.values():
+    for _, name, is_call in bundle_references(sym.src, sym.item, sym.id_slc.stop):
+      for target in bundle_resolve(sym.unit, name, is_call):
+        if target is not sym:
+          referrers.setdefault(target, []).append(sym)
+  affected = set(changed)
+  pending_syms = list(changed)
+  while pending_syms:
+    for referrer in referrers.get(pending_syms.pop(), []):
+      if referrer not in affected:
+        affected.add(referrer)
+        pending_syms.append(referrer)
+
+  result: list[TestEntry] = []
+  for entry in entries:
+    unit = suite_units[entry["suite"]]
+    m = RE_CALLED_NAME.match(entry["call"])
+    test = unit.callable("module", m[1]) if m else None
+    if suite_paths[entry["suite"]] & changed_files or test is None or test in affected:
+      result.append(entry)
+  return result
+
+def run_impact(filenames: list[str], sources: list[str], as_json: bool,
+    allow_empty: bool, listed: bool = True) -> Optional[list[TestEntry]]:
+  """
+  Prints the test entry points that the changes can affect, unless not listed
+  and not as_json, and returns them.
+  Returns None if the changes can't be read or a suite fails without being
+  run, as its entry points can't be known.
+  """
+  changes = impact_changes(sources)
+  if changes is None:
+    return None
+  entries, problems = discover_tests(filenames, allow_empty)
+  if problems:
+    report_suite_problems(problems)
+    return None
+  affected = impacted_tests(entries, changes)
+  if as_json:
+    print(json.dumps(affected, indent=2))
+  elif listed:
+    for entry in affected:
+      print(f"{entry['suite']}: {entry['name']}")
+  print(f"{len(affected)} of {len(entries)} entries in {len({ e['suite'] for e in affected })} of "
+    f"{len({ e['suite'] for e in entries })} suites can observe the changes to {len(changes)} files", file=sys.stderr)
+  return affected
@@ -0,0 +1,341 @@
+"""
+Rule engine for performance anti-patterns, run by --lint.
+"""
+import builtins
+import json
+import os
+import regex
+import sys
+import typing
+from abc import ABC, abstractmethod
+from typing import Optional, TypedDict
+
+from scad_analysis import (
+  CharSlice, DOC_SLC, DOC_S_ID_SLC, DOC_TYPE, ItemType, LinePair, get_lines, is_symbol,
+  normalize_code,
+)
+from scad_tools.evaluator import (
+  RE_LIBRARY_PATH, ScadAst, ScadError, ScadNode, ScadSource, find_library, scad_source,
+)
+from scad_tools.bundler import item_tokens
+
+SCAD_PAIR_LIST_NODES = frozenset((
+  "let", "let_elem", "for", "cfor", "lambda", "call", "assert", "echo",
+  "for_stmt", "let_stmt", "assert_stmt", "echo_stmt", "inst",
+))
+"Nodes whose lists hold (name, node) pairs rather than nodes."
+
+def scad_node_children(node: ScadNode) -> typing.Iterator[ScadNode]:
+  "The nodes directly under a ScadParser node."
+  pairs = node[0] in SCAD_PAIR_LIST_NODES
+  for member in node[1:]:
+    if isinstance(member, list):
+      for el in member:
+        if not pairs:
+          yield el
+        elif el[1] is not None:
+          yield el[1]
+    elif isinstance(member, tuple):
+      yield member
+
+class LintFinding(TypedDict):
+  rule: str
+  file: str
+  symbol: Optional[str]
+  lines: LinePair
+  message: str
+
+class LintContext:
+  "The file and symbol being linted and the path from the symbol's root to a node."
+  def __init__(self, filename: str, src: ScadSource):
+    self.filename = filename
+    self.src = src
+    self.findings: list[LintFinding] = []
+    self.symbol: Optional[str] = None
+    self.kind: Optional[ItemType] = None
+    self.ast: Optional[ScadAst] = None
+    self.ancestors: list[ScadNode] = []
+
+  def call_name(self, node: ScadNode) -> Optional[str]:
+    "Name called by a call node, if it's a plain name."
+    return node[1][1] if node[0] == "call" and node[1][0] == "var" else None
+
+  def call_slice(self, node: ScadNode) -> CharSlice:
+    "Source of a node of the symbol being linted."
+    assert self.ast is not None
+    return self.ast.span(node)
+
+  def call_text(self, node: ScadNode) -> str:
+    return normalize_code(self.src.content[self.call_slice(node)])
+
+  def in_loop_body(self, node: ScadNode, comprehension_only: bool) -> Optional[ScadNode]:
+    "The innermost loop whose body, which runs on every iteration, holds node."
+    path = self.ancestors + [node]
+    for i in range(len(self.ancestors) - 1, -1, -1):
+      loop, child = path[i], path[i + 1]
+      if loop[0] == "for" and child is loop[2] \
+          or loop[0] == "cfor" and any(child is n for n in loop[2:] if isinstance(n, tuple)) \
+          or loop[0] == "cfor" and any(child is value for _, value in loop[3]) \
+          or not comprehension_only and loop[0] == "for_stmt" and child is loop[2]:
+        return loop
+    return None
+
+  def report(self, rule: "LintRule | FileLintRule", slc: CharSlice, message: str) -> None:
+    self.findings.append({
+      "rule": rule.name,
+      "file": self.filename,
+      "symbol": self.symbol,
+      "lines": get_lines(slc, self.src.lines),
+      "message": message,
+    })
+
+class LintRule(ABC):
+  """
+  A rule that sees every node of each function, module and value body, in
+  one walk shared by all rules.  begin and end bracket each symbol.
+  """
+  name = ""
+  description = ""
+
+  def begin(self, ctx: LintContext) -> None:
+    pass
+
+  @abstractmethod
+  def visit(self, node: ScadNode, ctx: LintContext) -> None:
+    ...
+
+  def end(self, ctx: LintContext) -> None:
+    pass
+
+class FileLintRule(ABC):
+  "A rule that checks a file's items."
+  name = ""
+  description = ""
+
+  @abstractmethod
+  def check_file(self, ctx: LintContext) -> None:
+    ...
+
+class ConcatInRecursion(LintRule):
+  name = "concat-in-recursion"
+  description = "concat() building a list across recursive calls copies it each time, so it's quadratic."
+
+  def visit(self, node: ScadNode, ctx: LintContext) -> None:
+    if ctx.kind != "function" or ctx.call_name(node) != "concat":
+      return
+    passed = any(ctx.call_name(anc) == ctx.symbol for anc in ctx.ancestors)
+    pending = [node]
+    while pending and not passed:
+      n = pending.pop()
+      passed = ctx.call_name(n) == ctx.symbol
+      pending.extend(child for child in scad_node_children(n) if child[0] != "lambda")
+    if passed:
+      ctx.report(self, ctx.call_slice(node), f"concat() around a recursive call of {ctx.symbol}() "
+        "copies the list on every level.  Build it with a list comprehension instead.")
+
+class LenInComprehension(LintRule):
+  name = "len-in-comprehension"
+  description = "The same len() evaluated more than once on every iteration of a list comprehension."
+
+  def begin(self, ctx: LintContext) -> None:
+    self.seen: dict[tuple[int, str], list[CharSlice]] = {}
+
+  def visit(self, node: ScadNode, ctx: LintContext) -> None:
+    if ctx.call_name(node) == "len":
+      loop = ctx.in_loop_body(node, True)
+      if loop is not None:
+        self.seen.setdefault((builtins.id(loop), ctx.call_text(node)), []).append(ctx.call_slice(node))
+
+  def end(self, ctx: LintContext) -> None:
+    for (_, text), slcs in self.seen.items():
+      if len(slcs) > 1:
+        ctx.report(self, slice(slcs[0].start, slcs[-1].stop),
+          f"{text} is evaluated {len(slcs)} times per iteration.  Bind it once with let.")
+
+class SearchInLoop(LintRule):
+  name = "search-in-loop"
+  description = "search() scans its list, so calling it on every iteration is quadratic."
+
+  def visit(self, node: ScadNode, ctx: LintContext) -> None:
+    if ctx.call_name(node) == "search" and ctx.in_loop_body(node, False) is not None:
+      ctx.report(self, ctx.call_slice(node),
+        f"{ctx.call_text(node)} scans a list on every iteration.  Consider a lookup table built once.")
+
+class LetRecompute(LintRule):
+  name = "let-recompute"
+  description = "A let chain computing the same call in more than one assignment."
+
+  def visit(self, node: ScadNode, ctx: LintContext) -> None:
+    if node[0] not in ("let", "let_elem", "let_stmt") \
+        or ctx.ancestors and ctx.ancestors[-1][0] in ("let", "let_elem", "let_stmt") \
+          and ctx.ancestors[-1][2] is node:
+      return
+    # The whole chain of lets, each the body of the one before.
+    assigns: list[tuple[str, ScadNode]] = []
+    chain = node
+    while chain[0] in ("let", "let_elem", "let_stmt"):
+      assigns += chain[1]
+      chain = chain[2]
+    seen: dict[str, list[tuple[int, ScadNode]]] = {}
+    for i, (_, value) in enumerate(assigns):
+      pending = [value]
+      while pending:
+        n = pending.pop()
+        if n[0] == "lambda":
+          continue
+        # Calls without arguments are usually curried, so cheap.
+        if ctx.call_name(n) is not None and n[2]:
+          seen.setdefault(ctx.call_text(n), []).append((i, n))
+        pending.extend(scad_node_children(n))
+    # Longest first, so that calls within a repeated call aren't reported too.
+    reported: list[CharSlice] = []
+    for text, uses in sorted(seen.items(), key=lambda kv: -len(kv[0])):
+      first, last = min(i for i, _ in uses), max(i for i, _ in uses)
+      if first == last:
+        continue
+      names = set(regex.findall(r"\$?+[a-zA-Z_]\w*+", text))
+      if any(name in names for name, _ in assigns[first:last]):
+        continue
+      slcs = sorted((ctx.call_slice(n) for _, n in uses), key=lambda slc: slc.start)
+      if all(any(r.start <= slc.start and slc.stop <= r.stop for r in reported) for slc in slcs):
+        continue
+      reported += slcs
+      ctx.report(self, slice(slcs[0].start, slcs[-1].stop),
+        f"{text} is computed in {len({ i for i, _ in uses })} assignments of one let chain.  "
+        "Assign it once and reuse it.")
+
+class IncludeNotUse(FileLintRule):
+  name = "include-not-use"
+  description = "include of a file whose values and commands aren't needed, where use would do."
+
+  def check_file(self, ctx: LintContext) -> None:
+    content = ctx.src.content
+    referenced: set[str] = set()
+    for item in ctx.src.items:
+      if item[DOC_TYPE] in ("function", "module", "value", "cmd"):
+        try:
+          referenced.update(text for kind, text, _ in item_tokens(ctx.src, item) if kind == "name")
+        except ScadError:
+          return
+    for item in ctx.src.items:
+      if item[DOC_TYPE] != "include":
+        continue
+      m = RE_LIBRARY_PATH.search(content, item[DOC_SLC].start, item[DOC_SLC].stop)
+      assert m
+      found = find_library(m[1], os.path.dirname(os.path.abspath(ctx.filename)))
+      if found is None:
+        continue
+      values: set[str] = set()
+      has_cmds = False
+      pending, loaded = [found], set()
+      while pending:
+        path = pending.pop()
+        if path in loaded:
+          continue
+        loaded.add(path)
+        inc_src = scad_source(path)
+        inc_content = inc_src.content
+        for inc_item in inc_src.items:
+          if inc_item[DOC_TYPE] == "value":
+            values.add(inc_content[inc_item[DOC_S_ID_SLC]]) # type: ignore[misc]
+          elif inc_item[DOC_TYPE] == "cmd":
+            has_cmds = True
+          elif inc_item[DOC_TYPE] == "include":
+            inc_m = RE_LIBRARY_PATH.search(inc_content, inc_item[DOC_SLC].start, inc_item[DOC_SLC].stop)
+            inc_found = inc_m and find_library(inc_m[1], os.path.dirname(path))
+            if inc_found:
+              pending.append(inc_found)
+      if not has_cmds and not values & referenced:
+        ctx.report(self, item[DOC_SLC], f"None of the values of <{m[1]}> are used here, so use <{m[1]}> "
+          "would do, unless this file is meant to pass its functions and modules on to files that use it.")
+
+LINT_RULES: list[type[LintRule] | type[FileLintRule]] = [
+  ConcatInRecursion, LenInComprehension, SearchInLoop, LetRecompute, IncludeNotUse,
+]
+
+def lint_file(filename: str, rules: list["LintRule | FileLintRule"]) -> list[LintFinding]:
+  """
+  Runs the rules over a file, parsing and walking each body once.
+
+  Parameters
+  ----------
+  filename : str
+      File to lint.
+  rules : list[LintRule | FileLintRule]
+      Rules to run.
+
+  Returns
+  -------
+  list[LintFinding]
+      Findings in the order found.
+  """
+  ctx = LintContext(filename, scad_source(filename))
+  content = ctx.src.content
+  node_rules = [rule for rule in rules if isinstance(rule, LintRule)]
+
+  def walk(node: ScadNode) -> None:
+    for rule in node_rules:
+      rule.visit(node, ctx)
+    ctx.ancestors.append(node)
+    for child in scad_node_children(node):
+      walk(child)
+    ctx.ancestors.pop()
+
+  for item in ctx.src.items:
+    if not is_symbol(item):
+      continue
+    ctx.symbol = content[item[DOC_S_ID_SLC]]
+    ctx.kind = item[DOC_TYPE]
+    try:
+      ctx.ast = ctx.src.ast(item)
+    except ScadError as e:
+      print(f"WARNING: {filename}:{e.line}: {ctx.symbol}: {e.message}", file=sys.stderr)
+      continue
+    for rule in node_rules:
+      rule.begin(ctx)
+    walk(ctx.ast.root)
+    for rule in node_rules:
+      rule.end(ctx)
+  ctx.symbol = ctx.kind = ctx.ast = None
+  for rule in rules:
+    if isinstance(rule, FileLintRule):
+      rule.check_file(ctx)
+  return ctx.findings
+
+def run_lint(filenames: list[str], rule_names: Optional[str], as_json: bool) -> bool:
+  """
+  Lints the files and prints the findings.
+
+  Parameters
+  ----------
+  filenames : list[str]
+      Files to lint.
+  rule_names : Optional[str]
+      Comma separated rules to run, or None for all.
+  as_json : bool
+      Print json instead of one line per finding.
+
+  Returns
+  -------
+  bool
+      True if there were no findings.
+  """
+  rules = [rule() for rule in LINT_RULES if rule_names is None or rule.name in rule_names.split(",")]
+  findings: list[LintFinding] = []
+  for filename in filenames:
+    try:
+      findings += lint_file(filename, rules)
+    except OSError as e:
+      print(f"ERROR: {e}", file=sys.stderr)
+  if as_json:
+    counts = { rule.name: 0 for rule in rules }
+    for finding in findings:
+      counts[finding["rule"]] += 1
+    print(json.dumps({ "rules": counts, "findings": findings }, indent=2))
+  else:
+    for finding in findings:
+      start, end = finding["lines"]
+      lines = f"{start}" if start == end else f"{start}-{end}"
+      symbol = f" {finding['symbol']}:" if finding["symbol"] else ""
+      print(f"{finding['file']}:{lines}: {finding['rule']}:{symbol} {finding['message']}")
+  return not findings
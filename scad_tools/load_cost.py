@@ -0,0 +1,181 @@
+"""
+Report of what use and include make OpenSCAD read, for --load-cost.
+"""
+import json
+import os
+import regex
+import sys
+from typing import Literal, TypedDict
+
+from scad_analysis import DOC_SLC, DOC_TYPE
+from scad_tools.evaluator import RE_LIBRARY_PATH, ScadSource, find_library, scad_source
+
+RE_COMMENT_OR_STRING = regex.compile(r'"(?:[^"\\]|\\.)*+"|(?<comment>//[^\n]*+|/\*(?:[^*]|\*(?!/))*+\*/)', regex.DOTALL)
+
+class FileCost(TypedDict):
+  bytes        : int
+  items        : int
+  "top level items"
+  comment_bytes: int
+  symbols      : dict[str, int]
+  "functions, modules and values"
+
+class LoadEdge(TypedDict):
+  source   : str
+  target   : str
+  kind     : Literal["use", "include"]
+  depth    : int
+  "how many edges there are from the entry file"
+  cost     : FileCost
+  "of the target itself"
+  lexed    : int
+  "bytes that loading it lexes, with what it includes and what it uses that\n" \
+  "wasn't loaded yet.  0 for a used file that was already loaded, since\n" \
+  "OpenSCAD reads used files once."
+  duplicate: bool
+  "an include of a file already included in the same scope"
+
+class LoadCost(TypedDict):
+  entry     : str
+  cost      : FileCost
+  edges     : list[LoadEdge]
+  lexed     : int
+  "bytes lexed in all, the entry included"
+  lex_counts: dict[str, int]
+  "file -> how often it is lexed"
+
+def file_cost(src: ScadSource) -> FileCost:
+  symbol_counts = { "function": 0, "module": 0, "value": 0 }
+  for item in src.items:
+    if item[DOC_TYPE] in symbol_counts:
+      symbol_counts[item[DOC_TYPE]] += 1
+  return {
+    "bytes": len(src.content.encode("utf-8")),
+    "items": len(src.items),
+    "comment_bytes": sum(len(m[0].encode("utf-8")) for m in RE_COMMENT_OR_STRING.finditer(src.content) if m["comment"]),
+    "symbols": symbol_counts,
+  }
+
+def load_cost(entry: str) -> LoadCost:
+  """
+  What loading a file makes OpenSCAD read, edge by edge.
+
+  Each file that is included is lexed again into its includer's scope, along
+  with everything that it includes.  A used file is read once, with what it
+  includes, and later uses of it cost nothing.
+
+  Parameters
+  ----------
+  entry : str
+      File to load.
+
+  Returns
+  -------
+  LoadCost
+      The edges are in the order that OpenSCAD follows them: includes in
+      place and each used file after the file using it.
+  """
+  costs: dict[str, FileCost] = {}
+  edges: list[LoadEdge] = []
+  lex_counts: dict[str, int] = {}
+  loaded: set[str] = set()
+
+  def cost_of(path: str) -> FileCost:
+    if path not in costs:
+      costs[path] = file_cost(scad_source(path))
+    return costs[path]
+
+  def lex(path: str, depth: int, scope: set[str], stack: list[str], uses: list[tuple[str, str, int]]) -> int:
+    "Lexes path into a scope and returns the bytes lexed, its includes included."
+    src = scad_source(path)
+    name = os.path.relpath(path)
+    lex_counts[name] = lex_counts.get(name, 0) + 1
+    lexed = cost_of(path)["bytes"]
+    for item in src.items:
+      if item[DOC_TYPE] not in ("use", "include"):
+        continue
+      m = RE_LIBRARY_PATH.search(src.content, item[DOC_SLC].start, item[DOC_SLC].stop)
+      found = find_library(m[1], os.path.dirname(path)) if m else None
+      if found is None:
+        print(f"WARNING: {src.filename}:{src.line(item[DOC_SLC].start)}: Can't open library "
+          f"'{m[1] if m else src.content[item[DOC_SLC]]}'.", file=sys.stderr)
+      elif item[DOC_TYPE] == "use":
+        uses.append((name, found, depth + 1))
+      elif found in stack:
+        print(f"WARNING: {src.filename}:{src.line(item[DOC_SLC].start)}: {os.path.relpath(found)} "
+          f"includes itself.", file=sys.stderr)
+      else:
+        edge: LoadEdge = { "source": name, "target": os.path.relpath(found), "kind": "include",
+          "depth": depth + 1, "cost": cost_of(found), "lexed": 0, "duplicate": found in scope }
+        edges.append(edge)
+        scope.add(found)
+        edge["lexed"] = lex(found, depth + 1, scope, stack + [found], uses)
+        lexed += edge["lexed"]
+    return lexed
+
+  def load(path: str, depth: int) -> int:
+    "Loads path as its own scope, then what it uses, and returns the bytes lexed."
+    loaded.add(path)
+    uses: list[tuple[str, str, int]] = []
+    lexed = lex(path, depth, { path }, [path], uses)
+    for source, used, used_depth in uses:
+      edge: LoadEdge = { "source": source, "target": os.path.relpath(used), "kind": "use",
+        "depth": used_depth, "cost": cost_of(used), "lexed": 0, "duplicate": False }
+      edges.append(edge)
+      if used not in loaded:
+        edge["lexed"] = load(used, used_depth)
+        lexed += edge["lexed"]
+    return lexed
+
+  path = os.path.abspath(entry)
+  lexed = load(path, 0)
+  return { "entry": os.path.relpath(path), "cost": cost_of(path), "edges": edges, "lexed": lexed,
+    "lex_counts": lex_counts }
+
+def format_cost(cost: FileCost) -> str:
+  symbol_counts = ", ".join(f"{count} {kind}s" for kind, count in cost["symbols"].items() if count)
+  return f"{cost['bytes']:,} bytes, {cost['items']} items, {cost['comment_bytes']:,} comment bytes" \
+    + (f", {symbol_counts}" if symbol_counts else "")
+
+def run_load_cost(filenames: list[str], heaviest: int, as_json: bool) -> bool:
+  """
+  Prints what loading each file reads: each use and include edge, the
+  heaviest of them, duplicate includes and files lexed more than once.
+  """
+  reports: list[LoadCost] = []
+  for filename in filenames:
+    try:
+      reports.append(load_cost(filename))
+    except OSError as e:
+      print(f"ERROR: {e}", file=sys.stderr)
+      return False
+  if as_json:
+    print(json.dumps(reports, indent=2))
+    return True
+
+  for report in reports:
+    print(f"{report['entry']}: {format_cost(report['cost'])}")
+    for edge in report["edges"]:
+      flags = " DUPLICATE" if edge["duplicate"] else ""
+      lexed = f"lexes {edge['lexed']:,} bytes" if edge["lexed"] else "already loaded"
+      print(f"{'  ' * edge['depth']}{edge['kind']} <{edge['target']}>: {lexed}{flags}"
+        f" ({format_cost(edge['cost'])})")
+    print(f"In all, {report['lexed']:,} bytes lexed from {len(report['lex_counts'])} files.")
+
+    ranked = sorted((edge for edge in report["edges"] if edge["lexed"]), key=lambda edge: -edge["lexed"])
+    if ranked:
+      print("Heaviest imports:")
+      for edge in ranked[:heaviest]:
+        print(f"  {edge['lexed'] * 100 / report['lexed']:5.1f}%  {edge['source']}: {edge['kind']} <{edge['target']}>")
+    duplicates = [ edge for edge in report["edges"] if edge["duplicate"] ]
+    if duplicates:
+      print("Duplicate includes:")
+      for edge in duplicates:
+        print(f"  {edge['source']}: include <{edge['target']}> was already included, lexing {edge['lexed']:,} bytes again")
+    repeated = { name: count for name, count in report["lex_counts"].items() if count > 1 }
+    if repeated:
+      print("Lexed more than once:")
+      for name, count in sorted(repeated.items(), key=lambda kv: -kv[1]):
+        print(f"  {name}: {count} times")
+    print()
+  return True
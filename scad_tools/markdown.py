@@ -0,0 +1,16 @@
+"""
+Markdown helpers.  Shared with build-docs.py, so it doesn't import from
+scad_analysis.
+"""
+import regex
+
+def github_heading_anchor(heading: str) -> str:
+  """The anchor GitHub generates for a markdown heading without an explicit one."""
+  anchor = regex.sub(r"\*\*(.+?)\*\*", r"\1", heading)  # bold
+  anchor = regex.sub(r"\*(.+?)\*", r"\1", anchor)  # italic
+  anchor = regex.sub(r"`(.+?)`", r"\1", anchor)  # code
+  anchor = anchor.lower()
+  # " : " becomes "--" (GitHub convention for colon with spaces)
+  anchor = anchor.replace(" : ", "--")
+  anchor = regex.sub(r"[^\w\s-]", "", anchor)
+  return regex.sub(r"\s+", "-", anchor.strip())
@@ -0,0 +1,188 @@
+"""
+Minifier with line maps for --minify, and --unminify to translate references
+back.
+"""
+import json
+import os
+import regex
+import sys
+from bisect import bisect_left, bisect_right
+from typing import Optional, TypedDict
+
+from scad_analysis import get_line_positions
+from scad_tools.files import write_if_changed
+
+RE_MINIFY_TOKEN = regex.compile(r'''
+  (?P<str>"(?:[^"\\]|\\.)*+")
+  | (?P<lib>\b(?:use|include)\s*+<[^>\n]*+>)
+  | (?P<ws>(?:\s++|//[^\n]*+|/\*(?:[^*]|\*(?!/))*+\*/)++)
+  | (?P<word>[\w$.]++)
+  | (?P<op>.)
+  ''', regex.VERBOSE | regex.DOTALL)
+
+RE_MINIFY_REF = regex.compile(r'(?<=\bin file )(?P<file>[^,\s]++), line (?P<line>\d++)|(?<![\w/.])(?P<file2>[\w/.-]++):(?P<line2>\d++)')
+
+class MinifyMap(TypedDict):
+  "How a minified file maps back to its source."
+  source: str
+  lines: list[int]
+  "Source line of each minified line."
+  segments: list[list[int]]
+  "[minified offset, source offset] of each run copied unchanged."
+
+RE_MINIFIED_FL = regex.compile(r'(?<![\w$.])(?:_fl\(|fl\("(?P<file>[^"\\]*+)",)(?P<line>\d++)\)')
+"A file line reference made with helpers' fl(), or the _fl() that a file defines with it, in minified text."
+
+def minify(content: str, filename: str = "") -> tuple[str, MinifyMap]:
+  """
+  Strips comments, which include docs, and collapses whitespace outside
+  strings.  Whitespace with a newline stays a newline so that each minified
+  line comes from a single source line.
+
+  The line literals of _fl() calls, and of fl() calls naming this file, are
+  renumbered to the minified lines of the source lines that they give.  Their
+  references then count in minified lines like OpenSCAD's own, and
+  unminify_refs() translates both back alike.
+
+  Parameters
+  ----------
+  content : str
+      Source to minify.
+  filename : str
+      Name of the source, to tell its fl() calls.
+
+  Returns
+  -------
+  tuple[str, MinifyMap]
+      The minified text and its map, without the source name.
+  """
+  def tokens(renumbered: dict[int, str]) -> tuple[str, list[list[int]]]:
+    "Minified text and segments, with the number tokens at the offsets in renumbered replaced."
+    out: list[str] = []
+    segments: list[list[int]] = []
+    size = 0
+    gap = ""
+    last = ""
+    for m in RE_MINIFY_TOKEN.finditer(content):
+      if m.lastgroup == "ws":
+        if "\n" in m[0]:
+          gap = "\n"
+        elif not gap:
+          gap = " "
+        continue
+      token = renumbered.get(m.start(), m[0])
+      if gap and last:
+        if gap == "\n" and last != "\n":
+          out.append("\n")
+          size += 1
+        elif (last[-1:].isalnum() or last[-1:] in "_$.") and (token[0].isalnum() or token[0] in "_$.") \
+            or last[-1:] == "/" and token[0] in "/*":
+          out.append(" ")
+          size += 1
+      gap = ""
+      segments.append([size, m.start()])
+      out.append(token)
+      size += len(token)
+      last = token
+    if out:
+      out.append("\n")
+    return "".join(out), segments
+
+  def source_lines_of(text: str, segments: list[list[int]]) -> list[int]:
+    lines = []
+    for line_start in get_line_positions(text):
+      i = bisect_right(segments, [line_start, len(content)]) - 1
+      out_off, src_off = segments[i] if i >= 0 else (0, 0)
+      lines.append(bisect_right(source_lines, src_off + line_start - out_off))
+    return lines
+
+  source_lines = get_line_positions(content)
+  text, segments = tokens({})
+  lines = source_lines_of(text, segments)
+
+  renumbered: dict[int, str] = {}
+  starts = [out_off for out_off, _ in segments]
+  for m in RE_MINIFIED_FL.finditer(text):
+    if m["file"] is not None and os.path.basename(m["file"]) != os.path.basename(filename):
+      continue
+    # The first minified line from the source line, or from the next one with code.
+    i = bisect_left(lines, int(m["line"]))
+    if i < len(lines):
+      renumbered[segments[bisect_left(starts, m.start("line"))][1]] = str(i + 1)
+  if renumbered:
+    text, segments = tokens(renumbered)
+  return text, { "source": "", "lines": lines, "segments": segments }
+
+def run_minify(filenames: list[str], out_dir: str) -> bool:
+  """
+  Writes a minified copy of each file to out_dir, with its map next to it as
+  NAME.map.json.
+
+  Parameters
+  ----------
+  filenames : list[str]
+      Files to minify.
+  out_dir : str
+      Directory for the minified files and maps.
+
+  Returns
+  -------
+  bool
+      True if every file was minified.
+  """
+  os.makedirs(out_dir, exist_ok=True)
+  ok = True
+  for filename in filenames:
+    try:
+      with open(filename, "r", encoding="utf-8") as f:
+        content = f.read()
+    except OSError as e:
+      print(f"ERROR: {e}", file=sys.stderr)
+      ok = False
+      continue
+    text, line_map = minify(content, filename)
+    line_map["source"] = os.path.abspath(filename)
+    out_file = os.path.join(out_dir, os.path.basename(filename))
+    write_if_changed(out_file, text)
+    write_if_changed(f"{out_file}.map.json", json.dumps(line_map, separators=(",", ":")))
+    print(f"{filename}: {len(content)} -> {len(text)} characters, "
+      f"{content.count(chr(10))} -> {len(line_map['lines'])} lines", file=sys.stderr)
+  return ok
+
+def unminify_refs(text: str, map_dir: str) -> str:
+  """
+  Translates "in file F, line L" and "F:L" references to minified files in
+  map_dir back to their source files and lines.  That includes references
+  made with fl(), whose lines minify() renumbered.
+
+  Parameters
+  ----------
+  text : str
+      Text with references, such as OpenSCAD's output.
+  map_dir : str
+      Directory given to --minify.
+
+  Returns
+  -------
+  str
+      The text with references translated.
+  """
+  maps: dict[str, Optional[MinifyMap]] = {}
+
+  def translate(m: regex.Match) -> str:
+    filename, line = (m["file"], m["line"]) if m["file"] else (m["file2"], m["line2"])
+    name = os.path.basename(filename)
+    if name not in maps:
+      try:
+        with open(os.path.join(map_dir, f"{name}.map.json"), "r", encoding="utf-8") as f:
+          maps[name] = json.load(f)
+      except (OSError, ValueError):
+        maps[name] = None
+    line_map = maps[name]
+    if line_map is None or not 1 <= int(line) <= len(line_map["lines"]):
+      return m[0]
+    source = os.path.relpath(line_map["source"])
+    source_line = line_map["lines"][int(line) - 1]
+    return f"{source}, line {source_line}" if m["file"] else f"{source}:{source_line}"
+
+  return RE_MINIFY_REF.sub(translate, text)
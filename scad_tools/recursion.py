@@ -0,0 +1,248 @@
+"""
+Recursion and tail-call report for --recursion.
+"""
+import math
+import os
+import sys
+import typing
+from typing import Literal, TypedDict
+
+from scad_tools.evaluator import ScadError
+from scad_tools.bundler import BundleSymbol, BundleUnit, load_bundle_unit
+
+class RecursiveCall(TypedDict):
+  callee: str
+  line: int
+  kind: Literal["tail", "mutual", "stack", "literal"]
+  "tail: a self call that OpenSCAD turns into a loop.  mutual: a call in tail\n" \
+  "position to another function in the cycle.  literal: a call in a function\n" \
+  "literal, made when the literal is called.  stack: any other call."
+
+class RecursionInfo(TypedDict):
+  file: str
+  name: str
+  line: int
+  cycle: list[str]
+  "Functions that recurse through each other, including this one."
+  eliminated: bool
+  "No recursive call grows the stack.  Tail self calls run as a loop and calls\n" \
+  "in function literals are made later, such as by a curried function."
+  calls: list[RecursiveCall]
+  depth_model: Literal["none", "linear", "logarithmic"]
+  depth: int
+  "Stack depth implied for the input size."
+
+RECURSION_BADGES = { "eliminated": "🔁", "literal": "🔂", "stack": "⚠️", "mutual": "🔀" }
+
+def function_calls(sym: BundleSymbol) -> list[tuple[str, int, Literal["tail", "stack", "literal"], bool]]:
+  """
+  Calls that a function makes to named functions.
+
+  Parameters
+  ----------
+  sym : BundleSymbol
+      The function.
+
+  Returns
+  -------
+  list[tuple[str, int, Literal["tail", "stack", "literal"], bool]]
+      (name, position, where it is, an argument is halved) for each call.
+      Where it is is tail for a call in tail position, literal for a call in
+      a function literal, else stack.
+  """
+  ast = sym.src.ast(sym.item)
+  params, body = ast.params, ast.root
+  calls: list[tuple[str, int, Literal["tail", "stack", "literal"], bool]] = []
+
+  def halves(node: typing.Any) -> bool:
+    if not isinstance(node, tuple) or not node or not isinstance(node[0], str):
+      return False
+    if node[0] == "binary" and (node[1] == "/" and node[3] == ("const", 2.0)
+        or node[1] == "*" and ("const", 0.5) in node[2:]):
+      return True
+    return any(halves(member) for member in node[1:]) \
+      or any(halves(el[1] if isinstance(el, tuple) and len(el) == 2 and not isinstance(el[1], (str, int, float))
+                        else el)
+             for member in node[1:] if isinstance(member, list) for el in member)
+
+  def walk_assigns(assigns: list, where: str, bound: frozenset[str]) -> frozenset[str]:
+    for name, value in assigns:
+      if value is not None:
+        walk(value, where, bound)
+      bound = bound | { name }
+    return bound
+
+  def walk(node: typing.Any, where: str, bound: frozenset[str]) -> None:
+    "where is tail, stack or literal.  Only tail is passed on to tail positions."
+    inner = "stack" if where == "tail" else where
+    kind = node[0]
+    if kind == "call":
+      callee, args, pos = node[1], node[2], node[3]
+      if callee[0] == "var":
+        if callee[1] not in bound:
+          calls.append((callee[1], pos, where, any(halves(arg) for _, arg in args))) # type: ignore[arg-type]
+      else:
+        walk(callee, inner, bound)
+      for _, arg in args:
+        walk(arg, inner, bound)
+    elif kind == "cond":
+      walk(node[1], inner, bound)
+      walk(node[2], where, bound)
+      walk(node[3], where, bound)
+    elif kind == "let":
+      walk(node[2], where, walk_assigns(node[1], inner, bound))
+    elif kind == "assert" or kind == "echo":
+      for _, arg in node[1]:
+        walk(arg, inner, bound)
+      if node[2] is not None:
+        walk(node[2], where, bound)
+    elif kind == "lambda":
+      walk(node[2], "literal", walk_assigns(node[1], "literal", bound))
+    elif kind == "let_elem" or kind == "for":
+      walk(node[2], inner, walk_assigns(node[1], inner, bound))
+    elif kind == "cfor":
+      loop = walk_assigns(node[1], inner, bound)
+      walk(node[2], inner, loop)
+      walk_assigns(node[3], inner, loop)
+      walk(node[4], inner, loop)
+    else:
+      for member in node[1:]:
+        if isinstance(member, tuple):
+          walk(member, inner, bound)
+        elif isinstance(member, list):
+          for el in member:
+            walk(el, inner, bound)
+
+  walk(body, "tail", walk_assigns(params, "stack", frozenset()))
+  return calls
+
+def analyse_recursion(filenames: list[str], size: int) -> list[RecursionInfo]:
+  """
+  Finds the recursive functions defined in the files.  Calls are resolved the
+  way --eval resolves them, so functions in used files are part of the call
+  graph, and cycles are its strongly connected components.
+
+  Parameters
+  ----------
+  filenames : list[str]
+      Files whose functions are reported.
+  size : int
+      Input size used to estimate the recursion depth.
+
+  Returns
+  -------
+  list[RecursionInfo]
+      One entry for each recursive function, in file order.
+  """
+  units: dict[str, BundleUnit] = {}
+  known: dict[tuple[str, int], BundleSymbol] = {}
+  roots = [load_bundle_unit(filename, units, known) for filename in filenames]
+  functions = [sym for sym in known.values() if sym.kind == "function"]
+  edges: dict[BundleSymbol, list[tuple[BundleSymbol, int, str, bool]]] = {}
+  for sym in functions:
+    edges[sym] = []
+    try:
+      calls = function_calls(sym)
+    except ScadError as e:
+      print(f"WARNING: {os.path.relpath(e.filename)}:{e.line}: {sym.name}: {e.message}", file=sys.stderr)
+      continue
+    for name, pos, where, halved in calls:
+      if name in sym.unit.symbols["value"]:
+        continue
+      callee = sym.unit.callable("function", name)
+      if callee is not None:
+        edges[sym].append((callee, pos, where, halved))
+
+  # Tarjan's strongly connected components.
+  index: dict[BundleSymbol, int] = {}
+  low: dict[BundleSymbol, int] = {}
+  stack: list[BundleSymbol] = []
+  on_stack: set[BundleSymbol] = set()
+  component: dict[BundleSymbol, list[BundleSymbol]] = {}
+
+  def connect(sym: BundleSymbol) -> None:
+    index[sym] = low[sym] = len(index)
+    stack.append(sym)
+    on_stack.add(sym)
+    for callee, *_ in edges[sym]:
+      if callee not in index:
+        connect(callee)
+        low[sym] = min(low[sym], low[callee])
+      elif callee in on_stack:
+        low[sym] = min(low[sym], index[callee])
+    if low[sym] == index[sym]:
+      members: list[BundleSymbol] = []
+      while True:
+        member = stack.pop()
+        on_stack.discard(member)
+        members.append(member)
+        if member is sym:
+          break
+      for member in members:
+        component[member] = members
+
+  old_limit = sys.getrecursionlimit()
+  sys.setrecursionlimit(max(old_limit, 4 * len(functions) + 100))
+  try:
+    for sym in functions:
+      if sym not in index:
+        connect(sym)
+  finally:
+    sys.setrecursionlimit(old_limit)
+
+  reported = { unit.filename for unit in roots }
+  result: list[RecursionInfo] = []
+  for sym in sorted(functions, key=lambda sym: (sym.src.filename, sym.slc.start)):
+    cycle = component[sym]
+    recursive = [edge for edge in edges[sym] if edge[0] in cycle]
+    if os.path.abspath(sym.src.filename) not in reported or not recursive:
+      continue
+    calls: list[RecursiveCall] = [{
+      "callee": callee.name,
+      "line": sym.src.line(pos),
+      "kind": where if where != "tail" or callee is sym else "mutual", # type: ignore[typeddict-item]
+    } for callee, pos, where, _ in recursive]
+    growing = [edge for edge, call in zip(recursive, calls) if call["kind"] in ("stack", "mutual")]
+    eliminated = not growing
+    if eliminated:
+      depth_model: Literal["none", "linear", "logarithmic"] = "none"
+      depth = 1
+    elif all(halved for *_, halved in growing):
+      depth_model = "logarithmic"
+      depth = max(1, math.ceil(math.log2(max(size, 1)))) + 1
+    else:
+      depth_model = "linear"
+      depth = size
+    result.append({
+      "file": os.path.relpath(sym.src.filename),
+      "name": sym.name,
+      "line": sym.src.line(sym.slc.start),
+      "cycle": sorted(member.name for member in cycle),
+      "eliminated": eliminated,
+      "calls": calls,
+      "depth_model": depth_model,
+      "depth": depth,
+    })
+  return result
+
+def recursion_md(infos: list[RecursionInfo], size: int) -> list[str]:
+  "A markdown table of the recursive functions with a badge for each."
+  lines = [
+    f"| | Function | Recursion | Depth for {size} |\n",
+    "| - | - | - | - |\n",
+  ]
+  for info in infos:
+    if info["eliminated"] and any(call["kind"] == "tail" for call in info["calls"]):
+      badge, text = RECURSION_BADGES["eliminated"], "tail calls eliminated"
+    elif info["eliminated"]:
+      badge, text = RECURSION_BADGES["literal"], "only in function literals"
+    elif len(info["cycle"]) > 1:
+      badge, text = RECURSION_BADGES["mutual"], "mutual with " + ", ".join(
+        f"`{name}`" for name in info["cycle"] if name != info["name"])
+    else:
+      stack_lines = sorted({ call["line"] for call in info["calls"] if call["kind"] == "stack" })
+      badge, text = RECURSION_BADGES["stack"], \
+        f"not eliminated at line{'s' if len(stack_lines) > 1 else ''} {', '.join(map(str, stack_lines))}"
+    lines.append(f"| {badge} | `{info['name']}` {info['file']}:{info['line']} | {text} | "
+      f"{info['depth']} ({info['depth_model']}) |\n")
+  return lines
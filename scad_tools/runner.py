@@ -0,0 +1,331 @@
+"""
+Test runner for --run-tests.  Finds the entry points of test suites and runs
+each in its own executor process.
+"""
+import hashlib
+import json
+import os
+import regex
+import sys
+import time
+from typing import Optional, TypedDict
+
+import scad_analysis
+from scad_analysis import (
+  DOC_SLC, DOC_S_BODY_SLC, DOC_S_ID_SLC, DOC_S_PARAM_LST, DOC_TYPE, get_items,
+  unparsed_at,
+)
+from scad_tools.evaluator import RE_LIBRARY_PATH, find_library
+
+class TestEntry(TypedDict):
+  suite : str
+  name  : str
+  call  : str
+
+class TestFailure(TypedDict):
+  filename: str
+  line    : int
+  message : str
+
+class TestResult(TypedDict):
+  suite   : str
+  name    : str
+  passed  : bool
+  failures: list[TestFailure]
+  output  : str
+  seconds : float
+  cached  : bool
+
+class TestCacheEntry(TypedDict):
+  key   : str
+  result: TestResult
+
+class TestCache(TypedDict):
+  version: int
+  entries: dict[str, TestCacheEntry]
+
+TEST_CACHE_VERSION = 1
+
+RE_CALLED_NAME = regex.compile(r"\b([a-zA-Z_]\w*+)\s*+\(")
+RE_ASSERT_FAILED = regex.compile(r"Assertion '(?s:.*?)' failed")
+RE_FL_MARKER = regex.compile(r"\s*+in file (?<file>[^,\n]++), line (?<line>\d++)")
+"What fl() appends to a message.  OpenSCAD also reports where asserts are like this."
+
+def discover_tests(filenames: list[str], allow_empty: bool = False) -> tuple[list[TestEntry], list[TestFailure]]:
+  """
+  Finds the entry points of test suites.
+
+  An entry point is a `module test_*` that can be called without arguments
+  and isn't called by another test module in the suite, or a top level call
+  of a test module that needs arguments.
+
+  Parameters
+  ----------
+  filenames : list[str]
+      Suites, or directories to look for test_*.scad suites in.  If empty,
+      the current directory is used.
+  allow_empty : bool
+      If a suite without entry points is fine.
+
+  Returns
+  -------
+  tuple[list[TestEntry], list[TestFailure]]
+      The entry points in the order they are in the suites, and why suites
+      failed without being run: suites that don't parse to the end, which
+      give no entry points, and suites without entry points unless
+      allow_empty.
+  """
+  import glob
+  suites: list[str] = []
+  for name in filenames or ["."]:
+    if os.path.isdir(name):
+      suites.extend(os.path.normpath(path) for path in sorted(glob.glob(os.path.join(name, "test_*.scad"))))
+    else:
+      suites.append(name)
+
+  entries: list[TestEntry] = []
+  problems: list[TestFailure] = []
+  for suite in suites:
+    with open(suite, "r", encoding="utf-8") as f:
+      content = f.read()
+    items = get_items(content)
+    stop = unparsed_at(content, items)
+    if stop is not None:
+      problems.append({ "filename": suite, "line": content.count("\n", 0, stop) + 1, "message": "Parse error" })
+      continue
+    suite_start = len(entries)
+
+    needs_args: dict[str, bool] = {}
+    called: set[str] = set()
+    for item in items:
+      if item[DOC_TYPE] == "module" and content[item[DOC_S_ID_SLC]].startswith("test_"):
+        name = content[item[DOC_S_ID_SLC]]
+        needs_args[name] = any(default == "" for _, default in item[DOC_S_PARAM_LST] or [])
+        called.update(m[1] for m in RE_CALLED_NAME.finditer(content, item[DOC_S_BODY_SLC].start,
+          item[DOC_S_BODY_SLC].stop) if m[1] != name)
+
+    for name, args_needed in needs_args.items():
+      if not args_needed and name not in called:
+        entries.append({ "suite": suite, "name": name, "call": f"{name}();" })
+    for item in items:
+      if item[DOC_TYPE] == "cmd":
+        call = " ".join(content[item[DOC_SLC]].split())
+        m = RE_CALLED_NAME.match(call)
+        if m and needs_args.get(m[1]):
+          entries.append({ "suite": suite, "name": call, "call": call })
+    if len(entries) == suite_start and not allow_empty:
+      problems.append({ "filename": suite, "line": 0,
+        "message": "No test entry points.  Use --allow-empty-suites if that's expected." })
+  return entries, problems
+
+def scad_dependencies(filename: str, scanned: dict[str, tuple[str, list[str]]]) -> list[tuple[str, str]]:
+  """
+  The content hashes of a file and of the files it uses or includes,
+  transitively.
+
+  Parameters
+  ----------
+  filename : str
+      File to start at.
+  scanned : dict[str, tuple[str, list[str]]]
+      Path -> (hash, paths used or included) of files already scanned.  Files
+      scanned here are added.
+
+  Returns
+  -------
+  list[tuple[str, str]]
+      Sorted (path relative to filename's directory, hash) pairs.
+  """
+  base_dir = os.path.dirname(os.path.abspath(filename))
+  hashes: dict[str, str] = {}
+  pending = [os.path.abspath(filename)]
+  while pending:
+    path = pending.pop()
+    if path in hashes:
+      continue
+    if path not in scanned:
+      with open(path, "r", encoding="utf-8") as f:
+        content = f.read()
+      used: list[str] = []
+      for item in get_items(content):
+        if item[DOC_TYPE] in ("use", "include"):
+          m = RE_LIBRARY_PATH.search(content, item[DOC_SLC].start, item[DOC_SLC].stop)
+          found = find_library(m[1], os.path.dirname(path)) if m else None
+          if found:
+            used.append(found)
+      scanned[path] = (hashlib.sha256(content.encode("utf-8")).hexdigest(), used)
+    hashes[path], used = scanned[path]
+    pending.extend(used)
+  return sorted((os.path.relpath(path, base_dir), h) for path, h in hashes.items())
+
+def executor_command(executor: str, scad: str, out: str) -> list[str]:
+  """
+  The command line to run a driver file.  `builtin` runs this script's --eval.
+  Otherwise {scad} and {out} in executor are replaced by the driver file and a
+  file it may write output to.  If there is no {scad}, the driver file is
+  appended.
+  """
+  import shlex
+  if executor == "builtin":
+    return [sys.executable, os.path.abspath(scad_analysis.__file__), "--eval", scad]
+  parts = shlex.split(executor, posix=os.name != "nt")
+  if not any("{scad}" in part for part in parts):
+    parts.append("{scad}")
+  return [part.replace("{scad}", scad).replace("{out}", out) for part in parts]
+
+def parse_test_failures(output: str, suite_dir: str) -> list[TestFailure]:
+  """
+  Gets the failed asserts from the output of an executor.  The location is
+  the first fl() marker after the assert, which is the one in the message if
+  there is one.
+  """
+  failures: list[TestFailure] = []
+  starts = [m.start() for m in RE_ASSERT_FAILED.finditer(output)]
+  for start, end in zip(starts, starts[1:] + [len(output)]):
+    marker = RE_FL_MARKER.search(output, start, end)
+    stop = marker.start() if marker else output.find("\n", start, end) % (end + 1)
+    filename, line = "", 0
+    if marker:
+      filename, line = marker["file"], int(marker["line"])
+      if not os.path.isabs(filename) and os.path.isfile(os.path.join(suite_dir, filename)):
+        filename = os.path.relpath(os.path.join(suite_dir, filename))
+    failures.append({
+      "filename": filename,
+      "line"    : line,
+      "message" : " ".join(output[start:stop].split()),
+    })
+  return failures
+
+def run_test_entry(entry: TestEntry, executor: str, timeout: Optional[float], work_dir: str,
+    index: int) -> TestResult:
+  "Runs an entry point in its own executor process."
+  import subprocess
+  scad = os.path.join(work_dir, f"driver_{index}.scad")
+  out = os.path.join(work_dir, f"driver_{index}.echo")
+  suite = os.path.abspath(entry["suite"])
+  with open(scad, "w", encoding="utf-8") as f:
+    f.write(f"use <{suite.replace(os.sep, '/')}>\n{entry['call']}\n")
+
+  start = time.perf_counter()
+  returncode: Optional[int] = None
+  try:
+    proc = subprocess.run(executor_command(executor, scad, out), capture_output=True, text=True,
+      encoding="utf-8", errors="replace", timeout=timeout)
+    output = proc.stdout + proc.stderr
+    returncode = proc.returncode
+  except subprocess.TimeoutExpired:
+    output = f"Timed out after {timeout}s"
+  except OSError as e:
+    output = f"Can't run executor: {e}"
+  if os.path.isfile(out):
+    with open(out, "r", encoding="utf-8", errors="replace") as f:
+      output += f.read()
+
+  failures = parse_test_failures(output, os.path.dirname(suite))
+  if not failures and returncode != 0:
+    failures.append({ "filename": entry["suite"], "line": 0,
+      "message": output.strip().splitlines()[-1] if output.strip() else f"Exited with {returncode}" })
+  return {
+    "suite"   : entry["suite"],
+    "name"    : entry["name"],
+    "passed"  : not failures,
+    "failures": failures,
+    "output"  : output,
+    "seconds" : time.perf_counter() - start,
+    "cached"  : False,
+  }
+
+def load_test_cache(filename: Optional[str]) -> TestCache:
+  if filename and os.path.isfile(filename):
+    try:
+      with open(filename, "r", encoding="utf-8") as f:
+        cache = json.load(f)
+      if cache.get("version") == TEST_CACHE_VERSION:
+        return cache
+    except (OSError, ValueError):
+      pass
+  return { "version": TEST_CACHE_VERSION, "entries": {} }
+
+def report_suite_problems(problems: list[TestFailure]):
+  "Prints why suites failed without being run."
+  for problem in problems:
+    print(f"FAIL {problem['filename']}: not run\n"
+      f"  {problem['filename']}:{problem['line']}: {problem['message']}")
+
+def run_tests(filenames: list[str], executor: str, jobs: Optional[int], timeout: Optional[float],
+    cache_file: Optional[str], allow_empty: bool = False, entries: Optional[list[TestEntry]] = None) -> bool:
+  """
+  Runs the test entry points of the suites in parallel, each in its own
+  executor process, and prints a line per entry and one per failure.
+
+  With a cache file, an entry isn't run again if the executor, the entry and
+  the hashes of the suite and everything it uses or includes are unchanged.
+
+  Parameters
+  ----------
+  filenames : list[str]
+      Suites, or directories of suites.
+  executor : str
+      Command to run a driver file.  See executor_command().
+  jobs : Optional[int]
+      Number of processes to run at once.  None for the number of CPUs.
+  timeout : Optional[float]
+      Seconds before an entry is stopped and failed.
+  cache_file : Optional[str]
+      Where to cache results.
+  allow_empty : bool
+      If a suite without entry points is fine.
+  entries : Optional[list[TestEntry]]
+      Entry points to run.  Default: all of those in the suites.
+
+  Returns
+  -------
+  bool
+      True if all entries passed and all suites were run.
+  """
+  import tempfile
+  from concurrent.futures import ThreadPoolExecutor
+
+  problems: list[TestFailure] = []
+  if entries is None:
+    entries, problems = discover_tests(filenames, allow_empty)
+  report_suite_problems(problems)
+  cache = load_test_cache(cache_file)
+  scanned: dict[str, tuple[str, list[str]]] = {}
+  deps = { suite: scad_dependencies(suite, scanned) for suite in dict.fromkeys(e["suite"] for e in entries) }
+
+  keys: list[str] = []
+  results: list[Optional[TestResult]] = []
+  for entry in entries:
+    key = hashlib.sha256(json.dumps([executor, entry["call"], deps[entry["suite"]]]).encode("utf-8")).hexdigest()
+    cached = cache["entries"].get(f"{entry['suite']}::{entry['name']}")
+    keys.append(key)
+    results.append({ **cached["result"], "cached": True } if cached and cached["key"] == key else None)
+
+  with tempfile.TemporaryDirectory() as work_dir, ThreadPoolExecutor(jobs) as pool:
+    # Threads only wait on the executor processes, which do the work.
+    futures = { i: pool.submit(run_test_entry, entry, executor, timeout, work_dir, i)
+      for i, entry in enumerate(entries) if results[i] is None }
+    for i, future in futures.items():
+      results[i] = future.result()
+
+  failed = cached_count = 0
+  for entry, key, result in zip(entries, keys, results):
+    assert result is not None
+    if result["cached"]:
+      cached_count += 1
+    elif cache_file and "Timed out after" not in result["output"] and "Can't run executor" not in result["output"]:
+      cache["entries"][f"{entry['suite']}::{entry['name']}"] = { "key": key, "result": result }
+    if not result["passed"]:
+      failed += 1
+    print(f"{'ok  ' if result['passed'] else 'FAIL'} {entry['suite']}: {entry['name']} "
+      f"{result['seconds']:.3f}s{' (cached)' if result['cached'] else ''}")
+    for failure in result["failures"]:
+      print(f"  {failure['filename']}:{failure['line']}: {failure['message']}")
+
+  if cache_file:
+    with open(cache_file, "w", encoding="utf-8") as f:
+      json.dump(cache, f, indent=2)
+  print(f"{len(entries)} entries, {failed} failed, {cached_count} cached"
+    + (f", {len(problems)} suites not run" if problems else ""))
+  return failed == 0 and not problems
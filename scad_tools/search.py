@@ -0,0 +1,161 @@
+"""
+Trigram index over symbol, type and parameter names, for --search and
+--write-search-index.
+"""
+import json
+import sys
+import time
+from typing import Literal, Optional, TypeAlias, TypedDict
+
+from scad_analysis import (
+  DOC_S_PARAM_LST, Doc, LibDbKind, Symbols, is_sym_with_doc, register_files,
+)
+
+SearchKind: TypeAlias = Literal["type", "function", "module", "value", "param"]
+
+class SearchMatch(TypedDict):
+  score: float
+  "4 for an exact name, 3 for a prefix, 2 for a substring, else the share of trigrams"
+  kind : SearchKind
+  name : str
+  file : str
+  owner: str
+  "the symbol a param belongs to, else \"\""
+
+class SearchIndex:
+  """
+  A trigram index over symbol ids, type ids and parameter names.
+
+  Each name, lowercased and wrapped in `^` and `$`, is split into its
+  trigrams, and each trigram maps to the entries that contain it.  A search
+  only looks at the entries sharing a trigram with the fragment, so it stays
+  well under a millisecond for a whole library.
+  """
+  VERSION = "scad-search-1"
+
+  def __init__(self, entries: list[tuple[SearchKind, str, str, str]]) -> None:
+    self.entries = entries
+    "(kind, name, file, owner)"
+    self.grams: dict[str, list[int]] = {}
+    for i, entry in enumerate(entries):
+      for gram in SearchIndex.trigrams(f"^{entry[1].lower()}$"):
+        self.grams.setdefault(gram, []).append(i)
+
+  @staticmethod
+  def trigrams(text: str) -> set[str]:
+    return { text[i : i + 3] for i in range(len(text) - 2) }
+
+  @staticmethod
+  def from_symbols(symbols: Symbols) -> "SearchIndex":
+    "Index the symbols registered in symbols and those in its --lib-db."
+    entries: list[tuple[SearchKind, str, str, str]] = []
+    kinds: tuple[tuple[LibDbKind, dict[str, Doc]], ...] = (("type", symbols.type_dict),
+      ("function", symbols.function_dict), ("module", symbols.module_dict), ("value", symbols.value_dict))
+    for kind, docs in kinds:
+      for name, doc in dict.items(docs):
+        entries.append((kind, name, doc.filename, ""))
+        if is_sym_with_doc(doc.doc_item):
+          for param, _ in doc.doc_item[DOC_S_PARAM_LST] or []:
+            entries.append(("param", param, doc.filename, name))
+    if symbols.lib_db is not None:
+      for kind, docs in kinds:
+        for name in symbols.lib_db.offsets[kind].keys() - dict.keys(docs):
+          record = symbols.lib_db.record(kind, name)
+          assert record
+          entries.append((kind, name, record["file"], ""))
+          for param, _ in record["params"] or []:
+            entries.append(("param", param, record["file"], name))
+    return SearchIndex(entries)
+
+  def search(self, fragment: str, limit: int = 20) -> list[SearchMatch]:
+    """
+    The entries best matching fragment, best first.  Exact ids come first,
+    then ids starting with it, then ids containing it and last, ids sharing
+    at least half of its trigrams, to allow for typos.  Names are compared
+    without case, and ties go to symbols over params and to shorter names.
+    """
+    query = fragment.lower()
+    query_grams = SearchIndex.trigrams(query)
+    shared: dict[int, int] = {}
+    if query_grams:
+      for gram in query_grams:
+        for i in self.grams.get(gram, ()):
+          shared[i] = shared.get(i, 0) + 1
+    else:
+      # Too short for a trigram
+      shared = { i: 0 for i, entry in enumerate(self.entries) if query in entry[1].lower() }
+
+    ranked: list[tuple[float, int, int, str, int]] = []
+    for i, count in shared.items():
+      kind, name, _, _ = self.entries[i]
+      lower = name.lower()
+      if lower == query:
+        tier = 3
+      elif lower.startswith(query):
+        tier = 2
+      elif query in lower:
+        tier = 1
+      elif count * 2 >= len(query_grams):
+        tier = 0
+      else:
+        continue
+      score = tier + (count / len(query_grams) if query_grams else 1.0)
+      ranked.append((-score, kind == "param", len(name), name, i))
+    ranked.sort()
+
+    matches: list[SearchMatch] = []
+    for neg_score, _, _, _, i in ranked[:limit]:
+      kind, name, file, owner = self.entries[i]
+      matches.append({ "score": round(-neg_score, 3), "kind": kind, "name": name, "file": file, "owner": owner })
+    return matches
+
+  def write(self, filename: str):
+    with open(filename, "w", encoding="utf-8") as f_out:
+      json.dump({ "version": SearchIndex.VERSION, "entries": self.entries, "grams": self.grams },
+        f_out, separators=(",", ":"))
+
+  @staticmethod
+  def load(filename: str) -> "SearchIndex":
+    "Raises OSError or ValueError if filename isn't a --write-search-index index."
+    with open(filename, "r", encoding="utf-8") as f_in:
+      data = json.load(f_in)
+    if not isinstance(data, dict) or data.get("version") != SearchIndex.VERSION:
+      raise ValueError(f"{filename} isn't a --write-search-index index")
+    index = SearchIndex.__new__(SearchIndex)
+    index.entries = [ tuple(entry) for entry in data["entries"] ] # type: ignore[misc]
+    index.grams = data["grams"]
+    return index
+
+def run_search(filenames: list[str], fragment: Optional[str], limit: int, as_json: bool,
+    index_file: Optional[str], write_index_file: Optional[str], symbols: Symbols) -> bool:
+  """
+  Searches the index loaded from index_file, or one built from the files and
+  the --lib-db of symbols, for fragment, and writes the index to
+  write_index_file.  The files are registered in symbols.
+  """
+  if index_file is not None and not filenames:
+    try:
+      index = SearchIndex.load(index_file)
+    except (OSError, ValueError) as e:
+      print(f"ERROR: --search-index: {e}", file=sys.stderr)
+      return False
+  else:
+    register_files(filenames)
+    index = SearchIndex.from_symbols(symbols)
+
+  if write_index_file is not None:
+    index.write(write_index_file)
+    print(f"Wrote {len(index.entries)} names to {write_index_file}", file=sys.stderr)
+
+  if fragment is not None:
+    start = time.perf_counter()
+    matches = index.search(fragment, limit)
+    elapsed = time.perf_counter() - start
+    if as_json:
+      print(json.dumps(matches, indent=2))
+    else:
+      for match in matches:
+        owner = f" of {match['owner']}" if match["owner"] else ""
+        print(f"{match['score']:5.2f}  {match['kind']:<8} {match['name']}{owner}  ({match['file']})")
+      print(f"{len(matches)} matches in {elapsed * 1000:.3f} ms", file=sys.stderr)
+  return True
@@ -0,0 +1,202 @@
+"""
+Per-symbol API history from git, for --timeline.
+"""
+import json
+import os
+import sys
+import time
+from typing import Literal, Optional, TypedDict
+
+from scad_analysis import (
+  DOC_S_ID_SLC, DOC_S_SIG_SLC, fingerprint, get_items, mtime_to_utc, normalize_code,
+  unparsed_at,
+)
+
+class TimelineEvent(TypedDict):
+  commit   : str
+  date     : str
+  "author date, in UTC"
+  event    : Literal["added", "changed-signature", "removed"]
+  file     : str
+  signature: str
+  "the signature after the event, or before it was removed"
+
+class GitObjects:
+  """
+  Reads objects through one long-running `git cat-file --batch`, so that a
+  whole history costs one process rather than one per commit or file.
+  """
+  def __init__(self, repo: str) -> None:
+    import subprocess
+    self.proc = subprocess.Popen(["git", "-C", repo, "cat-file", "--batch"],
+      stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    self.reads = 0
+
+  def read(self, sha: str) -> tuple[str, bytes]:
+    "The type and content of object sha."
+    assert self.proc.stdin and self.proc.stdout
+    self.proc.stdin.write(sha.encode("ascii") + b"\n")
+    self.proc.stdin.flush()
+    header = self.proc.stdout.readline().split()
+    assert len(header) == 3, f"git cat-file: can't read {sha}: {b' '.join(header).decode()}"
+    data = self.proc.stdout.read(int(header[2]) + 1)
+    self.reads += 1
+    return header[1].decode("ascii"), data[:-1]
+
+  def close(self):
+    assert self.proc.stdin
+    self.proc.stdin.close()
+    self.proc.wait()
+
+def is_library_path(path: str) -> bool:
+  """
+  .scad files are followed unless files are named.  Extensionless libraries
+  can't be told from files like LICENSE, so they're only followed when named.
+  """
+  return path.endswith(".scad")
+
+def run_timeline(rev_range: str, paths: list[str], regex_timeout: Optional[float]) -> bool:
+  """
+  Prints when each symbol was added, changed its signature and was removed,
+  over the commits of rev_range, oldest first, as json.  Only the first parent
+  line is followed, so a merge is compared with its first parent.
+
+  Commits, trees and files are read through one `git cat-file --batch`.
+  Trees are listed and files are parsed once per object hash, so the files
+  that a commit doesn't change cost nothing.
+
+  Parameters
+  ----------
+  rev_range : str
+      Anything `git rev-list` accepts, like `v1.0..HEAD`.
+  paths : list[str]
+      Library files to follow.  Default: all .scad files.
+  regex_timeout : Optional[float]
+      Per item regex timeout for parsing the files, or None for no guard.
+  """
+  import subprocess
+  start = time.perf_counter()
+  try:
+    top = subprocess.run(["git", "rev-parse", "--show-toplevel"],
+      capture_output=True, text=True, check=True).stdout.strip()
+    commits = subprocess.run(["git", "rev-list", "--reverse", "--first-parent", rev_range, "--"],
+      capture_output=True, text=True, check=True).stdout.split()
+  except subprocess.CalledProcessError as e:
+    print(f"ERROR: {' '.join(e.cmd)}: {e.stderr.strip()}", file=sys.stderr)
+    return False
+  follow = { os.path.relpath(os.path.abspath(path), top).replace(os.sep, "/") for path in paths }
+
+  objects = GitObjects(top)
+  trees: dict[bytes, dict[str, str]] = {}
+  "tree hash -> file path relative to the tree -> blob hash"
+  parsed: dict[str, Optional[dict[str, tuple[str, str]]]] = {}
+  "blob hash -> symbol id -> (signature fingerprint, signature), or None if it doesn't parse"
+
+  def tree_files(sha: bytes) -> dict[str, str]:
+    files = trees.get(sha)
+    if files is None:
+      files = {}
+      kind, data = objects.read(sha.hex())
+      assert kind == "tree"
+      pos = 0
+      while pos < len(data):
+        name_end = data.index(b"\0", pos)
+        mode, name = data[pos:name_end].decode("utf-8", "surrogateescape").split(" ", 1)
+        entry_sha = data[name_end + 1 : name_end + 21]
+        pos = name_end + 21
+        if name.startswith("."):
+          continue
+        if mode == "40000":
+          for path, blob in tree_files(entry_sha).items():
+            files[f"{name}/{path}"] = blob
+        elif mode in ("100644", "100755"):
+          files[name] = entry_sha.hex()
+      trees[sha] = files
+    return files
+
+  def blob_symbols(sha: str, path: str) -> Optional[dict[str, tuple[str, str]]]:
+    if sha in parsed:
+      return parsed[sha]
+    found: Optional[dict[str, tuple[str, str]]] = None
+    try:
+      content = objects.read(sha)[1].decode("utf-8")
+      items = get_items(content, regex_timeout, path, listing=True)
+      stop = unparsed_at(content, items)
+      if stop is not None:
+        print(f"WARNING: {path} at blob {sha[:10]}: not analysed: Parse error at line "
+          f"{content.count(chr(10), 0, stop) + 1}", file=sys.stderr)
+      else:
+        found = {}
+    except Exception as e:
+      print(f"WARNING: {path} at blob {sha[:10]}: not analysed: {type(e).__name__}: {e}", file=sys.stderr)
+    if found is not None:
+      for item in items:
+        if len(item) > 2:
+          sig = content[item[DOC_S_SIG_SLC]]
+          prefix = "f-" if sig.startswith("function ") else "m-" if sig.startswith("module ") else "v-"
+          found[prefix + content[item[DOC_S_ID_SLC]]] = (fingerprint(normalize_code(sig)), sig)
+    parsed[sha] = found
+    return found
+
+  def commit_header(sha: str) -> list[str]:
+    kind, data = objects.read(sha)
+    assert kind == "commit"
+    return data.split(b"\n\n", 1)[0].decode("utf-8", "replace").split("\n")
+
+  def tree_state(root: bytes, previous: dict[str, tuple[str, str, str]]) -> dict[str, tuple[str, str, str]]:
+    """
+    symbol id -> (file, signature fingerprint, signature).  A file that doesn't
+    parse keeps its symbols in previous, rather than losing those after the
+    error until it's fixed.
+    """
+    state: dict[str, tuple[str, str, str]] = {}
+    for path, blob in sorted(tree_files(root).items()):
+      if path not in follow if follow else not is_library_path(path):
+        continue
+      found = blob_symbols(blob, path)
+      if found is None:
+        state.update((id, info) for id, info in previous.items() if info[0] == path)
+        continue
+      for id, (sig_print, sig) in found.items():
+        state[id] = (path, sig_print, sig)
+    return state
+
+  timeline: dict[str, list[TimelineEvent]] = {}
+  current: dict[str, tuple[str, str, str]] = {}
+  prev_root = None
+  if commits:
+    # Symbols that were there before the range aren't added by it.
+    parent = next((line[7:] for line in commit_header(commits[0]) if line.startswith("parent ")), None)
+    if parent is not None:
+      prev_root = bytes.fromhex(commit_header(parent)[0].split(" ", 1)[1])
+      current = tree_state(prev_root, {})
+
+  for commit in commits:
+    header = commit_header(commit)
+    root = bytes.fromhex(header[0].split(" ", 1)[1])
+    if root == prev_root:
+      continue
+    prev_root = root
+    author = next(line for line in header if line.startswith("author "))
+    date = mtime_to_utc(float(author.rsplit(" ", 2)[1]))
+
+    state = tree_state(root, current)
+
+    for id in sorted(state.keys() | current.keys()):
+      if id not in current:
+        kind, info = "added", state[id]
+      elif id not in state:
+        kind, info = "removed", current[id]
+      elif state[id][1] != current[id][1]:
+        kind, info = "changed-signature", state[id]
+      else:
+        continue
+      timeline.setdefault(id, []).append(
+        { "commit": commit[:12], "date": date, "event": kind, "file": info[0], "signature": info[2] }) # type: ignore[typeddict-item]
+    current = state
+  objects.close()
+
+  print(json.dumps({ "commits": len(commits), "symbols": dict(sorted(timeline.items())) }, indent=2))
+  print(f"Analysed {len(commits)} commits in {time.perf_counter() - start:.2f} s: "
+    f"{len(trees)} trees and {len(parsed)} files read through {objects.reads} object reads.", file=sys.stderr)
+  return True
@@ -0,0 +1,34 @@
+"""
+Runs scad-analysis.py on files written to a temporary directory.
+"""
+import os
+import subprocess
+import sys
+import tempfile
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scad-analysis.py")
+
+class ScadDir:
+  "A temporary directory of OpenSCAD files to run the script in."
+  def __init__(self, files: dict[str, str]) -> None:
+    self.tmp = tempfile.TemporaryDirectory()
+    self.path = self.tmp.name
+    for name, content in files.items():
+      self.write(name, content)
+
+  def write(self, name: str, content: str) -> None:
+    with open(os.path.join(self.path, name), "w", encoding="utf-8") as f_out:
+      f_out.write(content)
+
+  def run(self, *argv: str, stdin: str = "") -> subprocess.CompletedProcess[str]:
+    "Runs the script with argv in the directory."
+    return subprocess.run([sys.executable, SCRIPT, *argv], cwd=self.path, input=stdin,
+      capture_output=True, text=True, encoding="utf-8")
+
+  def echoes(self, filename: str) -> list[str]:
+    "The ECHO lines of running the file with --eval, which go to stderr like OpenSCAD's."
+    result = self.run("--eval", filename)
+    return [line for line in result.stderr.splitlines() if line.startswith("ECHO:")]
+
+  def close(self) -> None:
+    self.tmp.cleanup()
@@ -0,0 +1,47 @@
+"""
+--bundle: a bundle evaluates like the design it was made from.
+"""
+import unittest
+
+from scad_cli import ScadDir
+
+class BundleTest(unittest.TestCase):
+  def assert_bundle_evaluates_alike(self, files: dict[str, str], design: str) -> str:
+    scad_dir = ScadDir(files)
+    self.addCleanup(scad_dir.close)
+    result = scad_dir.run("--bundle", "bundle.scad", design)
+    self.assertEqual(result.returncode, 0, result.stderr)
+    expected = scad_dir.echoes(design)
+    self.assertTrue(expected)
+    self.assertEqual(scad_dir.echoes("bundle.scad"), expected)
+    with open(f"{scad_dir.path}/bundle.scad", encoding="utf-8") as f_in:
+      return f_in.read()
+
+  def test_renamed_value_passed_as_argument(self) -> None:
+    bundle = self.assert_bundle_evaluates_alike({
+      "lib": "K = 5;\n"
+             "function g(a, b) = a + b;\n"
+             "function f(x) = g(K, x);\n"
+             "function h(x) = g(x, K);\n",
+      "design.scad": "use <lib>\nK = 1;\necho(f(2), h(2));\n",
+    }, "design.scad")
+    self.assertIn("function f(x) = g(K_lib, x);", bundle)
+    self.assertIn("function h(x) = g(x, K_lib);", bundle)
+
+  def test_locally_bound_names_keep_their_binders(self) -> None:
+    self.assert_bundle_evaluates_alike({
+      "lib": "K = 5;\n"
+             "function param(K) = K + 1;\n"
+             "function let_bound(x) = let(K = x) K * 10 + K;\n"
+             "function literal(x) = (function (K) K * 2)(x) + K;\n"
+             "function comprehension(n) = [for (K = [1 : n]) K, K];\n"
+             "function default_arg(x = K) = x;\n"
+             "module shown(x) { K = x * 3; echo(K); }\n",
+      "design.scad": "use <lib>\n"
+                     "K = 1;\n"
+                     "echo(param(2), let_bound(2), literal(2), comprehension(2), default_arg());\n"
+                     "shown(2);\n",
+    }, "design.scad")
+
+if __name__ == "__main__":
+  unittest.main()
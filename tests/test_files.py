@@ -0,0 +1,34 @@
+"""
+scad_tools.files.write_if_changed().
+"""
+import os
+import stat
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scad_tools.files import write_if_changed
+
+class WriteIfChangedTest(unittest.TestCase):
+  def setUp(self) -> None:
+    tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp.cleanup)
+    self.path = os.path.join(tmp.name, "out.txt")
+
+  def test_writes_only_changes(self) -> None:
+    self.assertTrue(write_if_changed(self.path, "a\n"))
+    self.assertFalse(write_if_changed(self.path, "a\n"))
+    self.assertTrue(write_if_changed(self.path, "b\n"))
+    with open(self.path, encoding="utf-8") as f_in:
+      self.assertEqual(f_in.read(), "b\n")
+    self.assertEqual(os.listdir(os.path.dirname(self.path)), ["out.txt"])
+
+  def test_keeps_mode(self) -> None:
+    write_if_changed(self.path, "a\n")
+    os.chmod(self.path, 0o751)
+    write_if_changed(self.path, "b\n")
+    self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o751)
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,48 @@
+"""
+--impact: the test entry points that can observe a change.
+"""
+import subprocess
+import unittest
+
+from scad_cli import ScadDir
+
+LIB = (
+  "K = 5;\n"
+  "function g(a, b) = a + b;\n"
+  "function first(x) = g(K, x);\n"
+  "function last(x) = g(x, K);\n"
+  "function shadowed(K) = g(K, 1);\n"
+  "module shown(x) { echo(g(x, K)); }\n"
+)
+SUITE = (
+  "use <lib>\n"
+  "include <consts>\n"
+  "module test_first() { echo(first(2)); }\n"
+  "module test_last() { echo(last(2)); }\n"
+  "module test_shadowed() { echo(shadowed(2)); }\n"
+  "module test_shown() { shown(2); }\n"
+  "module test_consts() { echo(C); }\n"
+)
+
+class ImpactTest(unittest.TestCase):
+  def setUp(self) -> None:
+    self.scad_dir = ScadDir({ "lib": LIB, "consts": "C = 1;\n", "test_lib.scad": SUITE })
+    self.addCleanup(self.scad_dir.close)
+    for argv in (["init", "-q"], ["add", "-A"], ["-c", "user.name=t", "-c", "user.email=t@t", "commit", "-qm", "t"]):
+      subprocess.run(["git", *argv], cwd=self.scad_dir.path, check=True, capture_output=True)
+
+  def impacted(self) -> list[str]:
+    result = self.scad_dir.run("--impact", "HEAD", "test_lib.scad")
+    self.assertEqual(result.returncode, 0, result.stderr)
+    return [line.split(": ")[1] for line in result.stdout.splitlines()]
+
+  def test_value_used_as_call_argument(self) -> None:
+    self.scad_dir.write("lib", LIB.replace("K = 5;", "K = 6;"))
+    self.assertEqual(self.impacted(), ["test_first", "test_last", "test_shown"])
+
+  def test_deleted_library(self) -> None:
+    subprocess.run(["git", "rm", "-q", "consts"], cwd=self.scad_dir.path, check=True)
+    self.assertIn("test_consts", self.impacted())
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,75 @@
+"""
+The markdown events of --md-events and scad_tools.markdown.
+"""
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scad_cli import ScadDir
+from scad_tools.markdown import github_heading_anchor
+
+LIB = """\
+/**
+ * ## {name}
+ *
+ * See [{other}](#file-{other}).
+ *
+ * ### Usage
+ *
+ * Nothing.
+ */
+
+/**
+ * @typedef {{number}} {type}
+ */
+
+/**
+ * Scales.
+ *
+ * @param {{{type}}} x
+ * @returns {{number}}
+ */
+function {name}_scale(x) = 2 * x;
+"""
+
+class HeadingAnchorTest(unittest.TestCase):
+  def test_github_anchor(self) -> None:
+    self.assertEqual(github_heading_anchor("**Bold** `code` : *it*!"), "bold-code--it")
+
+class MdEventsTest(unittest.TestCase):
+  def setUp(self) -> None:
+    self.dir = ScadDir({
+      "a.scad": LIB.format(name="a", other="b", type="Len"),
+      "b.scad": LIB.format(name="b", other="a", type="Size"),
+    })
+    self.addCleanup(self.dir.close)
+
+  def check_offsets(self, text: str, events: list[dict]) -> None:
+    starts = { 2: "<hr/>\n\n## ", 3: "### ", 4: "#### " }
+    self.assertEqual(sum(e["level"] == 2 for e in events), 2)
+    for event in events:
+      at = text[event["offset"]:]
+      if event["kind"] == "heading":
+        self.assertTrue(at.startswith(starts[event["level"]]), (event, at[:20]))
+      else:
+        self.assertTrue(at.startswith(("[", 'href="')), (event, at[:20]))
+
+  def read_events(self) -> list[dict]:
+    with open(os.path.join(self.dir.path, "ev.json"), encoding="utf-8") as f_in:
+      return json.load(f_in)
+
+  def test_offsets_in_stdout(self) -> None:
+    result = self.dir.run("--show", "md", "--md-events", "ev.json", "a.scad", "b.scad")
+    self.assertEqual(result.returncode, 0, result.stderr)
+    self.check_offsets(result.stdout, self.read_events())
+
+  def test_offsets_in_out_file(self) -> None:
+    result = self.dir.run("--show", "md", "--md-events", "ev.json", "--write-to-file", "out.md", "a.scad", "b.scad")
+    self.assertEqual(result.returncode, 0, result.stderr)
+    with open(os.path.join(self.dir.path, "out.md"), encoding="utf-8") as f_in:
+      self.check_offsets(f_in.read(), self.read_events())
+
+if __name__ == "__main__":
+  unittest.main()
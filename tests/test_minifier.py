@@ -0,0 +1,45 @@
+"""
+--minify and --unminify: references from minified files translate back to
+their source lines.
+"""
+import unittest
+
+from scad_cli import ScadDir
+
+SOURCE = (
+  "/**\n"
+  " * Like helpers' fl().\n"
+  " */\n"
+  "function fl(f, l) = str(\" in file \", f, \", line \", l, \"\\n\");\n"
+  "_fl = function(l) fl(\"t.scad\", l);\n"
+  "\n"
+  "// A comment.\n"
+  "echo(str(\"here\", _fl(8)));\n"
+  "echo(str(\"there\", fl(\"t.scad\", 9)));\n"
+  "echo(str(\"elsewhere\", fl(\"other.scad\", 3)));\n"
+)
+
+class MinifyTest(unittest.TestCase):
+  def setUp(self) -> None:
+    self.scad_dir = ScadDir({ "t.scad": SOURCE })
+    self.addCleanup(self.scad_dir.close)
+    self.assertEqual(self.scad_dir.run("--minify", "min", "t.scad").returncode, 0)
+
+  def unminify(self, text: str) -> str:
+    return self.scad_dir.run("--unminify", "min", stdin=text).stdout
+
+  def test_fl_references_translate_back(self) -> None:
+    echoes = "\n".join(self.scad_dir.echoes("min/t.scad"))
+    self.assertNotIn("line 8", echoes)
+    self.assertEqual(self.unminify(echoes).splitlines(), [
+      'ECHO: "here in file t.scad, line 8\\n"',
+      'ECHO: "there in file t.scad, line 9\\n"',
+      'ECHO: "elsewhere in file other.scad, line 3\\n"',
+    ])
+
+  def test_openscad_references_translate_back(self) -> None:
+    self.assertEqual(self.unminify("ERROR: in file min/t.scad, line 4\nmin/t.scad:3\n"),
+      "ERROR: in file t.scad, line 9\nt.scad:8\n")
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,41 @@
+"""
+--run-tests: only entries that ran to the end are cached.
+"""
+import os
+import shlex
+import sys
+import unittest
+
+from scad_cli import ScadDir
+
+SUITE = "use <test>\nmodule test_a() { echo(1); }\n"
+
+class RunnerCacheTest(unittest.TestCase):
+  def setUp(self) -> None:
+    self.scad_dir = ScadDir({ "test_x.scad": SUITE })
+    self.addCleanup(self.scad_dir.close)
+    with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test"),
+        encoding="utf-8") as f_in:
+      self.scad_dir.write("test", f_in.read())
+
+  def run_tests(self, *argv: str) -> str:
+    return self.scad_dir.run("--run-tests", "--test-cache", "cache.json", *argv, "test_x.scad").stdout
+
+  def test_timeout_isnt_cached(self) -> None:
+    sleeper = f"{shlex.quote(sys.executable)} -c 'import time; time.sleep(5)' {{scad}}"
+    output = self.run_tests("--executor", sleeper, "--test-timeout", "0.5")
+    self.assertNotIn("(cached)", output)
+    self.assertIn("1 failed, 0 cached", output)
+    self.assertIn("1 failed, 0 cached", self.run_tests("--executor", sleeper, "--test-timeout", "0.5"))
+
+  def test_executor_that_cant_start_isnt_cached(self) -> None:
+    output = self.run_tests("--executor", "no-such-executor {scad}")
+    self.assertIn("Can't run executor", output)
+    self.assertIn("1 failed, 0 cached", output)
+
+  def test_completed_run_is_cached(self) -> None:
+    self.assertIn("0 failed, 0 cached", self.run_tests())
+    self.assertIn("0 failed, 1 cached", self.run_tests())
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,59 @@
+"""
+--timeline: symbol events over a history with a broken commit and a merge.
+"""
+import json
+import subprocess
+import unittest
+
+from scad_cli import ScadDir
+
+class TimelineTest(unittest.TestCase):
+  def setUp(self) -> None:
+    self.scad_dir = ScadDir({})
+    self.addCleanup(self.scad_dir.close)
+    self.git("init", "-q")
+    self.commit("start", {
+      "lib.scad": "function a() = 1;\nfunction b() = 2;\n",
+      "LICENSE": "MIT License\n",
+      "extensionless": "function z() = 1;\n",
+    })
+    self.first = self.git("rev-parse", "HEAD").strip()
+    self.commit("broken", { "lib.scad": "function a() = 1;\nx = (1;\nfunction b() = 2;\n" })
+    self.commit("fixed", { "lib.scad": "function a() = 1;\nfunction b(x) = 2;\n" })
+    self.git("checkout", "-q", "-b", "side")
+    self.commit("side", { "lib.scad": "function a() = 1;\nfunction b(x) = 2;\nfunction c() = 3;\n" })
+    self.git("checkout", "-q", "-")
+    self.commit("main", {
+      "lib.scad": "function a(y) = 1;\nfunction b(x) = 2;\n",
+      "extensionless": "function z(q) = 1;\n",
+    })
+    self.git("-c", "user.name=t", "-c", "user.email=t@t", "merge", "-q", "--no-edit", "side")
+
+  def git(self, *argv: str) -> str:
+    return subprocess.run(["git", *argv], cwd=self.scad_dir.path, check=True, capture_output=True,
+      text=True).stdout
+
+  def commit(self, message: str, files: dict[str, str]) -> None:
+    for name, content in files.items():
+      self.scad_dir.write(name, content)
+    self.git("add", "-A")
+    self.git("-c", "user.name=t", "-c", "user.email=t@t", "commit", "-qm", message)
+
+  def events(self, *paths: str) -> dict[str, list[tuple[str, str]]]:
+    result = self.scad_dir.run("--timeline", f"{self.first}..HEAD", *paths)
+    self.assertEqual(result.returncode, 0, result.stderr)
+    return { id: [(event["event"], event["signature"]) for event in events]
+      for id, events in json.loads(result.stdout)["symbols"].items() }
+
+  def test_broken_commit_and_merge(self) -> None:
+    self.assertEqual(self.events(), {
+      "f-a": [("changed-signature", "function a(y)")],
+      "f-b": [("changed-signature", "function b(x)")],
+      "f-c": [("added", "function c()")],
+    })
+
+  def test_named_extensionless_file(self) -> None:
+    self.assertEqual(self.events("extensionless"), { "f-z": [("changed-signature", "function z(q)")] })
+
+if __name__ == "__main__":
+  unittest.main()